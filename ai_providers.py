@@ -0,0 +1,225 @@
+"""
+Capa asíncrona de proveedores de IA para MedicalInterpreter
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Un único cliente HTTP con pool de conexiones vive en un event loop en segundo
+plano. Cada proveedor tiene su límite de concurrencia y cada consulta un
+presupuesto de latencia: si el modelo no responde a tiempo, el llamador usa
+la interpretación de respaldo y la consulta pendiente se cancela.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import httpx
+
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+AI_INTERPRETATION_ENABLED = os.getenv('AI_INTERPRETATION_ENABLED', 'false').lower() in ('1', 'true')
+AI_LATENCY_BUDGET_MS = int(os.getenv('AI_LATENCY_BUDGET_MS', '2500'))
+AI_REQUEST_TIMEOUT_S = float(os.getenv('AI_REQUEST_TIMEOUT_S', '10'))
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', '8'))
+AI_MAX_CONNECTIONS = int(os.getenv('AI_MAX_CONNECTIONS', '20'))
+
+# Claves obligatorias en la respuesta del modelo (mismo formato que el respaldo)
+REQUIRED_KEYS = ('summary', 'suspicious_findings', 'normal_findings', 'urgent_actions', 'follow_up', 'urgency_level')
+
+
+class ProviderError(Exception):
+    """Respuesta del proveedor inválida o con error"""
+
+
+def parse_interpretation(text):
+    """Extraer el JSON de interpretación del texto devuelto por el modelo"""
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.strip('`')
+        if text.startswith('json'):
+            text = text[4:]
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ProviderError(f'JSON inválido: {e}')
+
+    if not isinstance(data, dict) or any(key not in data for key in REQUIRED_KEYS):
+        raise ProviderError('Respuesta sin el formato requerido')
+    return data
+
+
+def error_fields(error):
+    """
+    Campos de log de un fallo de proveedor. Solo tipo y código HTTP: el texto
+    de las excepciones de httpx incluye la URL de la petición.
+    """
+    fields = {'error_type': type(error).__name__}
+    if isinstance(error, httpx.HTTPStatusError):
+        fields['status_code'] = error.response.status_code
+    return fields
+
+
+class OpenAIProvider:
+    """API de chat completions de OpenAI (o compatible, p. ej. un stub local)"""
+
+    name = 'openai'
+
+    def __init__(self, api_key, model=None, base_url=None, max_concurrency=AI_MAX_CONCURRENCY):
+        self.api_key = api_key
+        self.model = model or os.getenv('OPENAI_MODEL', 'gpt-4')
+        self.base_url = (base_url or os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')).rstrip('/')
+        self.max_concurrency = max_concurrency
+
+    async def complete(self, client, prompt):
+        response = await client.post(
+            f'{self.base_url}/chat/completions',
+            headers={'Authorization': f'Bearer {self.api_key}'},
+            json={
+                'model': self.model,
+                'messages': [{'role': 'user', 'content': prompt}],
+                'temperature': 0.2
+            }
+        )
+        response.raise_for_status()
+        return response.json()['choices'][0]['message']['content']
+
+
+class GeminiProvider:
+    """API REST generateContent de Google Gemini"""
+
+    name = 'gemini'
+
+    def __init__(self, api_key, model=None, base_url=None, max_concurrency=AI_MAX_CONCURRENCY):
+        self.api_key = api_key
+        self.model = model or os.getenv('GEMINI_MODEL', 'gemini-pro')
+        self.base_url = (base_url or os.getenv('GEMINI_BASE_URL', 'https://generativelanguage.googleapis.com/v1beta')).rstrip('/')
+        self.max_concurrency = max_concurrency
+
+    async def complete(self, client, prompt):
+        response = await client.post(
+            f'{self.base_url}/models/{self.model}:generateContent',
+            # En cabecera y no en la URL: la URL acaba en trazas y mensajes de error
+            headers={'x-goog-api-key': self.api_key},
+            json={'contents': [{'parts': [{'text': prompt}]}]}
+        )
+        response.raise_for_status()
+        return response.json()['candidates'][0]['content']['parts'][0]['text']
+
+
+class AIProviderClient:
+    """Consultas con presupuesto de latencia sobre uno o varios proveedores"""
+
+    def __init__(self, providers, latency_budget_ms=AI_LATENCY_BUDGET_MS,
+                 request_timeout=AI_REQUEST_TIMEOUT_S, max_connections=AI_MAX_CONNECTIONS):
+        self.providers = list(providers)
+        self.latency_budget = latency_budget_ms / 1000
+        self.request_timeout = request_timeout
+        self.max_connections = max_connections
+        self.stats = {'requests': 0, 'answered': 0, 'hedged': 0, 'errors': 0}
+        self._stats_lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._semaphores = {}
+        self._start_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.providers)
+
+    def _ensure_started(self):
+        """Crear el event loop, el cliente HTTP y los semáforos una sola vez"""
+        with self._start_lock:
+            if self._loop is not None:
+                return
+
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='ai-providers', daemon=True).start()
+
+            async def setup():
+                self._client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(self.request_timeout),
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections
+                    )
+                )
+                # Por instancia y no por nombre: dos proveedores 'openai' (p. ej. dos endpoints) no comparten límite
+                self._semaphores = {
+                    id(provider): asyncio.Semaphore(provider.max_concurrency)
+                    for provider in self.providers
+                }
+
+            asyncio.run_coroutine_threadsafe(setup(), loop).result()
+            self._loop = loop
+
+    async def _ask(self, prompt):
+        """Probar los proveedores en orden hasta obtener una interpretación válida"""
+        for provider in self.providers:
+            try:
+                async with self._semaphores[id(provider)]:
+                    text = await provider.complete(self._client, prompt)
+                return parse_interpretation(text)
+            except (httpx.HTTPError, ProviderError, KeyError, IndexError, ValueError) as e:
+                logger.warning('ai_provider_failed', provider=provider.name, **error_fields(e))
+        raise ProviderError('Ningún proveedor devolvió una interpretación válida')
+
+    def interpret(self, prompt, latency_budget=None):
+        """Interpretación del modelo, o None si no llega dentro del presupuesto"""
+        if not self.enabled:
+            return None
+
+        self._ensure_started()
+        self._count('requests')
+        budget = self.latency_budget if latency_budget is None else latency_budget
+        future = asyncio.run_coroutine_threadsafe(self._ask(prompt), self._loop)
+
+        try:
+            result = future.result(timeout=budget)
+        except FutureTimeoutError:
+            future.cancel()
+            self._count('hedged')
+            logger.info('ai_budget_exceeded', budget_ms=int(budget * 1000))
+            return None
+        except Exception as e:
+            self._count('errors')
+            logger.error('ai_providers_failed', **error_fields(e))
+            return None
+
+        self._count('answered')
+        return result
+
+    def status(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {
+            'providers': [provider.name for provider in self.providers],
+            'latency_budget_ms': int(self.latency_budget * 1000),
+            **stats
+        }
+
+    def close(self):
+        """Cerrar el cliente HTTP y detener el event loop"""
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+
+def build_provider_client(openai_api_key='', gemini_api_key='', enabled=AI_INTERPRETATION_ENABLED):
+    """Cliente con los proveedores configurados; vacío si la IA está desactivada"""
+    providers = []
+    if enabled:
+        if openai_api_key:
+            providers.append(OpenAIProvider(openai_api_key))
+        if gemini_api_key:
+            providers.append(GeminiProvider(gemini_api_key))
+    return AIProviderClient(providers)
@@ -0,0 +1,146 @@
+"""
+Servidor stub compatible con la API de chat completions de OpenAI
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Sirve para probar ai_providers.py sin red ni claves. El comportamiento se elige
+con el primer segmento de la ruta, de modo que un mismo servidor hace de
+varios proveedores:
+
+    http://127.0.0.1:8080/fast/v1   responde al momento
+    http://127.0.0.1:8080/slow/v1   responde tras --slow-delay segundos
+    http://127.0.0.1:8080/fail/v1   responde 500
+
+    python ai_stub_server.py --port 8080 --slow-delay 5
+    OPENAI_BASE_URL=http://127.0.0.1:8080/slow/v1 AI_INTERPRETATION_ENABLED=true python backend_medical_api.py
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODES = ('fast', 'slow', 'fail')
+
+# Interpretación con las claves que exige parse_interpretation
+STUB_INTERPRETATION = {
+    'summary': 'Interpretación de prueba del servidor stub',
+    'suspicious_findings': [],
+    'normal_findings': [],
+    'urgent_actions': [],
+    'follow_up': [],
+    'urgency_level': 'Normal'
+}
+
+
+class StubAIServer:
+    """Servidor HTTP en un hilo; cuenta peticiones y concurrencia máxima por modo"""
+
+    def __init__(self, host='127.0.0.1', port=0, slow_delay_s=1.0):
+        self.slow_delay_s = slow_delay_s
+        self.requests = {mode: 0 for mode in MODES}
+        self.in_flight = {mode: 0 for mode in MODES}
+        self.max_in_flight = {mode: 0 for mode in MODES}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def base_url(self, mode):
+        """URL base para OpenAIProvider(base_url=...)"""
+        return f'http://{self._server.server_address[0]}:{self.port}/{mode}/v1'
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='ai-stub-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _enter(self, mode):
+        with self._lock:
+            self.requests[mode] += 1
+            self.in_flight[mode] += 1
+            self.max_in_flight[mode] = max(self.max_in_flight[mode], self.in_flight[mode])
+
+    def _leave(self, mode):
+        with self._lock:
+            self.in_flight[mode] -= 1
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                mode = self.path.strip('/').split('/', 1)[0]
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if mode not in MODES:
+                    self._reply(404, {'error': f'modo desconocido: {mode}'})
+                    return
+
+                stub._enter(mode)
+                try:
+                    if mode == 'slow':
+                        time.sleep(stub.slow_delay_s)
+                    if mode == 'fail':
+                        self._reply(500, {'error': 'fallo simulado'})
+                    else:
+                        content = json.dumps(STUB_INTERPRETATION, ensure_ascii=False)
+                        self._reply(200, {'choices': [{'message': {'role': 'assistant', 'content': content}}]})
+                finally:
+                    stub._leave(mode)
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # El cliente canceló la consulta (presupuesto agotado)
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor stub de chat completions para ai_providers.py')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--slow-delay', type=float, default=5.0, help='segundos de espera del modo slow')
+    args = parser.parse_args()
+
+    server = StubAIServer(args.host, args.port, args.slow_delay)
+    print(f'Stub en {", ".join(server.base_url(mode) for mode in MODES)}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
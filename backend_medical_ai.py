@@ -4,176 +4,103 @@ Modelo pre-entrenado con millones de datos médicos
 Análisis inteligente de resultados de laboratorio
 """
 
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify
 from flask_cors import CORS
 import json
-import re
+import os
 from datetime import datetime
-import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 
-from transformers import AutoModel, AutoTokenizer
-model_name = "Drbellamy/labrador"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModel.from_pretrained(model_name)
+from fast_json import dumps, json_response, ndjson_response, read_json, wants_ndjson
+from incremental import Snapshot, SnapshotStore, findings_signature, reanalyze, row_key
+from lab_extraction import iter_lab_rows
+from lab_history import TREND_MAX_POINTS, LabHistory, observed_at_error
+from embedding_cache import EmbeddingCache
+import http_compression
+from labrador_inference import LabradorBatcher
+from labrador_model import LabradorModel
+from medical_knowledge import knowledge_store
+from pipeline_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, NOOP_TIMER, PipelineMetrics
+from range_classifier import CONCERN_LABELS, STATUS_LABELS, STATUS_NORMAL, STATUS_UNKNOWN
+from result_cache import ResultCache, make_key
+from structured_logging import configure_logging, get_logger, init_app as init_request_logging
+from name_matcher import resolve_test_code
+from triage import PRIORITY_CRITICAL, PRIORITY_ROUTINE, GateTimeout, PriorityGate, prescreen
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Logging estructurado en JSON (ver structured_logging.py)
+configure_logging()
+logger = get_logger(__name__)
 
-app = Flask(__name__)
-CORS(app)
+bp = Blueprint('medical_ai', __name__)
+
+# Análisis por lotes
+BATCH_WORKERS = int(os.getenv('MEDICAL_AI_BATCH_WORKERS', os.cpu_count() or 1))
+BATCH_MAX_DOCUMENTS = int(os.getenv('MEDICAL_AI_BATCH_MAX_DOCUMENTS', '500'))
+BATCH_POOL_THRESHOLD = int(os.getenv('MEDICAL_AI_BATCH_POOL_THRESHOLD', '4'))
+
+IMPORTANT_NOTE = "Esta interpretación es generada por un sistema de IA médica avanzada con base de datos de millones de registros. Debe ser revisada por un profesional médico. Los rangos de referencia pueden variar según el laboratorio y la población."
+
+# Valores analizados por bloque en modo streaming (?stream=1)
+STREAM_CHUNK_VALUES = int(os.getenv('MEDICAL_AI_STREAM_CHUNK_VALUES', '64'))
+
+# Fracción del rango normal a partir de la cual un cambio respecto al resultado anterior es relevante
+TREND_DELTA_FRACTION = float(os.getenv('TREND_DELTA_FRACTION', '0.25'))
 
 class MedicalAI:
-    def __init__(self):
+    def __init__(self, knowledge=knowledge_store):
         self.model_version = "MedicalAI-v2.1.0"
         self.training_data = "50M+ registros médicos"
         self.confidence_threshold = 0.85
         
-        # Base de conocimiento médico especializada
-        self.medical_knowledge = {
-            'reference_ranges': {
-                'GLUCOSA': {'min': 70, 'max': 100, 'unit': 'mg/dl', 'critical': {'low': 50, 'high': 200}},
-                'COLESTEROL_TOTAL': {'min': 0, 'max': 200, 'unit': 'mg/dl', 'critical': {'low': 0, 'high': 300}},
-                'HDL': {'min': 40, 'max': 100, 'unit': 'mg/dl', 'critical': {'low': 20, 'high': 100}},
-                'LDL': {'min': 0, 'max': 100, 'unit': 'mg/dl', 'critical': {'low': 0, 'high': 190}},
-                'TRIGLICERIDOS': {'min': 0, 'max': 150, 'unit': 'mg/dl', 'critical': {'low': 0, 'high': 500}},
-                'HEMOGLOBINA': {'min': 12, 'max': 16, 'unit': 'g/dl', 'critical': {'low': 8, 'high': 20}},
-                'HEMATOCRITO': {'min': 36, 'max': 48, 'unit': '%', 'critical': {'low': 25, 'high': 60}},
-                'LEUCOCITOS': {'min': 4000, 'max': 11000, 'unit': '/mm³', 'critical': {'low': 2000, 'high': 20000}},
-                'CREATININA': {'min': 0.6, 'max': 1.2, 'unit': 'mg/dl', 'critical': {'low': 0.3, 'high': 3.0}},
-                'UREA': {'min': 7, 'max': 20, 'unit': 'mg/dl', 'critical': {'low': 3, 'high': 50}},
-                'BILIRRUBINA': {'min': 0.3, 'max': 1.2, 'unit': 'mg/dl', 'critical': {'low': 0.1, 'high': 5.0}},
-                'TSH': {'min': 0.4, 'max': 4.0, 'unit': 'mUI/L', 'critical': {'low': 0.1, 'high': 10.0}},
-                'T3': {'min': 80, 'max': 200, 'unit': 'ng/dl', 'critical': {'low': 50, 'high': 300}},
-                'T4': {'min': 4.5, 'max': 12.5, 'unit': 'μg/dl', 'critical': {'low': 2.0, 'high': 20.0}},
-                'CK_MB': {'min': 0, 'max': 5, 'unit': 'ng/ml', 'critical': {'low': 0, 'high': 25}},
-                'TROPONINA': {'min': 0, 'max': 0.04, 'unit': 'ng/ml', 'critical': {'low': 0, 'high': 0.5}}
-            },
-            
-            'disease_patterns': {
-                'DIABETES': {
-                    'indicators': ['GLUCOSA'],
-                    'thresholds': {'high': 126},
-                    'symptoms': ['poliuria', 'polifagia', 'polidipsia'],
-                    'risk_factors': ['obesidad', 'historia_familiar', 'sedentario']
-                },
-                'HIPERCOLESTEROLEMIA': {
-                    'indicators': ['COLESTEROL_TOTAL', 'LDL'],
-                    'thresholds': {'total': 200, 'ldl': 100},
-                    'symptoms': ['xantomas', 'arco_corneal'],
-                    'risk_factors': ['dieta_rica_grasas', 'sedentario', 'familiar']
-                },
-                'ANEMIA': {
-                    'indicators': ['HEMOGLOBINA', 'HEMATOCRITO'],
-                    'thresholds': {'low': 12},
-                    'symptoms': ['fatiga', 'palidez', 'debilidad'],
-                    'risk_factors': ['deficiencia_hierro', 'perdida_sangre', 'mala_absorcion']
-                },
-                'INSUFICIENCIA_RENAL': {
-                    'indicators': ['CREATININA', 'UREA'],
-                    'thresholds': {'creatinina': 1.2, 'urea': 20},
-                    'symptoms': ['edema', 'hipertension', 'oliguria'],
-                    'risk_factors': ['diabetes', 'hipertension', 'edad_avanzada']
-                },
-                'HIPOTIROIDISMO': {
-                    'indicators': ['TSH', 'T3', 'T4'],
-                    'thresholds': {'tsh': 4.0, 't3': 80, 't4': 4.5},
-                    'symptoms': ['fatiga', 'aumento_peso', 'intolerancia_frio'],
-                    'risk_factors': ['autoimmune', 'yodo_deficiente', 'medicamentos']
-                },
-                'INFARTO_MIOCARDIO': {
-                    'indicators': ['CK_MB', 'TROPONINA'],
-                    'thresholds': {'ck_mb': 5, 'troponina': 0.04},
-                    'symptoms': ['dolor_pecho', 'disnea', 'nauseas'],
-                    'risk_factors': ['hipertension', 'diabetes', 'tabaquismo']
-                }
-            }
-        }
+        # Base de conocimiento médico compilada (recargable; ver medical_knowledge.KnowledgeStore)
+        self.knowledge = knowledge
+    
+    @property
+    def kb(self):
+        """Versión de la base de conocimiento fijada por la petición en curso"""
+        return self.knowledge.current()
+    
+    @property
+    def medical_knowledge(self):
+        return self.kb.medical_knowledge
+    
+    @property
+    def knowledge_version(self):
+        """Versión de la base de conocimiento: invalida la caché de resultados al cambiar rangos"""
+        return self.kb.version
     
     def extract_lab_values(self, html_content):
-        """Extraer valores de laboratorio del HTML usando NLP avanzado"""
-        values = []
-        
-        # Patrones de extracción mejorados
-        patterns = [
-            r'([A-ZÁÉÍÓÚÑ\s]+):\s*([\d.,]+)\s*(?:\(([^)]+)\))?',
-            r'([A-ZÁÉÍÓÚÑ\s]+)\s*-\s*([\d.,]+)',
-            r'([A-ZÁÉÍÓÚÑ\s]+)\s*=\s*([\d.,]+)'
-        ]
-        
-        for pattern in patterns:
-            matches = re.finditer(pattern, html_content, re.IGNORECASE)
-            for match in matches:
-                name = match.group(1).strip().upper()
-                value = float(match.group(2).replace(',', '.'))
-                range_text = match.group(3) if len(match.groups()) > 2 else ''
-                
-                if value > 0:
-                    values.append({
-                        'name': self.normalize_test_name(name),
-                        'value': value,
-                        'unit': self.extract_unit(range_text),
-                        'reference_range': range_text,
-                        'raw_text': match.group(0)
-                    })
-        
-        return values
+        """Extraer valores de las filas de texto del HTML (tablas y párrafos)"""
+        return list(self.iter_lab_values(html_content))
+    
+    def iter_lab_values(self, html_content):
+        """Igual que extract_lab_values, pero generando los valores según se leen"""
+        for item in iter_lab_rows(html_content):
+            if item.value > 0:
+                yield {
+                    'name': self.normalize_test_name(item.name.upper()),
+                    'value': item.value,
+                    'unit': self.extract_unit(item.reference_range) or self.extract_unit(item.unit),
+                    'reference_range': item.reference_range,
+                    'raw_text': item.raw_text
+                }
     
     def normalize_test_name(self, name):
         """Normalizar nombres de exámenes"""
-        normalizations = {
-            'GLUCOSA': 'GLUCOSA',
-            'GLUCOSA EN AYUNAS': 'GLUCOSA',
-            'GLUCOSA BASAL': 'GLUCOSA',
-            'COLESTEROL': 'COLESTEROL_TOTAL',
-            'COLESTEROL TOTAL': 'COLESTEROL_TOTAL',
-            'HDL': 'HDL',
-            'COLESTEROL HDL': 'HDL',
-            'LDL': 'LDL',
-            'COLESTEROL LDL': 'LDL',
-            'TRIGLICERIDOS': 'TRIGLICERIDOS',
-            'HEMOGLOBINA': 'HEMOGLOBINA',
-            'HB': 'HEMOGLOBINA',
-            'HEMATOCRITO': 'HEMATOCRITO',
-            'HTO': 'HEMATOCRITO',
-            'LEUCOCITOS': 'LEUCOCITOS',
-            'WBC': 'LEUCOCITOS',
-            'CREATININA': 'CREATININA',
-            'UREA': 'UREA',
-            'BUN': 'UREA',
-            'BILIRRUBINA': 'BILIRRUBINA',
-            'TSH': 'TSH',
-            'T3': 'T3',
-            'T4': 'T4',
-            'CK-MB': 'CK_MB',
-            'TROPONINA': 'TROPONINA'
-        }
-        
-        return normalizations.get(name, name)
+        return self.kb.normalize_test_name(name)
     
     def extract_unit(self, range_text):
         """Extraer unidad de medida"""
-        unit_patterns = {
-            'mg/dl': ['mg/dl', 'mg/dL'],
-            'g/dl': ['g/dl', 'g/dL'],
-            '%': ['%'],
-            '/mm³': ['/mm³', '/mm3'],
-            'mUI/L': ['mUI/L', 'mUI/l'],
-            'ng/ml': ['ng/ml', 'ng/mL'],
-            'μg/dl': ['μg/dl', 'μg/dL', 'mcg/dl']
-        }
-        
-        for unit, patterns in unit_patterns.items():
-            if any(pattern in range_text for pattern in patterns):
-                return unit
-        
-        return ''
+        return self.kb.extract_unit(range_text)
     
     def analyze_value(self, value, patient_info):
         """Analizar valor individual con algoritmos médicos"""
         test_name = value['name']
         test_value = value['value']
-        reference = self.medical_knowledge['reference_ranges'].get(test_name)
+        reference = self.kb.reference_ranges.get(test_name)
         
         if not reference:
             return {
@@ -207,39 +134,43 @@ class MedicalAI:
             'critical_high': reference['critical']['high']
         }
     
+    def analyze_values(self, values, patient_info):
+        """Analizar todos los valores de un informe con una clasificación vectorizada"""
+        statuses, concerns = self.kb.range_table.classify(
+            [value['name'] for value in values],
+            [value['value'] for value in values]
+        )
+        
+        analyzed_values = []
+        for value, status_code, concern_code in zip(values, statuses.tolist(), concerns.tolist()):
+            if status_code == STATUS_UNKNOWN:
+                analyzed_values.append({
+                    **value,
+                    'status': 'unknown',
+                    'significance': 'Valor no reconocido en base de datos médica',
+                    'concern_level': 'MEDIA'
+                })
+                continue
+            
+            test_name = value['name']
+            reference = self.kb.reference_ranges[test_name]
+            status = STATUS_LABELS[status_code]
+            
+            analyzed_values.append({
+                **value,
+                'status': status,
+                'concern_level': CONCERN_LABELS[concern_code],
+                'significance': self.generate_significance(test_name, status, value['value'], reference) if status_code != STATUS_NORMAL else '',
+                'reference_range': f"{reference['min']}-{reference['max']} {reference['unit']}",
+                'critical_low': reference['critical']['low'],
+                'critical_high': reference['critical']['high']
+            })
+        
+        return analyzed_values
+    
     def generate_significance(self, test_name, status, value, reference):
         """Generar explicación del significado clínico"""
-        explanations = {
-            'GLUCOSA': {
-                'bajo': 'Hipoglucemia detectada. Puede indicar diabetes mal controlada, medicamentos hipoglucemiantes, o trastornos metabólicos. Requiere evaluación endocrinológica urgente.',
-                'elevado': 'Hiperglucemia detectada. Sugiere diabetes mellitus, resistencia a la insulina, o síndrome metabólico. Requiere evaluación endocrinológica y control glucémico.'
-            },
-            'COLESTEROL_TOTAL': {
-                'elevado': 'Hipercolesterolemia detectada. Aumenta significativamente el riesgo cardiovascular. Requiere control lipídico, modificación de estilo de vida y posible tratamiento farmacológico.'
-            },
-            'HDL': {
-                'bajo': 'HDL bajo detectado. Factor de riesgo cardiovascular independiente. Requiere modificación de estilo de vida, ejercicio regular y posible tratamiento farmacológico.'
-            },
-            'LDL': {
-                'elevado': 'LDL elevado detectado. Principal factor de riesgo para aterosclerosis y eventos cardiovasculares. Requiere control estricto y tratamiento farmacológico.'
-            },
-            'HEMOGLOBINA': {
-                'bajo': 'Anemia detectada. Puede indicar deficiencia de hierro, pérdida crónica de sangre, o trastornos hematológicos. Requiere evaluación hematológica completa.',
-                'elevado': 'Policitemia posible. Puede indicar deshidratación, hipoxia crónica, o trastornos hematológicos. Requiere evaluación hematológica.'
-            },
-            'CREATININA': {
-                'elevado': 'Elevación de creatinina sugiere deterioro de la función renal. Puede indicar insuficiencia renal aguda o crónica. Requiere evaluación nefrológica urgente.'
-            },
-            'TSH': {
-                'elevado': 'TSH elevado sugiere hipotiroidismo. Requiere evaluación endocrinológica y posible tratamiento con levotiroxina.',
-                'bajo': 'TSH bajo sugiere hipertiroidismo. Requiere evaluación endocrinológica urgente.'
-            },
-            'TROPONINA': {
-                'elevado': 'Troponina elevada indica daño miocárdico. Puede indicar infarto agudo de miocardio. Requiere evaluación cardiológica URGENTE.'
-            }
-        }
-        
-        return explanations.get(test_name, {}).get(status, f'Valor {status} fuera del rango normal. Requiere evaluación médica especializada.')
+        return self.kb.significance(test_name, status)
     
     def generate_clinical_interpretation(self, analyzed_values, patient_info):
         """Generar interpretación clínica integral"""
@@ -272,12 +203,13 @@ class MedicalAI:
     def identify_possible_causes(self, abnormal_values, patient_info):
         """Identificar posibles causas basadas en patrones médicos"""
         causes = []
-        abnormal_tests = [v['name'] for v in abnormal_values]
+        # Cada nombre se resuelve a su código canónico una sola vez
+        abnormal_codes = {resolve_test_code(v['name']) or v['name'] for v in abnormal_values}
         
         # Patrones de enfermedades
-        for disease, pattern in self.medical_knowledge['disease_patterns'].items():
+        for disease, pattern in self.kb.disease_patterns.items():
             matching_indicators = [indicator for indicator in pattern['indicators'] 
-                                 if any(indicator in test for test in abnormal_tests)]
+                                 if indicator in abnormal_codes]
             
             if len(matching_indicators) >= len(pattern['indicators']) * 0.5:
                 causes.append(self.get_disease_name(disease))
@@ -295,15 +227,46 @@ class MedicalAI:
     
     def get_disease_name(self, disease):
         """Obtener nombre legible de enfermedad"""
-        names = {
-            'DIABETES': 'Diabetes mellitus',
-            'HIPERCOLESTEROLEMIA': 'Hipercolesterolemia',
-            'ANEMIA': 'Anemia',
-            'INSUFICIENCIA_RENAL': 'Insuficiencia renal',
-            'HIPOTIROIDISMO': 'Hipotiroidismo',
-            'INFARTO_MIOCARDIO': 'Infarto agudo de miocardio'
-        }
-        return names.get(disease, disease)
+        return self.kb.disease_name(disease)
+    
+    def critical_prescreen(self, values):
+        """Alerta con los valores fuera de los umbrales críticos (antes del análisis), o None"""
+        return prescreen(
+            self.kb.range_table,
+            [value['name'] for value in values],
+            [value['value'] for value in values],
+            units=[value['unit'] for value in values]
+        )
+    
+    def flag_significant_changes(self, analyzed_values, previous_values):
+        """Cambios relevantes frente al resultado anterior del mismo examen del paciente"""
+        changes = []
+        for value in analyzed_values:
+            code = resolve_test_code(value['name']) or value['name']
+            previous = previous_values.get(code)
+            reference = self.kb.reference_ranges.get(code)
+            if previous is None or reference is None:
+                continue
+            
+            previous_value, previous_observed_at, previous_status = previous
+            delta = value['value'] - previous_value
+            status_changed = previous_status != value['status']
+            
+            # Significativo: cambia de categoría o se mueve una fracción del rango normal
+            if status_changed or abs(delta) >= (reference['max'] - reference['min']) * TREND_DELTA_FRACTION:
+                changes.append({
+                    'test_name': value['name'],
+                    'previous_value': previous_value,
+                    'previous_observed_at': previous_observed_at,
+                    'current_value': value['value'],
+                    'delta': round(delta, 4),
+                    'percent_change': round(delta / previous_value * 100, 1) if previous_value else None,
+                    'direction': 'aumento' if delta > 0 else 'descenso' if delta < 0 else 'sin cambio',
+                    'previous_status': previous_status,
+                    'status': value['status']
+                })
+        
+        return changes
     
     def assess_urgency(self, analyzed_values):
         """Evaluar urgencia médica"""
@@ -392,8 +355,13 @@ class MedicalAI:
     
     def calculate_confidence(self, analyzed_values):
         """Calcular confianza del análisis"""
-        total_values = len(analyzed_values)
-        recognized_values = len([v for v in analyzed_values if v['status'] != 'unknown'])
+        return self.confidence_from_counts(
+            len(analyzed_values),
+            len([v for v in analyzed_values if v['status'] != 'unknown'])
+        )
+    
+    def confidence_from_counts(self, total_values, recognized_values):
+        """Confianza a partir del total de valores y de los reconocidos"""
         confidence_base = (recognized_values / total_values) * 100 if total_values > 0 else 0
         
         # Ajustar confianza basada en la calidad de los datos
@@ -419,11 +387,313 @@ class MedicalAI:
 # Instancia global del sistema de IA médica
 medical_ai = MedicalAI()
 
-@app.route('/api/medical-ai/analyze', methods=['POST'])
+# Caché de respuestas ya serializadas
+result_cache = ResultCache()
+
+# Instantáneas para la reinterpretación incremental (previous_result_id)
+snapshots = SnapshotStore()
+
+# Historial longitudinal por paciente (SQLite); LAB_HISTORY_DB vacío lo desactiva
+lab_history = LabHistory()
+
+# Admisión por prioridad (informes críticos primero); PRIORITY_GATE_SLOTS=0 la desactiva
+admission = PriorityGate()
+
+# Campos de los que dependen interpretación, urgencia y recomendaciones
+FINDING_FIELDS = ('name', 'status', 'concern_level')
+
+# Latencia por etapa, expuesta en /metrics
+metrics = PipelineMetrics('medical_ai')
+
+# Modelo Labrador: se carga fuera del camino de arranque, el análisis por reglas no lo necesita
+labrador = LabradorModel()
+
+# Puntuación de paneles con Labrador en micro-lotes compartidos entre peticiones;
+# los embeddings de paneles ya vistos salen de la caché (por modelo y runtime)
+labrador_scorer = LabradorBatcher(labrador, cache=EmbeddingCache(f'{labrador.model_name}:{labrador.runtime}'))
+
+def value_entry(value):
+    """Valor analizado tal como aparece en la respuesta"""
+    entry = {
+        'test_name': value['name'],
+        'value': f"{value['value']} {value['unit']}",
+        'reference_range': value['reference_range'],
+        'status': value['status']
+    }
+    if value['status'] != 'normal':
+        entry['significance'] = value['significance']
+    return entry
+
+def analyze_document(html_content, patient_info, timer=NOOP_TIMER, previous=None, snapshot_store=None,
+                     history=lab_history, gate=None, critical_fast_path=False, scorer=None, pending_history=None):
+    """
+    Ejecutar el pipeline completo sobre un documento; None si no hay valores.
+    
+    Tras la extracción se revisan los umbrales críticos: con `critical_fast_path`
+    un informe crítico se responde de inmediato solo con la alerta; si no, la
+    alerta va en data.critical_alert y el informe se admite en `gate`
+    (PriorityGate) por delante de los rutinarios.
+    
+    Con `previous` (Snapshot de incremental.py) solo se reanalizan las filas que
+    cambiaron y los agregados se reutilizan si los hallazgos son los mismos. Con
+    `snapshot_store` la respuesta incluye un result_id para la siguiente edición.
+    Si patient_info trae patient_id, el informe se guarda en `history` y se
+    señalan los cambios relevantes frente a los resultados anteriores. Sin
+    `history`, con `pending_history` (lista) se le añade (valores analizados,
+    urgencia) para que otro proceso lo registre.
+    
+    Con `scorer` (LabradorBatcher) el panel se encola para el modelo antes del
+    análisis por reglas y su puntuación va en data.model_assessment.
+    """
+    # Extraer valores de laboratorio
+    with timer.stage('extraction'):
+        lab_values = medical_ai.extract_lab_values(html_content)
+    
+    if not lab_values:
+        return None
+    
+    # Valores críticos: se detectan antes de ejecutar el resto del pipeline
+    with timer.stage('prescreen'):
+        critical_alert = medical_ai.critical_prescreen(lab_values)
+    
+    if critical_alert is not None and critical_fast_path:
+        return critical_response(critical_alert, patient_info)
+    
+    # El modelo procesa el panel en su lote mientras corre el análisis por reglas
+    panel = None
+    if scorer is not None:
+        panel = scorer.submit(
+            [value['name'] for value in lab_values],
+            [value['value'] for value in lab_values],
+            [value['unit'] for value in lab_values],
+            medical_ai.kb.reference_ranges
+        )
+    
+    priority = PRIORITY_CRITICAL if critical_alert is not None else PRIORITY_ROUTINE
+    with gate.admit(priority) if gate is not None else nullcontext():
+        response = _analyze_extracted(lab_values, patient_info, timer, previous, snapshot_store, history,
+                                      pending_history)
+    response['data']['critical_alert'] = critical_alert
+    
+    if panel is not None:
+        with timer.stage('model_scoring'):
+            response['data']['model_assessment'] = scorer.collect(panel)
+    return response
+
+def critical_response(critical_alert, patient_info):
+    """Respuesta inmediata de la vía rápida: solo la alerta crítica"""
+    return {
+        'success': True,
+        'critical_fast_path': True,
+        'critical_alert': critical_alert,
+        'patient_info': patient_info,
+        'model_used': medical_ai.model_version,
+        'knowledge_version': medical_ai.knowledge_version,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def _analyze_extracted(lab_values, patient_info, timer, previous, snapshot_store, history, pending_history=None):
+    """Análisis, agregados, historial y ensamblado a partir de los valores extraídos"""
+    if previous is not None and previous.knowledge_version != medical_ai.knowledge_version:
+        previous = None
+    
+    # Analizar todos los valores en una sola pasada (o solo los modificados)
+    with timer.stage('analysis'):
+        if previous is not None:
+            rows, analyzed_values, reanalyzed = reanalyze(
+                previous, lab_values, lambda values: medical_ai.analyze_values(values, patient_info)
+            )
+        else:
+            rows = [row_key(value) for value in lab_values]
+            analyzed_values = medical_ai.analyze_values(lab_values, patient_info)
+    
+    # Interpretación, urgencia y recomendaciones dependen solo de los hallazgos
+    signature = findings_signature(analyzed_values, FINDING_FIELDS)
+    if previous is not None and previous.signature == signature and previous.patient_info == patient_info:
+        clinical_interpretation, urgency_assessment, recommendations = previous.aggregates
+    else:
+        # Generar interpretación clínica
+        with timer.stage('interpretation'):
+            clinical_interpretation = medical_ai.generate_clinical_interpretation(analyzed_values, patient_info)
+        
+        # Evaluar urgencia
+        with timer.stage('urgency'):
+            urgency_assessment = medical_ai.assess_urgency(analyzed_values)
+        
+        # Generar recomendaciones
+        with timer.stage('recommendations'):
+            recommendations = medical_ai.generate_recommendations(analyzed_values, patient_info)
+    
+    if previous is not None:
+        logger.info('incremental_analysis', reanalyzed=reanalyzed, total=len(analyzed_values),
+                    aggregates_reused=previous.aggregates[0] is clinical_interpretation)
+    
+    with timer.stage('assembly'):
+        # Calcular confianza
+        confidence = medical_ai.calculate_confidence(analyzed_values)
+        
+        # Separar valores normales y anormales
+        normal_values = [value_entry(v) for v in analyzed_values if v['status'] == 'normal']
+        abnormal_values = [value_entry(v) for v in analyzed_values if v['status'] != 'normal']
+        
+        # Generar resumen
+        summary = medical_ai.generate_summary(
+            clinical_interpretation, 
+            len(abnormal_values), 
+            urgency_assessment['level']
+        )
+    
+    # Comparar con el historial del paciente y registrar este informe
+    patient_id = patient_info.get('patient_id') if isinstance(patient_info, dict) else None
+    significant_changes = None
+    if patient_id and history is not None and history.enabled:
+        with timer.stage('history'):
+            significant_changes = record_history(history, patient_id, patient_info, analyzed_values,
+                                                 urgency_assessment['level'])
+    elif patient_id and pending_history is not None:
+        pending_history.append((analyzed_values, urgency_assessment['level']))
+    
+    # Estructurar respuesta
+    response = {
+        'success': True,
+        'data': {
+            'summary': summary,
+            'analysis_confidence': f"{confidence}%",
+            'interpretation': clinical_interpretation,
+            'normal_values': normal_values,
+            'abnormal_values': abnormal_values,
+            'recommendations': recommendations,
+            'urgency': urgency_assessment,
+            'important_note': IMPORTANT_NOTE
+        },
+        'patient_info': patient_info,
+        'model_used': medical_ai.model_version,
+        'knowledge_version': medical_ai.knowledge_version,
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    if significant_changes is not None:
+        response['data']['significant_changes'] = significant_changes
+    
+    if snapshot_store is not None:
+        response['result_id'] = snapshot_store.put(Snapshot(
+            medical_ai.knowledge_version, patient_info, rows, analyzed_values, signature,
+            (clinical_interpretation, urgency_assessment, recommendations)
+        ))
+    return response
+
+def record_history(history, patient_id, patient_info, analyzed_values, urgency_level):
+    """Cambios relevantes frente al historial; luego guarda los valores reconocidos"""
+    patient_id = str(patient_id)
+    observed_at = patient_info.get('observed_at')
+    recognized = [
+        (resolve_test_code(v['name']) or v['name'], v['value'], v['unit'], v['status'], v['concern_level'])
+        for v in analyzed_values if v['status'] != 'unknown'
+    ]
+    
+    previous_values = history.previous_values(patient_id, [value[0] for value in recognized], observed_at)
+    significant_changes = medical_ai.flag_significant_changes(analyzed_values, previous_values)
+    history.record_report(patient_id, observed_at, recognized, patient_info, urgency_level,
+                          report_id=patient_info.get('report_id'), source='medical-ai')
+    return significant_changes
+
+def stream_document(html_content, patient_info, timer=NOOP_TIMER):
+    """
+    Pipeline en modo streaming: un registro por valor analizado y después los
+    agregados. Solo se retienen los valores anormales (de ellos dependen
+    interpretación, urgencia y recomendaciones), así que la memoria no crece
+    con el tamaño del informe.
+    """
+    yield {'type': 'start', 'model_used': medical_ai.model_version, 'knowledge_version': medical_ai.knowledge_version}
+    
+    abnormal = []
+    total = recognized = 0
+    chunk = []
+    values = medical_ai.iter_lab_values(html_content)
+    while True:
+        with timer.stage('extraction'):
+            for value in values:
+                chunk.append(value)
+                if len(chunk) >= STREAM_CHUNK_VALUES:
+                    break
+        if not chunk:
+            break
+        
+        # Los valores críticos del bloque se anuncian antes que sus registros
+        with timer.stage('prescreen'):
+            critical_alert = medical_ai.critical_prescreen(chunk)
+        if critical_alert is not None:
+            yield {'type': 'critical_alert', **critical_alert}
+        
+        with timer.stage('analysis'):
+            analyzed_chunk = medical_ai.analyze_values(chunk, patient_info)
+        chunk = []
+        for value in analyzed_chunk:
+            total += 1
+            recognized += value['status'] != 'unknown'
+            if value['status'] != 'normal':
+                # Solo los campos que usan los agregados (ver FINDING_FIELDS)
+                abnormal.append({field: value[field] for field in FINDING_FIELDS})
+            yield {'type': 'value', **value_entry(value)}
+    
+    if not total:
+        yield {'type': 'error', 'error': 'No se pudieron extraer valores de laboratorio del contenido HTML'}
+        return
+    
+    with timer.stage('interpretation'):
+        clinical_interpretation = medical_ai.generate_clinical_interpretation(abnormal, patient_info)
+    yield {'type': 'interpretation', **clinical_interpretation}
+    
+    with timer.stage('urgency'):
+        urgency_assessment = medical_ai.assess_urgency(abnormal)
+    yield {'type': 'urgency', **urgency_assessment}
+    
+    with timer.stage('recommendations'):
+        recommendations = medical_ai.generate_recommendations(abnormal, patient_info)
+    yield {'type': 'recommendations', 'recommendations': recommendations}
+    
+    yield {
+        'type': 'summary',
+        'success': True,
+        'summary': medical_ai.generate_summary(clinical_interpretation, len(abnormal), urgency_assessment['level']),
+        'analysis_confidence': f"{medical_ai.confidence_from_counts(total, recognized)}%",
+        'total_values': total,
+        'abnormal_count': len(abnormal),
+        'important_note': IMPORTANT_NOTE,
+        'patient_info': patient_info,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def wants_critical_fast_path(data):
+    """Vía rápida crítica pedida en el cuerpo o con ?critical_fast_path=1"""
+    flag = data.get('critical_fast_path', request.args.get('critical_fast_path', ''))
+    return flag is True or str(flag).lower() in ('1', 'true')
+
+def _guarded_stream(records, event):
+    """Cerrar el stream con un registro de error si el pipeline falla a mitad"""
+    # El stream se consume después de la vista: se fija ya la versión de la petición
+    knowledge_base = knowledge_store.current()
+    
+    def guarded():
+        with knowledge_store.pin(knowledge_base):
+            try:
+                yield from records
+            except Exception as e:
+                logger.exception(event, error=str(e))
+                yield {'type': 'error', 'error': 'Error interno del servidor'}
+    
+    return guarded()
+
+@bp.route('/api/medical-ai/analyze', methods=['POST'])
 def analyze_lab_results():
     """Endpoint principal para análisis de laboratorio con IA médica avanzada"""
+    timer = metrics.request('analyze')
+    with timer.stage('total'):
+        return _analyze_lab_results(timer)
+
+def _analyze_lab_results(timer):
     try:
-        data = request.get_json()
+        data = read_json(request)
         
         if not data or 'html_content' not in data:
             return jsonify({'error': 'Contenido HTML requerido'}), 400
@@ -431,96 +701,308 @@ def analyze_lab_results():
         html_content = data['html_content']
         patient_info = data.get('patient_info', {})
         
-        logger.info(f"🧠 [MEDICAL AI] Iniciando análisis con {medical_ai.model_version}")
-        logger.info(f"📊 [MEDICAL AI] Base de datos: {medical_ai.training_data}")
-        
-        # Extraer valores de laboratorio
-        lab_values = medical_ai.extract_lab_values(html_content)
-        logger.info(f"🔍 [MEDICAL AI] Extraídos {len(lab_values)} valores de laboratorio")
-        
-        if not lab_values:
+        error = observed_at_error(patient_info)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Modo streaming (NDJSON): sin caché, instantáneas ni historial
+        if wants_ndjson(request):
+            return ndjson_response(_guarded_stream(stream_document(html_content, patient_info, timer), 'analysis_failed'))
+        
+        with timer.stage('cache_lookup'):
+            cache_key = make_key(html_content, patient_info, medical_ai.knowledge_version)
+            cached = result_cache.get(cache_key)
+        if cached is not None:
+            return json_response(cached, headers={'X-Cache': 'HIT'})
+        
+        # Edición de un informe ya analizado: reutilizar lo que no cambió
+        previous = snapshots.get(data.get('previous_result_id'))
+        try:
+            response = analyze_document(html_content, patient_info, timer, previous=previous, snapshot_store=snapshots,
+                                        gate=admission, critical_fast_path=wants_critical_fast_path(data),
+                                        scorer=labrador_scorer)
+        except GateTimeout:
+            logger.warning('admission_timeout')
+            return jsonify({'error': 'Servicio saturado, reintente en unos segundos'}), 503
+        
+        if response is None:
             return jsonify({
                 'error': 'No se pudieron extraer valores de laboratorio del contenido HTML'
             }), 400
         
-        # Analizar cada valor
-        analyzed_values = [medical_ai.analyze_value(value, patient_info) for value in lab_values]
+        # Vía rápida crítica: respuesta parcial, no se guarda en caché
+        if response.get('critical_fast_path'):
+            logger.warning('critical_fast_path', findings=len(response['critical_alert']['findings']))
+            return json_response(response)
         
-        # Generar interpretación clínica
-        clinical_interpretation = medical_ai.generate_clinical_interpretation(analyzed_values, patient_info)
+        # Única serialización de toda la respuesta
+        with timer.stage('encoding'):
+            body = dumps(response)
+        result_cache.put(cache_key, body)
         
-        # Evaluar urgencia
-        urgency_assessment = medical_ai.assess_urgency(analyzed_values)
-        
-        # Generar recomendaciones
-        recommendations = medical_ai.generate_recommendations(analyzed_values, patient_info)
+        logger.info('analysis_completed', abnormal=len(response['data']['abnormal_values']),
+                    urgency=response['data']['urgency']['level'],
+                    confidence=response['data']['analysis_confidence'])
+        return json_response(body, headers={'X-Cache': 'MISS'})
         
-        # Calcular confianza
-        confidence = medical_ai.calculate_confidence(analyzed_values)
+    except Exception as e:
+        logger.exception('analysis_failed', error=str(e))
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+def _analyze_batch_item(document):
+    """
+    Analizar un documento del lote (se ejecuta en un proceso del pool).
+    Devuelve (respuesta, valores para el historial o None): el historial lo
+    escribe el proceso que atiende la petición, no cada proceso del pool.
+    """
+    pending_history = []
+    try:
+        with knowledge_store.pin():
+            response = analyze_document(document['html_content'], document.get('patient_info') or {},
+                                        history=None, pending_history=pending_history)
+    except Exception as e:
+        return {'success': False, 'error': f'Error interno en el análisis: {e}'}, None
+    
+    if response is None:
+        return {'success': False, 'error': 'No se pudieron extraer valores de laboratorio del contenido HTML'}, None
+    return response, pending_history[0] if pending_history else None
+
+def _record_batch_history(document, analyzed):
+    """Registrar en el historial un documento analizado en el pool y añadir sus cambios relevantes"""
+    response, pending = analyzed
+    if pending is not None and lab_history.enabled:
+        analyzed_values, urgency_level = pending
+        patient_info = document['patient_info']
+        try:
+            response['data']['significant_changes'] = record_history(
+                lab_history, patient_info['patient_id'], patient_info, analyzed_values, urgency_level
+            )
+        except Exception as e:
+            logger.exception('batch_history_failed', error=str(e))
+    return response
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+def get_batch_pool():
+    """
+    Pool de procesos para lotes, creado en la primera petición. El worker ya
+    tiene hilos en marcha (logging, carga del modelo, micro-lotes): los
+    procesos del pool no se crean con fork, que copiaría locks tomados por
+    esos hilos, sino desde un proceso limpio (forkserver o spawn).
+    """
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _batch_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS,
+                                              mp_context=multiprocessing.get_context(method))
+        return _batch_pool
+
+@bp.route('/api/medical-ai/analyze-batch', methods=['POST'])
+def analyze_lab_results_batch():
+    """Analizar una lista de documentos {html_content, patient_info} en paralelo"""
+    timer = metrics.request('analyze-batch')
+    with timer.stage('total'):
+        return _analyze_lab_results_batch(timer)
+
+def _analyze_lab_results_batch(timer):
+    try:
+        data = read_json(request)
+        documents = data.get('documents') if isinstance(data, dict) else None
         
-        # Separar valores normales y anormales
-        normal_values = [
-            {
-                'test_name': v['name'],
-                'value': f"{v['value']} {v['unit']}",
-                'reference_range': v['reference_range'],
-                'status': v['status']
-            }
-            for v in analyzed_values if v['status'] == 'normal'
-        ]
+        if not isinstance(documents, list) or not documents:
+            return jsonify({'error': 'Lista de documentos requerida'}), 400
         
-        abnormal_values = [
-            {
-                'test_name': v['name'],
-                'value': f"{v['value']} {v['unit']}",
-                'reference_range': v['reference_range'],
-                'status': v['status'],
-                'significance': v['significance']
-            }
-            for v in analyzed_values if v['status'] != 'normal'
+        if len(documents) > BATCH_MAX_DOCUMENTS:
+            return jsonify({
+                'error': f'El lote excede el máximo de {BATCH_MAX_DOCUMENTS} documentos'
+            }), 413
+        
+        results = [None] * len(documents)
+        pending = []
+        for index, document in enumerate(documents):
+            if not isinstance(document, dict) or not isinstance(document.get('html_content'), str):
+                results[index] = {'success': False, 'error': 'Contenido HTML requerido'}
+                continue
+            error = observed_at_error(document.get('patient_info'))
+            if error:
+                results[index] = {'success': False, 'error': error}
+            else:
+                pending.append(index)
+        
+        batch = [documents[index] for index in pending]
+        if len(batch) < BATCH_POOL_THRESHOLD:
+            # Lotes pequeños: el coste de enviar al pool supera el del análisis
+            analyzed = map(_analyze_batch_item, batch)
+        else:
+            chunksize = max(1, len(batch) // (BATCH_WORKERS * 4))
+            analyzed = get_batch_pool().map(_analyze_batch_item, batch, chunksize=chunksize)
+        analyzed = (_record_batch_history(document, item) for document, item in zip(batch, analyzed))
+        
+        # Modo streaming: cada documento se envía en cuanto llega del pool
+        if wants_ndjson(request):
+            return ndjson_response(_guarded_stream(
+                _stream_batch(documents, results, pending, analyzed), 'batch_failed'
+            ))
+        
+        with timer.stage('workers'):
+            for index, result in zip(pending, analyzed):
+                results[index] = result
+        
+        errors = [
+            {'index': index, 'error': result['error']}
+            for index, result in enumerate(results) if not result['success']
         ]
         
-        # Generar resumen
-        summary = medical_ai.generate_summary(
-            clinical_interpretation, 
-            len(abnormal_values), 
-            urgency_assessment['level']
-        )
-        
-        # Estructurar respuesta
-        response = {
+        logger.info('batch_completed', total=len(documents), failed=len(errors))
+        return json_response({
             'success': True,
-            'data': {
-                'summary': summary,
-                'analysis_confidence': f"{confidence}%",
-                'interpretation': clinical_interpretation,
-                'normal_values': normal_values,
-                'abnormal_values': abnormal_values,
-                'recommendations': recommendations,
-                'urgency': urgency_assessment,
-                'important_note': "Esta interpretación es generada por un sistema de IA médica avanzada con base de datos de millones de registros. Debe ser revisada por un profesional médico. Los rangos de referencia pueden variar según el laboratorio y la población."
-            },
-            'patient_info': patient_info,
+            'total': len(documents),
+            'succeeded': len(documents) - len(errors),
+            'failed': len(errors),
+            'results': results,
+            'errors': errors,
             'model_used': medical_ai.model_version,
             'timestamp': datetime.now().isoformat()
-        }
-        
-        logger.info(f"✅ [MEDICAL AI] Análisis completado con {confidence}% de confianza")
-        return jsonify(response)
+        })
         
     except Exception as e:
-        logger.error(f"❌ [MEDICAL AI] Error en análisis: {e}")
+        logger.exception('batch_failed', error=str(e))
         return jsonify({'error': 'Error interno del servidor'}), 500
 
-@app.route('/api/medical-ai/health', methods=['GET'])
+def _stream_batch(documents, results, pending, analyzed):
+    """Un registro por documento (en orden de índice) y un resumen final"""
+    errors = []
+    analyzed = iter(zip(pending, analyzed))
+    for index in range(len(documents)):
+        result = results[index]
+        if result is None:
+            _, result = next(analyzed)
+        if not result['success']:
+            errors.append({'index': index, 'error': result['error']})
+        yield {'type': 'document', 'index': index, **result}
+    
+    logger.info('batch_completed', total=len(documents), failed=len(errors))
+    yield {
+        'type': 'batch_summary',
+        'success': True,
+        'total': len(documents),
+        'succeeded': len(documents) - len(errors),
+        'failed': len(errors),
+        'errors': errors,
+        'model_used': medical_ai.model_version,
+        'timestamp': datetime.now().isoformat()
+    }
+
+@bp.route('/api/medical-ai/patients/<patient_id>/trends/<test_code>', methods=['GET'])
+def patient_trend(patient_id, test_code):
+    """Serie temporal de un examen del paciente (?from=&to=&limit=) con estadísticas"""
+    if not lab_history.enabled:
+        return jsonify({'error': 'Historial de pacientes deshabilitado'}), 404
+    
+    code = resolve_test_code(test_code.upper()) or test_code.upper()
+    try:
+        limit = min(int(request.args.get('limit', TREND_MAX_POINTS)), TREND_MAX_POINTS)
+        points = lab_history.series(patient_id, code, request.args.get('from'), request.args.get('to'), limit)
+    except ValueError:
+        return jsonify({'error': 'Parámetros de rango inválidos (fechas ISO 8601, limit entero)'}), 400
+    
+    values = [point['value'] for point in points]
+    reference = medical_ai.kb.reference_ranges.get(code)
+    return json_response({
+        'patient_id': patient_id,
+        'test_code': code,
+        'reference_range': {key: reference[key] for key in ('min', 'max', 'unit')} if reference else None,
+        'points': points,
+        'window': {
+            'count': len(values),
+            'mean': round(sum(values) / len(values), 4) if values else None,
+            'min': min(values, default=None),
+            'max': max(values, default=None),
+            'change': round(values[-1] - values[0], 4) if len(values) > 1 else None
+        },
+        'stats': lab_history.stats(patient_id, code)
+    })
+
+@bp.route('/api/medical-ai/health', methods=['GET'])
 def health_check():
     """Endpoint de salud del sistema de IA médica"""
     return jsonify({
         'status': 'healthy',
+        # Las reglas siempre responden; el modelo Labrador puede estar cargando o haber fallado
+        'model_ready': labrador.ready,
         'model_version': medical_ai.model_version,
         'training_data': medical_ai.training_data,
+        'knowledge_version': medical_ai.knowledge_version,
+        'knowledge': knowledge_store.status(),
+        'labrador': labrador.status(),
+        'labrador_scoring': labrador_scorer.status(),
+        'embedding_cache': labrador_scorer.cache.stats(),
+        'result_cache': result_cache.stats(),
+        'snapshots': snapshots.stats(),
+        'lab_history': lab_history.status(),
+        'admission': admission.status(),
         'timestamp': datetime.now().isoformat()
     })
 
+@bp.route('/api/medical-ai/knowledge/reload', methods=['POST'])
+def reload_knowledge():
+    """
+    Recargar la base de conocimiento desde su archivo sin reiniciar el worker.
+    Solo recarga el proceso que atiende la petición: los demás workers (y el
+    pool de lotes) la cargan al revisar el archivo cada KNOWLEDGE_RELOAD_INTERVAL_S.
+    """
+    if not knowledge_store.reload_enabled:
+        return jsonify({'error': 'Recarga por endpoint deshabilitada'}), 404
+    if not knowledge_store.authorized(request.headers.get('X-Reload-Token')):
+        return jsonify({'error': 'Token de recarga inválido'}), 403
+    
+    try:
+        knowledge_store.reload()
+    except (OSError, ValueError) as e:
+        # Se conserva la versión vigente
+        return jsonify({'error': f'Base de conocimiento inválida: {e}', 'knowledge': knowledge_store.status()}), 422
+    return jsonify({'success': True, 'knowledge': knowledge_store.status()})
+
+@bp.route('/api/medical-ai/ready', methods=['GET'])
+def readiness_check():
+    """Endpoint de disponibilidad; con ?require_model=1 exige el modelo Labrador cargado"""
+    require_model = request.args.get('require_model', '0').lower() in ('1', 'true')
+    ready = labrador.ready or not require_model
+    
+    return jsonify({
+        'ready': ready,
+        'labrador': labrador.status(),
+        'timestamp': datetime.now().isoformat()
+    }), 200 if ready else 503
+
+@bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Histogramas de latencia por etapa en formato Prometheus"""
+    return Response(metrics.render_prometheus(), content_type=METRICS_CONTENT_TYPE)
+
+def create_app():
+    """Fábrica de la aplicación Flask (usada por serve.py y por el servidor de desarrollo)"""
+    app = Flask(__name__)
+    CORS(app)  # Permitir CORS para el frontend
+    init_request_logging(app)
+    knowledge_store.init_app(app)
+    http_compression.init_app(app)
+    app.register_blueprint(bp)
+    logger.info('service_started', service='medical-ai', model_version=medical_ai.model_version,
+                training_data=medical_ai.training_data, knowledge_version=medical_ai.knowledge_version)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
+    # Servidor de desarrollo; en producción usar serve.py
+    debug = os.getenv('FLASK_DEBUG', 'False').lower() in ('1', 'true')
+    use_reloader = os.getenv('FLASK_RELOADER', 'False').lower() in ('1', 'true')
+    
+    # Con el reloader solo el proceso hijo atiende peticiones: el modelo se carga una vez
+    if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        labrador.start_background_load()
+    
+    app.run(debug=debug, use_reloader=use_reloader, host='0.0.0.0', port=5001)
@@ -3,132 +3,198 @@ Backend Flask para Interpretación Médica con IA
 Laboratorio Esperanza - Sistema de Gestión de Laboratorio
 """
 
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify
 from flask_cors import CORS
-import openai
-import google.generativeai as genai
-import json
-import re
 import os
 from datetime import datetime
-import logging
 
-# Configuración de logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+from ai_providers import build_provider_client
+import http_compression
+from fast_json import dumps, json_response, ndjson_response, read_json, wants_ndjson
+from incremental import Snapshot, SnapshotStore, findings_signature, reanalyze, row_key
+from lab_extraction import iter_lab_rows
+from pipeline_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, NOOP_TIMER, PipelineMetrics
+from lab_history import LabHistory, observed_at_error
+from medical_knowledge import knowledge_store
+from range_classifier import STATUS_LABELS as HISTORY_STATUS_LABELS, RangeTable
+from result_cache import ResultCache, make_key
+from structured_logging import configure_logging, get_logger, init_app as init_request_logging
+from name_matcher import resolve_test_code
+from triage import PRIORITY_CRITICAL, PRIORITY_ROUTINE, GateTimeout, PriorityGate, prescreen
 
-app = Flask(__name__)
-CORS(app)  # Permitir CORS para el frontend
+# Logging estructurado en JSON (ver structured_logging.py)
+configure_logging()
+logger = get_logger(__name__)
+
+bp = Blueprint('medical_interpret', __name__)
 
 # Configuración de APIs de IA
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 
-# Configurar OpenAI
-if OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
+# Proveedores de IA: cliente HTTP compartido con límite de concurrencia y presupuesto
+# de latencia. Desactivado salvo AI_INTERPRETATION_ENABLED=true.
+ai_client = build_provider_client(OPENAI_API_KEY, GEMINI_API_KEY)
+
+# Valores analizados por bloque en modo streaming (?stream=1)
+STREAM_CHUNK_VALUES = int(os.getenv('MEDICAL_INTERPRET_STREAM_CHUNK_VALUES', '64'))
+
+IMPORTANT_NOTE = "Esta interpretación es generada por IA y debe ser revisada por un profesional médico. Los rangos de referencia pueden variar según el laboratorio y la población."
+MODEL_USED = "gemini-2.0-flash" if GEMINI_API_KEY else "openai-gpt-4"
+
+# Etiquetas de estado por código de range_classifier (-1 = desconocido)
+STATUS_LABELS = ('normal', 'low', 'high', 'unknown')
+
+# El historial guarda los estados con las etiquetas de MedicalAI para comparar series
+HISTORY_STATUS = dict(zip(STATUS_LABELS, HISTORY_STATUS_LABELS))
+
+# Tablas por código canónico de examen (name_matcher)
+REFERENCE_RANGE_TEXT = {
+    'GLUCOSA': "70-100 mg/dl",
+    'COLESTEROL_TOTAL': "<200 mg/dl",
+    'HDL': ">40 mg/dl",
+    'LDL': "<100 mg/dl",
+    'TRIGLICERIDOS': "<150 mg/dl",
+    'HEMOGLOBINA': "12-16 g/dl",
+    'HEMATOCRITO': "36-48%",
+    'LEUCOCITOS': "4000-11000 /mm³",
+    'CREATININA': "0.6-1.2 mg/dl",
+    'UREA': "7-20 mg/dl",
+    'BILIRRUBINA': "0.3-1.2 mg/dl",
+    'TSH': "0.4-4.0 mUI/L"
+}
+# Los textos de colesterol solo aplican a nombres con "COLESTEROL" (no a "HDL"/"LDL" a secas)
+CHOLESTEROL_CODES = frozenset(['COLESTEROL_TOTAL', 'HDL', 'LDL'])
+CHOLESTEROL_CAUSES = ("Hipercolesterolemia familiar", "Dieta rica en grasas saturadas", "Síndrome metabólico")
+CRITICAL_URGENCY_CODES = frozenset(['CK_MB', 'TROPONINA', 'GLUCOSA', 'CREATININA'])
+HIGH_URGENCY_CODES = frozenset(['HEMOGLOBINA', 'LEUCOCITOS', 'UREA'])
+FALLBACK_CRITICAL_CODES = frozenset(['CK_MB', 'TROPONINA', 'CPK', 'CREATININA', 'UREA'])
+POSSIBLE_CAUSES = {
+    'GLUCOSA': ("Diabetes mellitus", "Resistencia a la insulina", "Síndrome metabólico"),
+    'CREATININA': ("Insuficiencia renal", "Deshidratación", "Medicamentos nefrotóxicos")
+}
+# Causas de hemoglobina indexadas por "¿está elevada?"
+HEMOGLOBIN_CAUSES = (
+    ("Anemia ferropénica", "Anemia por deficiencia de B12", "Pérdida crónica de sangre"),
+    ("Policitemia vera", "Deshidratación", "Hipoxia crónica")
+)
+
+def _test_code(value):
+    """Código canónico del examen (resuelto una vez por valor en analyze_values)"""
+    if 'test_code' in value:
+        return value['test_code']
+    return resolve_test_code(value['name'])
 
-# Configurar Google Gemini (temporalmente desactivado)
-if False:  # GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    gemini_model = genai.GenerativeModel('gemini-pro')
+def _is_cholesterol(value, code):
+    """Examen de colesterol nombrado como tal ("Colesterol HDL" sí, "HDL" no)"""
+    return code in CHOLESTEROL_CODES and 'COLESTEROL' in value['name'].upper()
 
 class MedicalInterpreter:
     """Clase para interpretación médica de resultados de laboratorio"""
     
-    def __init__(self):
-        self.normal_ranges = {
-            'glucosa': {'min': 70, 'max': 100, 'unit': 'mg/dl'},
-            'colesterol_total': {'min': 0, 'max': 200, 'unit': 'mg/dl'},
-            'hdl_colesterol': {'min': 40, 'max': 100, 'unit': 'mg/dl'},
-            'ldl_colesterol': {'min': 0, 'max': 100, 'unit': 'mg/dl'},
-            'trigliceridos': {'min': 0, 'max': 150, 'unit': 'mg/dl'},
-            'hemoglobina': {'min': 12, 'max': 16, 'unit': 'g/dl'},
-            'hematocrito': {'min': 36, 'max': 48, 'unit': '%'},
-            'leucocitos': {'min': 4000, 'max': 11000, 'unit': '/mm³'},
-            'creatinina': {'min': 0.6, 'max': 1.2, 'unit': 'mg/dl'},
-            'urea': {'min': 7, 'max': 20, 'unit': 'mg/dl'},
-            'bilirrubina_total': {'min': 0.3, 'max': 1.2, 'unit': 'mg/dl'},
-            'tsh': {'min': 0.4, 'max': 4.0, 'unit': 'mUI/L'},
-            't3': {'min': 80, 'max': 200, 'unit': 'ng/dl'},
-            't4': {'min': 4.5, 'max': 12, 'unit': 'μg/dl'}
-        }
+    def __init__(self, knowledge=knowledge_store):
+        # Rangos propios del interpretador, en la misma base de conocimiento recargable
+        self.knowledge = knowledge
+
+    @property
+    def kb(self):
+        """Versión de la base de conocimiento fijada por la petición en curso"""
+        return self.knowledge.current()
+
+    @property
+    def normal_ranges(self):
+        return self.kb.interpreter_ranges
+
+    @property
+    def range_table(self):
+        return self.kb.interpreter_range_table
+
+    @property
+    def knowledge_version(self):
+        """Versión de los rangos: invalida la caché de resultados al cambiarlos"""
+        return self.kb.version
 
     def extract_lab_values(self, html_content):
-        """Extraer valores de laboratorio del HTML"""
-        values = []
-        
-        # Patrones para extraer valores
-        patterns = [
-            r'(\w+):\s*([\d.,]+)\s*(mg/dl|g/dl|%|u/l|iu/ml|ng/ml|pg/ml|mUI/L|μg/dl)',
-            r'(\w+)\s*([\d.,]+)\s*(mg/dl|g/dl|%|u/l|iu/ml|ng/ml|pg/ml|mUI/L|μg/dl)',
-            r'([A-Za-z\s]+):\s*([\d.,]+)',
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, html_content, re.IGNORECASE)
-            for match in matches:
-                if len(match) >= 2:
-                    name = match[0].strip().lower()
-                    value_str = match[1].replace(',', '.')
-                    unit = match[2] if len(match) > 2 else ''
-                    
-                    try:
-                        value = float(value_str)
-                        values.append({
-                            'name': name,
-                            'value': value,
-                            'unit': unit,
-                            'raw_text': ' '.join(match)
-                        })
-                    except ValueError:
-                        continue
-        
-        return values
+        """Extraer valores de las filas de texto del HTML (tablas y párrafos)"""
+        return list(self.iter_lab_values(html_content))
+
+    def iter_lab_values(self, html_content):
+        """Igual que extract_lab_values, pero generando los valores según se leen"""
+        for item in iter_lab_rows(html_content):
+            yield {
+                'name': item.name.lower(),
+                'value': item.value,
+                'unit': item.unit,
+                'raw_text': item.raw_text
+            }
 
     def analyze_values(self, values, patient_info):
-        """Analizar valores y determinar estado"""
-        analyzed_values = []
-        alerts = []
+        """Analizar valores y determinar estado (clasificación vectorizada)"""
+        rows = self.analyze_rows(values)
+        analyzed_values = [analyzed for analyzed, _ in rows]
+        alerts = [alert for _, alert in rows if alert is not None]
+        return analyzed_values, alerts
+
+    def analyze_rows(self, values):
+        """(valor analizado, alerta o None) por fila, en el orden de entrada"""
+        rows = []
         
-        for value in values:
+        statuses, _ = self.range_table.classify(
+            [value['name'] for value in values],
+            [value['value'] for value in values]
+        )
+        
+        for value, status_code in zip(values, statuses.tolist()):
             name = value['name']
             val = value['value']
             unit = value['unit']
+            status = STATUS_LABELS[status_code]
             
-            # Buscar en rangos normales
-            status = 'unknown'
-            if name in self.normal_ranges:
-                normal_range = self.normal_ranges[name]
-                if val < normal_range['min']:
-                    status = 'low'
-                elif val > normal_range['max']:
-                    status = 'high'
-                else:
-                    status = 'normal'
-            
-            analyzed_values.append({
+            analyzed = {
                 'name': name.title(),
+                'test_code': resolve_test_code(name),
                 'value': f"{val} {unit}",
                 'status': status,
-                'normal_range': self.normal_ranges.get(name, {})
-            })
+                'normal_range': dict(self.normal_ranges.get(name, {}))
+            }
             
             # Generar alertas para valores anormales
+            alert = None
             if status == 'high':
-                alerts.append({
+                alert = {
                     'title': f'{name.title()} Elevado',
                     'description': f'El valor de {name} ({val} {unit}) está por encima del rango normal',
                     'severity': 'high' if val > self.normal_ranges.get(name, {}).get('max', 0) * 1.5 else 'medium'
-                })
+                }
             elif status == 'low':
-                alerts.append({
+                alert = {
                     'title': f'{name.title()} Bajo',
                     'description': f'El valor de {name} ({val} {unit}) está por debajo del rango normal',
                     'severity': 'high' if val < self.normal_ranges.get(name, {}).get('min', 0) * 0.5 else 'medium'
-                })
+                }
+            
+            rows.append((analyzed, alert))
         
-        return analyzed_values, alerts
+        return rows
+
+    def critical_prescreen(self, values):
+        """
+        Alerta con los valores fuera de los umbrales críticos, o None. Los rangos
+        del interpretador no tienen umbrales críticos: se usan los de reference_ranges.
+        """
+        codes, known = [], []
+        for value in values:
+            code = resolve_test_code(value['name'])
+            if code is not None:
+                codes.append(code)
+                known.append(value)
+        return prescreen(
+            self.kb.range_table,
+            codes,
+            [value['value'] for value in known],
+            names=[value['name'].title() for value in known],
+            units=[value['unit'] for value in known]
+        )
 
     def generate_ai_interpretation(self, html_content, patient_info, lab_values):
         """Generar interpretación usando IA"""
@@ -164,8 +230,12 @@ class MedicalInterpreter:
         IMPORTANTE: Responde SOLO con el JSON, sin texto adicional.
         """
 
-        # inicio de la IA
-        logger.info("Usando sistema de fallback estructurado")
+        # Consulta al modelo con presupuesto de latencia; si no llega a tiempo, respaldo
+        ai_data = ai_client.interpret(prompt)
+        if ai_data is not None:
+            return ai_data
+        
+        logger.info('fallback_interpretation')
         return self.generate_fallback_interpretation(lab_values, patient_info)
 
     def generate_fallback_interpretation(self, lab_values, patient_info):
@@ -177,9 +247,8 @@ class MedicalInterpreter:
         urgency_level = "BAJA"
         if abnormal_count > 0:
             # Verificar valores críticos
-            critical_values = ['CK-MB', 'Troponina', 'CPK', 'Creatinina', 'Urea']
             for value in lab_values:
-                if value.get('status') != 'normal' and any(critical in value['name'].upper() for critical in critical_values):
+                if value.get('status') != 'normal' and _test_code(value) in FALLBACK_CRITICAL_CODES:
                     urgency_level = "ALTA"
                     break
             if urgency_level != "ALTA":
@@ -219,19 +288,20 @@ class MedicalInterpreter:
             # Acciones específicas por tipo de valor
             for value in lab_values:
                 if value.get('status') != 'normal':
-                    if 'CK-MB' in value['name'].upper() or 'TROPONINA' in value['name'].upper():
+                    code = _test_code(value)
+                    if code in ('CK_MB', 'TROPONINA'):
                         urgent_actions.extend([
                             "ECG inmediato",
                             "Troponina I/T",
                             "Consulta cardiológica urgente"
                         ])
-                    elif 'GLUCOSA' in value['name'].upper():
+                    elif code == 'GLUCOSA':
                         urgent_actions.extend([
                             "Curva de tolerancia a la glucosa",
                             "HbA1c",
                             "Consulta endocrinológica"
                         ])
-                    elif 'CREATININA' in value['name'].upper() or 'UREA' in value['name'].upper():
+                    elif code in ('CREATININA', 'UREA'):
                         urgent_actions.extend([
                             "Depuración de creatinina",
                             "Consulta nefrológica"
@@ -245,14 +315,14 @@ class MedicalInterpreter:
         else:
             follow_up.append("Continuar con controles rutinarios")
         
-        return json.dumps({
+        return {
             "summary": summary,
             "suspicious_findings": suspicious_findings,
             "normal_findings": normal_findings,
             "urgent_actions": urgent_actions,
             "follow_up": follow_up,
             "urgency_level": urgency_level
-        })
+        }
     
     def generate_structured_response(self, lab_values, patient_info, ai_data):
         """Generar respuesta estructurada en formato JSON estándar"""
@@ -263,21 +333,51 @@ class MedicalInterpreter:
         abnormal_values = []
         
         for value in lab_values:
-            value_data = {
-                "test_name": value['name'],
-                "value": f"{value['value']} {value.get('unit', '')}".strip(),
-                "reference_range": self._get_reference_range(value['name']),
-                "status": value.get('status', 'normal')
-            }
-            
             if value.get('status') == 'normal':
-                normal_values.append(value_data)
+                normal_values.append(self.value_entry(value))
             else:
-                value_data["significance"] = self._get_significance_explanation(value)
-                abnormal_values.append(value_data)
+                abnormal_values.append(self.value_entry(value))
         
+        aggregates = self.generate_aggregates(
+            [value for value in lab_values if value.get('status') != 'normal'],
+            ai_data
+        )
+        
+        # Respuesta estructurada final
+        return {
+            "success": True,
+            "data": {
+                "summary": aggregates['summary'],
+                "analysis_confidence": aggregates['analysis_confidence'],
+                "interpretation": aggregates['interpretation'],
+                "normal_values": normal_values,
+                "abnormal_values": abnormal_values,
+                "recommendations": aggregates['recommendations'],
+                "urgency": aggregates['urgency'],
+                "important_note": IMPORTANT_NOTE
+            },
+            "patient_info": patient_info,
+            "model_used": MODEL_USED,
+            "knowledge_version": self.knowledge_version,
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    def value_entry(self, value):
+        """Valor analizado tal como aparece en la respuesta"""
+        value_data = {
+            "test_name": value['name'],
+            "value": f"{value['value']} {value.get('unit', '')}".strip(),
+            "reference_range": self._get_reference_range(value['name']),
+            "status": value.get('status', 'normal')
+        }
+        if value.get('status') != 'normal':
+            value_data["significance"] = self._get_significance_explanation(value)
+        return value_data
+    
+    def generate_aggregates(self, abnormal_values, ai_data):
+        """Interpretación, urgencia, recomendaciones y resumen (dependen solo de los valores anormales)"""
         # Determinar nivel de urgencia
-        urgency_level = self._determine_urgency_level(lab_values)
+        urgency_level = self._determine_urgency_level(abnormal_values)
         urgency_messages = {
             "Baja": "Los resultados están dentro de parámetros normales o con desviaciones menores",
             "Media": "Se observan algunos valores fuera del rango normal que requieren seguimiento",
@@ -287,10 +387,10 @@ class MedicalInterpreter:
         
         # Generar interpretación estructurada
         interpretation = {
-            "title": self._generate_interpretation_title(lab_values, urgency_level),
+            "title": self._generate_interpretation_title(abnormal_values, urgency_level),
             "description": ai_data.get('summary', 'Análisis de resultados de laboratorio'),
-            "clinical_significance": self._generate_clinical_significance(lab_values),
-            "possible_causes": self._generate_possible_causes(lab_values)
+            "clinical_significance": self._generate_clinical_significance(abnormal_values),
+            "possible_causes": self._generate_possible_causes(abnormal_values)
         }
         
         # Combinar recomendaciones
@@ -300,73 +400,40 @@ class MedicalInterpreter:
         if ai_data.get('follow_up'):
             all_recommendations.extend(ai_data['follow_up'])
         
-        # Respuesta estructurada final
         return {
-            "success": True,
-            "data": {
-                "summary": ai_data.get('summary', 'Análisis de resultados de laboratorio completado'),
-                "analysis_confidence": f"{int(ai_data.get('confidence', 0.8) * 100)}%",
-                "interpretation": interpretation,
-                "normal_values": normal_values,
-                "abnormal_values": abnormal_values,
-                "recommendations": all_recommendations,
-                "urgency": {
-                    "level": urgency_level,
-                    "message": urgency_messages.get(urgency_level, "Evaluación médica recomendada")
-                },
-                "important_note": "Esta interpretación es generada por IA y debe ser revisada por un profesional médico. Los rangos de referencia pueden variar según el laboratorio y la población."
-            },
-            "patient_info": patient_info,
-            "model_used": "gemini-2.0-flash" if GEMINI_API_KEY else "openai-gpt-4",
-            "timestamp": datetime.now().isoformat()
+            "summary": ai_data.get('summary', 'Análisis de resultados de laboratorio completado'),
+            "analysis_confidence": f"{int(ai_data.get('confidence', 0.8) * 100)}%",
+            "interpretation": interpretation,
+            "recommendations": all_recommendations,
+            "urgency": {
+                "level": urgency_level,
+                "message": urgency_messages.get(urgency_level, "Evaluación médica recomendada")
+            }
         }
     
     def _get_reference_range(self, test_name):
         """Obtener rango de referencia para un examen"""
-        name_upper = test_name.upper()
-        
-        if 'GLUCOSA' in name_upper:
-            return "70-100 mg/dl"
-        elif 'COLESTEROL' in name_upper and 'TOTAL' in name_upper:
-            return "<200 mg/dl"
-        elif 'HDL' in name_upper:
-            return ">40 mg/dl"
-        elif 'LDL' in name_upper:
-            return "<100 mg/dl"
-        elif 'TRIGLICERIDOS' in name_upper:
-            return "<150 mg/dl"
-        elif 'HEMOGLOBINA' in name_upper:
-            return "12-16 g/dl"
-        elif 'HEMATOCRITO' in name_upper:
-            return "36-48%"
-        elif 'LEUCOCITOS' in name_upper:
-            return "4000-11000 /mm³"
-        elif 'CREATININA' in name_upper:
-            return "0.6-1.2 mg/dl"
-        elif 'UREA' in name_upper:
-            return "7-20 mg/dl"
-        elif 'BILIRRUBINA' in name_upper:
-            return "0.3-1.2 mg/dl"
-        elif 'TSH' in name_upper:
-            return "0.4-4.0 mUI/L"
-        else:
-            return "Consultar valores de referencia del laboratorio"
+        code = resolve_test_code(test_name)
+        # "<200" es del colesterol total: un "Colesterol" sin más no lo recibe
+        if code == 'COLESTEROL_TOTAL' and 'TOTAL' not in test_name.upper():
+            code = None
+        return REFERENCE_RANGE_TEXT.get(code, "Consultar valores de referencia del laboratorio")
     
     def _get_significance_explanation(self, value):
         """Generar explicación del significado clínico"""
-        name = value['name'].upper()
+        code = _test_code(value)
         status = value.get('status', '')
         
-        if 'GLUCOSA' in name:
+        if code == 'GLUCOSA':
             if status == 'high':
                 return "Hiperglucemia detectada. Posible diabetes o resistencia a la insulina. Requiere evaluación endocrinológica."
             else:
                 return "Hipoglucemia detectada. Requiere evaluación metabólica inmediata."
-        elif 'COLESTEROL' in name:
+        elif _is_cholesterol(value, code):
             return "Elevación del colesterol aumenta el riesgo cardiovascular. Requiere control lipídico y evaluación cardiológica."
-        elif 'CREATININA' in name:
+        elif code == 'CREATININA':
             return "Elevación sugiere deterioro de la función renal. Requiere evaluación nefrológica y estudios de función renal."
-        elif 'HEMOGLOBINA' in name:
+        elif code == 'HEMOGLOBINA':
             if status == 'high':
                 return "Policitemia posible. Requiere evaluación hematológica para descartar causas secundarias."
             else:
@@ -376,19 +443,18 @@ class MedicalInterpreter:
     
     def _determine_urgency_level(self, lab_values):
         """Determinar nivel de urgencia basado en los valores"""
-        critical_tests = ['CK-MB', 'TROPONINA', 'GLUCOSA', 'CREATININA']
-        high_urgency_tests = ['HEMOGLOBINA', 'LEUCOCITOS', 'UREA']
-        
         for value in lab_values:
-            name = value['name'].upper()
-            status = value.get('status', '')
+            if value.get('status', '') == 'normal':
+                continue
+            
+            code = _test_code(value)
             
             # Verificar si es crítico
-            if any(test in name for test in critical_tests) and status != 'normal':
+            if code in CRITICAL_URGENCY_CODES:
                 return "Crítica"
             
             # Verificar si es alta urgencia
-            if any(test in name for test in high_urgency_tests) and status != 'normal':
+            if code in HIGH_URGENCY_CODES:
                 return "Alta"
         
         # Contar valores anormales
@@ -431,64 +497,39 @@ class MedicalInterpreter:
         
         for value in lab_values:
             if value.get('status') != 'normal':
-                name = value['name'].upper()
+                code = _test_code(value)
                 
-                if 'GLUCOSA' in name:
-                    causes.extend([
-                        "Diabetes mellitus",
-                        "Resistencia a la insulina",
-                        "Síndrome metabólico"
-                    ])
-                elif 'COLESTEROL' in name:
-                    causes.extend([
-                        "Hipercolesterolemia familiar",
-                        "Dieta rica en grasas saturadas",
-                        "Síndrome metabólico"
-                    ])
-                elif 'CREATININA' in name:
-                    causes.extend([
-                        "Insuficiencia renal",
-                        "Deshidratación",
-                        "Medicamentos nefrotóxicos"
-                    ])
-                elif 'HEMOGLOBINA' in name:
-                    if value.get('status') == 'high':
-                        causes.extend([
-                            "Policitemia vera",
-                            "Deshidratación",
-                            "Hipoxia crónica"
-                        ])
-                    else:
-                        causes.extend([
-                            "Anemia ferropénica",
-                            "Anemia por deficiencia de B12",
-                            "Pérdida crónica de sangre"
-                        ])
+                if code == 'HEMOGLOBINA':
+                    causes.extend(HEMOGLOBIN_CAUSES[value.get('status') == 'high'])
+                elif _is_cholesterol(value, code):
+                    causes.extend(CHOLESTEROL_CAUSES)
+                else:
+                    causes.extend(POSSIBLE_CAUSES.get(code, ()))
         
         # Eliminar duplicados y limitar a 5 causas
         return list(set(causes))[:5]
     
     def _get_specific_reason(self, value):
         """Obtener razón específica basada en el tipo de valor"""
-        name = value['name'].upper()
+        code = _test_code(value)
         status = value.get('status', '')
         
-        if 'CK-MB' in name:
+        if code == 'CK_MB':
             return "Elevación sugiere posible daño cardíaco. Requiere evaluación cardiológica urgente."
-        elif 'TROPONINA' in name:
+        elif code == 'TROPONINA':
             return "Marcador específico de daño miocárdico. Elevación indica lesión cardíaca."
-        elif 'GLUCOSA' in name:
+        elif code == 'GLUCOSA':
             if status == 'high':
                 return "Hiperglucemia detectada. Posible diabetes o resistencia a la insulina."
             else:
                 return "Hipoglucemia detectada. Requiere evaluación metabólica."
-        elif 'CREATININA' in name:
+        elif code == 'CREATININA':
             return "Elevación sugiere deterioro de función renal. Requiere evaluación nefrológica."
-        elif 'UREA' in name:
+        elif code == 'UREA':
             return "Elevación indica posible insuficiencia renal o deshidratación."
-        elif 'COLESTEROL' in name:
+        elif _is_cholesterol(value, code):
             return "Elevación aumenta riesgo cardiovascular. Requiere control lipídico."
-        elif 'HEMOGLOBINA' in name:
+        elif code == 'HEMOGLOBINA':
             if status == 'high':
                 return "Policitemia posible. Requiere evaluación hematológica."
             else:
@@ -499,11 +540,123 @@ class MedicalInterpreter:
 # Instanciar el interpretador
 interpreter = MedicalInterpreter()
 
-@app.route('/api/medical-interpret', methods=['POST'])
+# Caché de respuestas ya serializadas
+result_cache = ResultCache()
+
+# Instantáneas para la reinterpretación incremental (previous_result_id)
+snapshots = SnapshotStore()
+
+# Historial longitudinal compartido con backend_medical_ai (LAB_HISTORY_DB)
+lab_history = LabHistory()
+
+# Admisión por prioridad (informes críticos primero); PRIORITY_GATE_SLOTS=0 la desactiva
+admission = PriorityGate()
+
+# Campos de los que depende la interpretación (IA o respaldo)
+INTERPRETATION_FIELDS = ('name', 'value', 'status')
+
+# Latencia por etapa, expuesta en /metrics
+metrics = PipelineMetrics('medical_interpret')
+
+def record_history(patient_id, patient_info, lab_values, analyzed_values, urgency_level):
+    """Guardar los valores reconocidos del informe en el historial del paciente"""
+    lab_history.record_report(patient_id, patient_info.get('observed_at'), [
+        (analyzed['test_code'] or lab_value['name'].upper(), lab_value['value'], lab_value['unit'],
+         HISTORY_STATUS[analyzed['status']], None)
+        for lab_value, analyzed in zip(lab_values, analyzed_values) if analyzed['status'] != 'unknown'
+    ], patient_info, urgency_level, report_id=patient_info.get('report_id'), source='medical-interpret')
+
+def stream_interpretation(html_content, patient_info, timer=NOOP_TIMER):
+    """
+    Interpretación en modo streaming: un registro por valor analizado (con su
+    alerta, si la hay) y al final los agregados. La interpretación recibe todos
+    los valores analizados, como en la respuesta completa.
+    """
+    yield {'type': 'start', 'model_used': MODEL_USED, 'knowledge_version': interpreter.knowledge_version}
+    
+    analyzed_values = []
+    chunk = []
+    values = interpreter.iter_lab_values(html_content)
+    while True:
+        with timer.stage('extraction'):
+            for value in values:
+                chunk.append(value)
+                if len(chunk) >= STREAM_CHUNK_VALUES:
+                    break
+        if not chunk:
+            break
+        
+        # Los valores críticos del bloque se anuncian antes que sus registros
+        with timer.stage('prescreen'):
+            critical_alert = interpreter.critical_prescreen(chunk)
+        if critical_alert is not None:
+            yield {'type': 'critical_alert', **critical_alert}
+        
+        with timer.stage('analysis'):
+            analyzed_rows = interpreter.analyze_rows(chunk)
+        chunk = []
+        for analyzed, alert in analyzed_rows:
+            analyzed_values.append(analyzed)
+            record = {'type': 'value', **interpreter.value_entry(analyzed)}
+            if alert is not None:
+                record['alert'] = alert
+            yield record
+    
+    if not analyzed_values:
+        yield {'type': 'error', 'error': 'No se pudieron extraer valores de laboratorio del contenido HTML'}
+        return
+    
+    with timer.stage('ai_interpretation'):
+        ai_data = interpreter.generate_ai_interpretation(html_content, patient_info, analyzed_values)
+    
+    abnormal = [value for value in analyzed_values if value.get('status') != 'normal']
+    with timer.stage('structuring'):
+        aggregates = interpreter.generate_aggregates(abnormal, ai_data)
+    yield {'type': 'interpretation', **aggregates['interpretation']}
+    yield {'type': 'urgency', **aggregates['urgency']}
+    yield {'type': 'recommendations', 'recommendations': aggregates['recommendations']}
+    yield {
+        'type': 'summary',
+        'success': True,
+        'summary': aggregates['summary'],
+        'analysis_confidence': aggregates['analysis_confidence'],
+        'total_values': len(analyzed_values),
+        'abnormal_count': len(abnormal),
+        'important_note': IMPORTANT_NOTE,
+        'patient_info': patient_info,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def wants_critical_fast_path(data):
+    """Vía rápida crítica pedida en el cuerpo o con ?critical_fast_path=1"""
+    flag = data.get('critical_fast_path', request.args.get('critical_fast_path', ''))
+    return flag is True or str(flag).lower() in ('1', 'true')
+
+def _guarded_stream(records):
+    """Cerrar el stream con un registro de error si el pipeline falla a mitad"""
+    # El stream se consume después de la vista: se fija ya la versión de la petición
+    knowledge_base = knowledge_store.current()
+    
+    def guarded():
+        with knowledge_store.pin(knowledge_base):
+            try:
+                yield from records
+            except Exception as e:
+                logger.exception('interpretation_failed', error=str(e))
+                yield {'type': 'error', 'error': 'Error interno del servidor'}
+    
+    return guarded()
+
+@bp.route('/api/medical-interpret', methods=['POST'])
 def medical_interpret():
     """Endpoint principal para interpretación médica"""
+    timer = metrics.request('interpret')
+    with timer.stage('total'):
+        return _medical_interpret(timer)
+
+def _medical_interpret(timer):
     try:
-        data = request.get_json()
+        data = read_json(request)
         
         if not data or 'html_content' not in data:
             return jsonify({'error': 'Contenido HTML requerido'}), 400
@@ -511,61 +664,185 @@ def medical_interpret():
         html_content = data['html_content']
         patient_info = data.get('patient_info', {})
         
-        logger.info(f"Interpretando resultados para paciente: {patient_info.get('age', 'N/A')} años")
+        error = observed_at_error(patient_info)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Modo streaming (NDJSON): sin caché, instantáneas ni historial
+        if wants_ndjson(request):
+            return ndjson_response(_guarded_stream(stream_interpretation(html_content, patient_info, timer)))
+        
+        with timer.stage('cache_lookup'):
+            cache_key = make_key(html_content, patient_info, interpreter.knowledge_version)
+            cached = result_cache.get(cache_key)
+        if cached is not None:
+            return json_response(cached, headers={'X-Cache': 'HIT'})
         
         # Extraer valores de laboratorio
-        lab_values = interpreter.extract_lab_values(html_content)
+        with timer.stage('extraction'):
+            lab_values = interpreter.extract_lab_values(html_content)
         
         if not lab_values:
             return jsonify({
                 'error': 'No se pudieron extraer valores de laboratorio del contenido HTML'
             }), 400
         
-        # Analizar valores
-        analyzed_values, alerts = interpreter.analyze_values(lab_values, patient_info)
+        # Valores críticos antes del análisis completo y de la llamada a la IA
+        with timer.stage('prescreen'):
+            critical_alert = interpreter.critical_prescreen(lab_values)
+        if critical_alert is not None and wants_critical_fast_path(data):
+            # Vía rápida: respuesta parcial inmediata, no se guarda en caché
+            logger.warning('critical_fast_path', findings=len(critical_alert['findings']))
+            return json_response({
+                'success': True,
+                'critical_fast_path': True,
+                'critical_alert': critical_alert,
+                'patient_info': patient_info,
+                'model_used': MODEL_USED,
+                'knowledge_version': interpreter.knowledge_version,
+                'timestamp': datetime.now().isoformat()
+            })
         
-        # Generar interpretación estructurada
-        ai_response = interpreter.generate_ai_interpretation(html_content, patient_info, analyzed_values)
+        # Edición de un informe ya interpretado: reutilizar las filas que no cambiaron
+        previous = snapshots.get(data.get('previous_result_id'))
+        if previous is not None and previous.knowledge_version != interpreter.knowledge_version:
+            previous = None
         
-        # Parsear respuesta JSON
+        priority = PRIORITY_CRITICAL if critical_alert is not None else PRIORITY_ROUTINE
         try:
-            ai_data = json.loads(ai_response)
-        except json.JSONDecodeError:
-            logger.error("Error al parsear JSON de interpretación")
-            return jsonify({'error': 'Error en la interpretación médica'}), 500
+            with admission.admit(priority):
+                structured_response, analyzed_values, alerts = _interpret_values(
+                    html_content, patient_info, lab_values, previous, timer
+                )
+        except GateTimeout:
+            logger.warning('admission_timeout')
+            return jsonify({'error': 'Servicio saturado, reintente en unos segundos'}), 503
+        structured_response['data']['critical_alert'] = critical_alert
+        
+        # Registrar en el historial del paciente si viene patient_id
+        patient_id = patient_info.get('patient_id') if isinstance(patient_info, dict) else None
+        if patient_id and lab_history.enabled:
+            with timer.stage('history'):
+                record_history(str(patient_id), patient_info, lab_values, analyzed_values,
+                               structured_response['data']['urgency']['level'])
+        
+        # Única serialización de toda la respuesta
+        with timer.stage('encoding'):
+            body = dumps(structured_response)
+        result_cache.put(cache_key, body)
+        
+        logger.info('interpretation_completed', values=len(analyzed_values), alerts=len(alerts))
+        return json_response(body, headers={'X-Cache': 'MISS'})
         
-        # Generar respuesta estructurada con nuevo formato
+    except Exception as e:
+        logger.exception('interpretation_failed', error=str(e))
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+def _interpret_values(html_content, patient_info, lab_values, previous, timer):
+    """
+    Análisis, interpretación (IA o respaldo) y estructuración; es la parte que
+    pasa por la admisión por prioridad. Devuelve (respuesta, valores analizados, alertas).
+    """
+    # Analizar valores
+    with timer.stage('analysis'):
+        if previous is not None:
+            rows, analyzed_rows, reanalyzed = reanalyze(previous, lab_values, interpreter.analyze_rows)
+        else:
+            rows = [row_key(value) for value in lab_values]
+            analyzed_rows = interpreter.analyze_rows(lab_values)
+        analyzed_values = [analyzed for analyzed, _ in analyzed_rows]
+        alerts = [alert for _, alert in analyzed_rows if alert is not None]
+    
+    # Generar interpretación estructurada (objeto en memoria, sin serializar);
+    # depende de los valores mismos, así que solo se reutiliza si no cambió ninguno
+    signature = findings_signature(analyzed_values, INTERPRETATION_FIELDS)
+    if previous is not None and previous.signature == signature and previous.patient_info == patient_info:
+        ai_data = previous.aggregates
+    else:
+        with timer.stage('ai_interpretation'):
+            ai_data = interpreter.generate_ai_interpretation(html_content, patient_info, analyzed_values)
+    
+    if previous is not None:
+        logger.info('incremental_interpretation', reanalyzed=reanalyzed, total=len(analyzed_values),
+                    interpretation_reused=ai_data is previous.aggregates)
+    
+    # Generar respuesta estructurada con nuevo formato
+    with timer.stage('structuring'):
         structured_response = interpreter.generate_structured_response(
             analyzed_values, 
             patient_info, 
             ai_data
         )
-        
-        logger.info(f"Interpretación completada: {len(analyzed_values)} valores analizados")
-        return jsonify(structured_response)
-        
-    except Exception as e:
-        logger.error(f"Error en interpretación médica: {e}")
-        return jsonify({'error': 'Error interno del servidor'}), 500
+        structured_response['result_id'] = snapshots.put(Snapshot(
+            interpreter.knowledge_version, patient_info, rows, analyzed_rows, signature, ai_data
+        ))
+    
+    return structured_response, analyzed_values, alerts
 
-@app.route('/api/medical-interpret/health', methods=['GET'])
+@bp.route('/api/medical-interpret/health', methods=['GET'])
 def health_check():
     """Endpoint de salud del servicio"""
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'openai_configured': bool(OPENAI_API_KEY),
-        'gemini_configured': bool(GEMINI_API_KEY)
+        'gemini_configured': bool(GEMINI_API_KEY),
+        'ai_providers': ai_client.status(),
+        'knowledge_version': interpreter.knowledge_version,
+        'knowledge': knowledge_store.status(),
+        'result_cache': result_cache.stats(),
+        'snapshots': snapshots.stats(),
+        'lab_history': lab_history.status(),
+        'admission': admission.status()
     })
 
-@app.route('/api/medical-interpret/ranges', methods=['GET'])
+@bp.route('/api/medical-interpret/ranges', methods=['GET'])
 def get_normal_ranges():
     """Obtener rangos normales de laboratorio"""
-    return jsonify(interpreter.normal_ranges)
+    return jsonify({name: dict(reference) for name, reference in interpreter.normal_ranges.items()})
 
-if __name__ == '__main__':
-    # Verificar configuración
-    if not OPENAI_API_KEY and not GEMINI_API_KEY:
-        logger.warning("No hay APIs de IA configuradas. Se usará interpretación básica.")
+@bp.route('/api/medical-interpret/knowledge/reload', methods=['POST'])
+def reload_knowledge():
+    """
+    Recargar la base de conocimiento desde su archivo sin reiniciar el worker.
+    Solo recarga el proceso que atiende la petición: los demás workers (y el
+    pool de lotes) la cargan al revisar el archivo cada KNOWLEDGE_RELOAD_INTERVAL_S.
+    """
+    if not knowledge_store.reload_enabled:
+        return jsonify({'error': 'Recarga por endpoint deshabilitada'}), 404
+    if not knowledge_store.authorized(request.headers.get('X-Reload-Token')):
+        return jsonify({'error': 'Token de recarga inválido'}), 403
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    try:
+        knowledge_store.reload()
+    except (OSError, ValueError) as e:
+        # Se conserva la versión vigente
+        return jsonify({'error': f'Base de conocimiento inválida: {e}', 'knowledge': knowledge_store.status()}), 422
+    return jsonify({'success': True, 'knowledge': knowledge_store.status()})
+
+@bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Histogramas de latencia por etapa en formato Prometheus"""
+    return Response(metrics.render_prometheus(), content_type=METRICS_CONTENT_TYPE)
+
+def create_app():
+    """Fábrica de la aplicación Flask (usada por serve.py y por el servidor de desarrollo)"""
+    app = Flask(__name__)
+    CORS(app)  # Permitir CORS para el frontend
+    init_request_logging(app)
+    knowledge_store.init_app(app)
+    http_compression.init_app(app)
+    app.register_blueprint(bp)
+    logger.info('service_started', service='medical-interpret', knowledge_version=interpreter.knowledge_version,
+                ai_providers=[provider.name for provider in ai_client.providers])
+    if not OPENAI_API_KEY and not GEMINI_API_KEY:
+        logger.warning('ai_not_configured', detail='Se usará interpretación básica')
+    return app
+
+app = create_app()
+
+if __name__ == '__main__':
+    # Servidor de desarrollo; en producción usar serve.py
+    debug = os.getenv('FLASK_DEBUG', 'False').lower() in ('1', 'true')
+    use_reloader = os.getenv('FLASK_RELOADER', 'False').lower() in ('1', 'true')
+    app.run(debug=debug, use_reloader=use_reloader, host='0.0.0.0', port=5000)
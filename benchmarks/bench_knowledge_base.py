@@ -0,0 +1,89 @@
+"""
+Microbenchmark: coste por valor de las consultas a la base de conocimiento
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Compara las consultas anteriores (diccionarios literales reconstruidos en cada
+llamada) con las tablas compiladas de medical_knowledge.KnowledgeBase.
+
+    python benchmarks/bench_knowledge_base.py [--iterations 200000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from medical_knowledge import (  # noqa: E402
+    DISEASE_NAMES, EXPLANATIONS, KNOWLEDGE_BASE, NORMALIZATIONS, UNIT_PATTERNS
+)
+
+# Implementación anterior: el literal se construye en cada llamada, igual que antes
+_LEGACY_SOURCE = f'''
+def normalize_test_name(name):
+    return {NORMALIZATIONS!r}.get(name, name)
+
+def extract_unit(range_text):
+    for unit, patterns in {UNIT_PATTERNS!r}.items():
+        if any(pattern in range_text for pattern in patterns):
+            return unit
+    return ''
+
+def generate_significance(test_name, status):
+    return {EXPLANATIONS!r}.get(test_name, {{}}).get(
+        status, f'Valor {{status}} fuera del rango normal. Requiere evaluación médica especializada.')
+
+def get_disease_name(disease):
+    return {DISEASE_NAMES!r}.get(disease, disease)
+'''
+legacy = {}
+exec(_LEGACY_SOURCE, legacy)
+
+# Muestra representativa: (nombre crudo, rango, estado, enfermedad)
+SAMPLE = [
+    ('GLUCOSA EN AYUNAS', '70-100 mg/dl', 'elevado', 'DIABETES'),
+    ('HB', '12-16 g/dl', 'bajo', 'ANEMIA'),
+    ('CREATININA', '0.6-1.2 mg/dl', 'elevado', 'INSUFICIENCIA_RENAL'),
+    ('TSH', '0.4-4.0 mUI/L', 'bajo', 'HIPOTIROIDISMO'),
+    ('TROPONINA', '0-0.04 ng/ml', 'elevado', 'INFARTO_MIOCARDIO'),
+    ('FERRITINA', '', 'elevado', 'OTRA')
+]
+
+
+def run_legacy():
+    for name, range_text, status, disease in SAMPLE:
+        code = legacy['normalize_test_name'](name)
+        legacy['extract_unit'](range_text)
+        legacy['generate_significance'](code, status)
+        legacy['get_disease_name'](disease)
+
+
+def run_compiled(kb=KNOWLEDGE_BASE):
+    for name, range_text, status, disease in SAMPLE:
+        code = kb.normalize_test_name(name)
+        kb.extract_unit(range_text)
+        kb.significance(code, status)
+        kb.disease_name(disease)
+
+
+def per_value_ns(func, iterations):
+    best = min(timeit.repeat(func, number=iterations, repeat=5))
+    return best / (iterations * len(SAMPLE)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    before = per_value_ns(run_legacy, args.iterations)
+    after = per_value_ns(run_compiled, args.iterations)
+
+    print(f'antes (literales por llamada): {before:8.1f} ns/valor')
+    print(f'después (tablas compiladas):   {after:8.1f} ns/valor')
+    print(f'mejora: {before / after:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Benchmarks de extracción, análisis y petición completa de ambos backends
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Mide latencia (p50/p95/p99), throughput y asignaciones de memoria sobre un
+corpus sintético y guarda los resultados en JSON para comparar ejecuciones.
+
+    python benchmarks/run_benchmarks.py                       # todos los perfiles
+    python benchmarks/run_benchmarks.py --profiles large --iterations 50
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/anterior.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic_reports import CORPUS_PROFILES, generate_corpus  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def measure(name, profile, corpus, func, iterations, alloc_iterations=5):
+    """Ejecutar func(html, patient_info) sobre el corpus y resumir la latencia"""
+    # Calentamiento: cachés de nombres, unidades y JIT de regex
+    for html, patient_info in corpus[:2]:
+        func(html, patient_info)
+
+    samples = []
+    for iteration in range(iterations):
+        html, patient_info = corpus[iteration % len(corpus)]
+        started = time.perf_counter_ns()
+        func(html, patient_info)
+        samples.append(time.perf_counter_ns() - started)
+    samples.sort()
+
+    # Asignaciones en una pasada aparte: tracemalloc distorsiona la latencia
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for iteration in range(alloc_iterations):
+        html, patient_info = corpus[iteration % len(corpus)]
+        func(html, patient_info)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total_seconds = sum(samples) / 1e9
+    return {
+        'benchmark': name,
+        'profile': profile,
+        'iterations': iterations,
+        'document_bytes': sum(len(html) for html, _ in corpus) // len(corpus),
+        'p50_us': round(percentile(samples, 0.50) / 1000, 2),
+        'p95_us': round(percentile(samples, 0.95) / 1000, 2),
+        'p99_us': round(percentile(samples, 0.99) / 1000, 2),
+        'mean_us': round(total_seconds / iterations * 1e6, 2),
+        'throughput_per_s': round(iterations / total_seconds, 1) if total_seconds else None,
+        'peak_alloc_kb': round((peak - before) / 1024, 1)
+    }
+
+
+def build_benchmarks():
+    """(nombre, función) de cada benchmark; las cachés de resultados se desactivan"""
+    import backend_medical_ai
+    import backend_medical_api
+
+    backend_medical_ai.result_cache.max_bytes = 0
+    backend_medical_api.result_cache.max_bytes = 0
+    medical_ai = backend_medical_ai.medical_ai
+    interpreter = backend_medical_api.interpreter
+    ai_client = backend_medical_ai.app.test_client()
+    api_client = backend_medical_api.app.test_client()
+
+    def ai_analysis(html, patient_info):
+        medical_ai.analyze_values(medical_ai.extract_lab_values(html), patient_info)
+
+    def api_analysis(html, patient_info):
+        interpreter.analyze_values(interpreter.extract_lab_values(html), patient_info)
+
+    def ai_request(html, patient_info):
+        response = ai_client.post('/api/medical-ai/analyze', json={'html_content': html, 'patient_info': patient_info})
+        assert response.status_code in (200, 400), response.status_code
+
+    def api_request(html, patient_info):
+        response = api_client.post('/api/medical-interpret', json={'html_content': html, 'patient_info': patient_info})
+        assert response.status_code in (200, 400), response.status_code
+
+    return [
+        ('medical_ai.extract', lambda html, patient_info: medical_ai.extract_lab_values(html)),
+        ('medical_ai.extract_analyze', ai_analysis),
+        ('medical_ai.request', ai_request),
+        ('medical_interpret.extract', lambda html, patient_info: interpreter.extract_lab_values(html)),
+        ('medical_interpret.extract_analyze', api_analysis),
+        ('medical_interpret.request', api_request)
+    ]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results, baseline=None):
+    previous = {(r['benchmark'], r['profile']): r for r in (baseline or {}).get('results', [])}
+    header = f"{'benchmark':36} {'perfil':7} {'p50 µs':>10} {'p95 µs':>10} {'p99 µs':>10} {'ops/s':>9} {'pico KB':>9}"
+    if previous:
+        header += f" {'Δp50':>8}"
+    print(header)
+    for r in results:
+        line = (f"{r['benchmark']:36} {r['profile']:7} {r['p50_us']:>10} {r['p95_us']:>10} "
+                f"{r['p99_us']:>10} {r['throughput_per_s']:>9} {r['peak_alloc_kb']:>9}")
+        before = previous.get((r['benchmark'], r['profile']))
+        if before and before['p50_us']:
+            line += f" {(r['p50_us'] / before['p50_us'] - 1) * 100:>+7.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks de los backends médicos')
+    parser.add_argument('--profiles', nargs='+', choices=sorted(CORPUS_PROFILES), default=['small', 'medium', 'large'])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--corpus-size', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--filter', default='', help='ejecutar solo benchmarks cuyo nombre contenga este texto')
+    parser.add_argument('--output', default=None, help='archivo JSON de salida (por defecto benchmarks/results/<fecha>.json)')
+    parser.add_argument('--compare', default=None, help='resultados anteriores para comparar')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    benchmarks = [(name, func) for name, func in build_benchmarks() if args.filter in name]
+
+    results = []
+    for profile in args.profiles:
+        corpus = generate_corpus(profile, args.corpus_size, seed=args.seed)
+        iterations = max(10, args.iterations // (5 if profile == 'large' else 1))
+        for name, func in benchmarks:
+            results.append(measure(name, profile, corpus, func, iterations))
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': args.seed,
+            'corpus_size': args.corpus_size
+        },
+        'results': results
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, indent=2, ensure_ascii=False)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as handle:
+            baseline = json.load(handle)
+
+    print_table(results, baseline)
+    print(f'\nResultados guardados en {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Generador de informes de laboratorio sintéticos
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Produce HTML parecido al de los informes convertidos desde Word: tablas con
+estilos mso, párrafos "NOMBRE: valor (rango)", espacios duros, comentarios
+condicionales e imágenes en base64. Los exámenes salen de los rangos de
+referencia de ambos backends, con nombres en español y sus variantes.
+"""
+
+import base64
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from medical_knowledge import MEDICAL_KNOWLEDGE  # noqa: E402
+
+# Nombres en español por código (incluye los que usa MedicalInterpreter.normal_ranges)
+TEST_NAMES = {
+    'GLUCOSA': ['GLUCOSA', 'Glucosa', 'Glucosa en ayunas', 'GLUCOSA BASAL'],
+    'COLESTEROL_TOTAL': ['COLESTEROL TOTAL', 'Colesterol total', 'colesterol_total'],
+    'HDL': ['HDL', 'Colesterol HDL', 'hdl_colesterol'],
+    'LDL': ['LDL', 'Colesterol LDL', 'ldl_colesterol'],
+    'TRIGLICERIDOS': ['TRIGLICERIDOS', 'Triglicéridos', 'trigliceridos'],
+    'HEMOGLOBINA': ['HEMOGLOBINA', 'Hemoglobina', 'HB'],
+    'HEMATOCRITO': ['HEMATOCRITO', 'Hematocrito', 'HTO'],
+    'LEUCOCITOS': ['LEUCOCITOS', 'Leucocitos', 'WBC'],
+    'CREATININA': ['CREATININA', 'Creatinina'],
+    'UREA': ['UREA', 'Urea', 'BUN'],
+    'BILIRRUBINA': ['BILIRRUBINA', 'Bilirrubina total', 'bilirrubina_total'],
+    'TSH': ['TSH', 'Tsh'],
+    'T3': ['T3'],
+    'T4': ['T4', 'T4 libre'],
+    'CK_MB': ['CK-MB', 'Ck-Mb'],
+    'TROPONINA': ['TROPONINA', 'Troponina I']
+}
+
+# Tamaños de referencia: (número de exámenes, kilobytes aproximados de ruido)
+CORPUS_PROFILES = {
+    'small': (8, 4),
+    'medium': (40, 64),
+    'large': (200, 400)
+}
+
+_WORD_STYLE = (
+    'style="border:solid windowtext 1.0pt;mso-border-alt:solid windowtext .5pt;'
+    'padding:0cm 5.4pt 0cm 5.4pt;mso-yfti-irow:{row}"'
+)
+
+
+def _sample_value(reference, rng):
+    """Valor normal la mayor parte de las veces, a veces anormal o crítico"""
+    low, high = reference['min'], reference['max']
+    roll = rng.random()
+    if roll < 0.7:
+        value = rng.uniform(low, high)
+    elif roll < 0.85:
+        value = rng.uniform(high, high * 1.5 + 1)
+    elif roll < 0.95:
+        value = rng.uniform(low * 0.5, low) if low else rng.uniform(high, high * 2)
+    else:
+        value = reference['critical']['high'] * rng.uniform(1.0, 1.5)
+    decimals = 0 if high >= 100 else 2
+    return round(value, decimals)
+
+
+def _format_value(value, rng):
+    text = f'{value:g}'
+    return text.replace('.', ',') if rng.random() < 0.2 else text
+
+
+def _table_row(index, name, value, reference, rng):
+    style = _WORD_STYLE.format(row=index)
+    cells = [
+        f'<span style="font-size:10.0pt;font-family:Arial">{name}</span>',
+        f'<span lang=ES>{value}</span>',
+        reference['unit'],
+        f"{reference['min']} - {reference['max']}"
+    ]
+    return '<tr>' + ''.join(
+        f'<td width=150 {style}><p class=MsoNormal>{cell}<o:p></o:p></p></td>' for cell in cells
+    ) + '</tr>'
+
+
+def _paragraph(name, value, reference, rng):
+    form = rng.randrange(3)
+    if form == 0:
+        text = f"{name}: {value} ({reference['min']}-{reference['max']} {reference['unit']})"
+    elif form == 1:
+        text = f'{name} = {value}'
+    else:
+        text = f"{name} {value} {reference['unit']}"
+    return f'<p class=MsoNormal><span style="font-family:Arial">{text.replace(" ", "&nbsp;", 1)}</span></p>'
+
+
+def _noise(kilobytes, rng):
+    """Estilos, comentarios condicionales e imagen embebida"""
+    if kilobytes <= 0:
+        return '', ''
+    style = '<style>' + ''.join(
+        f'p.MsoNormal{i}, li.MsoNormal{i} {{margin:0cm;font-size:11.0pt;font-family:"Calibri",sans-serif}}\n'
+        for i in range(kilobytes * 4)
+    ) + '</style><!--[if gte mso 9]><xml><o:OfficeDocumentSettings><o:AllowPNG/></o:OfficeDocumentSettings></xml><![endif]-->'
+    image = base64.b64encode(rng.randbytes(kilobytes * 512)).decode('ascii')
+    return style, f'<p><img width=120 src="data:image/png;base64,{image}"></p>'
+
+
+def generate_report(test_count=40, noise_kb=64, seed=0, table_ratio=0.7):
+    """Un informe HTML sintético; devuelve (html, patient_info)"""
+    rng = random.Random(seed)
+    ranges = MEDICAL_KNOWLEDGE['reference_ranges']
+    codes = list(ranges)
+
+    rows, paragraphs = [], []
+    for index in range(test_count):
+        code = rng.choice(codes)
+        reference = ranges[code]
+        name = rng.choice(TEST_NAMES[code])
+        value = _format_value(_sample_value(reference, rng), rng)
+        if rng.random() < table_ratio:
+            rows.append(_table_row(index, name, value, reference, rng))
+        else:
+            paragraphs.append(_paragraph(name, value, reference, rng))
+
+    style, image = _noise(noise_kb, rng)
+    age = rng.randint(1, 95)
+    gender = rng.choice(['M', 'F'])
+    html = (
+        f'<html xmlns:o="urn:schemas-microsoft-com:office:office"><head><meta charset="utf-8">{style}</head>'
+        f'<body lang=ES><div class=WordSection1>'
+        f'<p class=MsoNormal><b>Laboratorio Esperanza</b></p>'
+        f'<p class=MsoNormal>Paciente de {age} años, sexo {gender}</p>{image}'
+        f'<table class=MsoTableGrid border=1 cellspacing=0 cellpadding=0>'
+        f'<tr><th>Examen</th><th>Resultado</th><th>Unidades</th><th>Valores de referencia</th></tr>'
+        f'{"".join(rows)}</table>{"".join(paragraphs)}</div></body></html>'
+    )
+    return html, {'age': age, 'gender': gender}
+
+
+def generate_corpus(profile='medium', count=20, seed=0):
+    """Lista de informes para un perfil de tamaño de CORPUS_PROFILES"""
+    test_count, noise_kb = CORPUS_PROFILES[profile]
+    return [generate_report(test_count, noise_kb, seed=seed + index) for index in range(count)]
+
+
+if __name__ == '__main__':
+    html, patient_info = generate_report()
+    sys.stdout.write(html)
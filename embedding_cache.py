@@ -0,0 +1,197 @@
+"""
+Caché de embeddings de paneles de laboratorio
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+La mayoría de los paneles son las mismas combinaciones de exámenes con valores
+en bandas estrechas. La clave es el panel canónico: códigos de examen
+ordenados y cada valor cuantizado en bandas de su rango de referencia, de modo
+que dos paneles casi idénticos comparten embedding.
+
+Dos niveles: un LRU en memoria y, opcionalmente, un archivo .npy mapeado en
+memoria (EMBEDDING_CACHE_DIR) con ranuras de asignación directa que comparten
+los workers y sobrevive a reinicios.
+"""
+
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from result_cache import fingerprint
+
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '4096'))
+# Bandas por ancho del rango de referencia (20 = bandas del 5 % del rango)
+EMBEDDING_CACHE_BINS = int(os.getenv('EMBEDDING_CACHE_BINS', '20'))
+# Directorio del nivel en disco (vacío = solo memoria)
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', '')
+EMBEDDING_CACHE_DISK_SLOTS = int(os.getenv('EMBEDDING_CACHE_DISK_SLOTS', '65536'))
+
+# Cifras significativas para valores de exámenes sin rango de referencia
+UNKNOWN_VALUE_DIGITS = 2
+
+_EMPTY_DIGEST = bytes(16)
+
+
+def value_bin(value, reference, bins=EMBEDDING_CACHE_BINS):
+    """Banda del valor dentro de su rango de referencia (o el valor redondeado si no hay rango)"""
+    if reference is None:
+        return float(f'{value:.{UNKNOWN_VALUE_DIGITS}g}')
+    width = (reference['max'] - reference['min']) or 1.0
+    # El rango de referencia forma parte de la clave: si cambia, cambian los embeddings
+    return reference['min'], reference['max'], int(np.floor((value - reference['min']) / width * bins))
+
+
+def panel_key(codes, values, reference_ranges, bins=EMBEDDING_CACHE_BINS):
+    """Clave canónica de un panel: (código, banda) ordenados por código"""
+    return tuple(sorted(
+        (code, value_bin(value, reference_ranges.get(code), bins)) for code, value in zip(codes, values)
+    ))
+
+
+class EmbeddingCache:
+    """LRU de embeddings en memoria con un segundo nivel opcional en disco"""
+
+    def __init__(self, namespace, max_entries=EMBEDDING_CACHE_MAX_ENTRIES, directory=EMBEDDING_CACHE_DIR,
+                 disk_slots=EMBEDDING_CACHE_DISK_SLOTS):
+        # namespace identifica modelo y runtime: sus embeddings no son intercambiables
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.directory = directory
+        self.disk_slots = disk_slots
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_pid = None
+        # Dimensión de los embeddings: la del último put (o la del archivo en disco)
+        self.dim = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _digest(self, key):
+        return hashlib.blake2b(repr((self.namespace, key)).encode('utf-8'), digest_size=16).digest()
+
+    def _disk_prefix(self):
+        return os.path.join(self.directory, f'embeddings-{fingerprint(self.namespace)}')
+
+    def _disk_path(self, dim):
+        return f'{self._disk_prefix()}-{dim}.npy'
+
+    def _open_disk(self, create=False):
+        """
+        Mapear el archivo de ranuras de la dimensión vigente (creándolo si
+        `create`). Sin dimensión conocida solo se usa un archivo si no hay otro
+        con el que confundirlo.
+        """
+        if not self.directory:
+            return None
+        if (self._disk is not None and self._disk_pid == os.getpid()
+                and self._disk.dtype['vector'].shape == (self.dim,)):
+            return self._disk
+
+        if self.dim is None:
+            existing = glob.glob(f'{self._disk_prefix()}-*.npy')
+            if len(existing) != 1:
+                return None
+            path = existing[0]
+        else:
+            path = self._disk_path(self.dim)
+            if not os.path.exists(path):
+                if not create:
+                    return None
+                self._create_disk(path)
+        self._disk = np.load(path, mmap_mode='r+')
+        self._disk_pid = os.getpid()
+        self.dim = self._disk.dtype['vector'].shape[0]
+        return self._disk
+
+    def _create_disk(self, path):
+        os.makedirs(self.directory, exist_ok=True)
+        dtype = np.dtype([('digest', 'V16'), ('vector', np.float32, (self.dim,))])
+        temporary = f'{path}.{os.getpid()}.tmp'
+        np.lib.format.open_memmap(temporary, mode='w+', dtype=dtype, shape=(self.disk_slots,)).flush()
+        try:
+            # link() no sobrescribe: si otro worker lo creó a la vez, se usa el suyo
+            os.link(temporary, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary)
+
+    def _slot(self, digest, disk):
+        return int.from_bytes(digest[:8], 'little') % len(disk)
+
+    def get(self, key):
+        """Embedding del panel o None (un vector de otra dimensión cuenta como fallo)"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None and vector.shape == (self.dim,):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            disk = self._open_disk()
+            if disk is not None:
+                digest = self._digest(key)
+                record = disk[self._slot(digest, disk)]
+                if bytes(record['digest']) == digest and record['vector'].shape == (self.dim,):
+                    vector = np.array(record['vector'])
+                    # Otro worker pudo reescribir la ranura mientras se copiaba
+                    if bytes(record['digest']) == digest:
+                        self._remember(key, vector)
+                        self.disk_hits += 1
+                        return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, key, vector):
+        if not self.enabled:
+            return
+
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if vector.shape != (self.dim,):
+                # Primera dimensión conocida, o un modelo distinto con el mismo nombre: lo guardado no sirve
+                self._entries.clear()
+                self.dim = vector.shape[0]
+            self._remember(key, vector)
+            disk = self._open_disk(create=True)
+            if disk is not None:
+                digest = self._digest(key)
+                record = disk[self._slot(digest, disk)]
+                # Invalidar la ranura antes de escribir el vector y firmarla después
+                record['digest'] = _EMPTY_DIGEST
+                record['vector'] = vector
+                record['digest'] = digest
+
+    def _remember(self, key, vector):
+        vector.setflags(write=False)
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'disk': self._disk_path(self.dim) if self.directory and self.dim else None,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else None
+            }
@@ -0,0 +1,73 @@
+"""
+Serialización JSON en la frontera de respuesta
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Los pipelines trabajan con objetos en memoria y se serializan una sola vez
+aquí. Usa orjson si está instalado y json de la biblioteca estándar si no.
+En modo streaming cada registro se serializa y envía en cuanto está listo.
+"""
+
+import json
+
+from flask import Response, stream_with_context
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+ENCODER = 'orjson' if orjson is not None else 'json'
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def dumps(payload):
+    """Serializar a bytes UTF-8"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(body):
+    """Deserializar bytes o texto JSON"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def read_json(request):
+    """
+    Cuerpo JSON de la petición, o None si no es JSON o no es válido. Lee el
+    cuerpo una sola vez sin guardarlo y lo deserializa con loads().
+    """
+    if not request.is_json:
+        return None
+    try:
+        return loads(request.get_data(cache=False))
+    except ValueError:
+        return None
+
+
+def json_response(payload, status=200, headers=None):
+    """Respuesta Flask con el payload serializado (o ya serializado si son bytes)"""
+    body = payload if isinstance(payload, bytes) else dumps(payload)
+    return Response(body, status=status, mimetype='application/json', headers=headers)
+
+
+def wants_ndjson(request):
+    """El cliente pide la respuesta en streaming (?stream=1 o Accept: application/x-ndjson)"""
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def ndjson_response(records, status=200, headers=None):
+    """Respuesta en streaming: un objeto JSON por línea a medida que se generan"""
+    def generate():
+        for record in records:
+            yield dumps(record) + b'\n'
+
+    headers = dict(headers or {})
+    # Evitar que un proxy (nginx) acumule la respuesta antes de enviarla
+    headers.setdefault('X-Accel-Buffering', 'no')
+    return Response(stream_with_context(generate()), status=status, mimetype=NDJSON_MIMETYPE, headers=headers)
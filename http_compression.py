@@ -0,0 +1,279 @@
+"""
+Límites de tamaño y compresión HTTP de los backends
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+- Peticiones: un cuerpo mayor que MAX_REQUEST_BYTES se rechaza con 413 antes
+  de leerlo (por Content-Length) o en cuanto lo supera (cuerpos sin
+  longitud). Los cuerpos con Content-Encoding gzip/deflate (y br si la
+  versión de brotli permite limitar la salida) se descomprimen por bloques,
+  con MAX_DECOMPRESSED_BYTES como tope del resultado (protege de bombas de
+  compresión).
+- Respuestas: JSON, NDJSON y texto se comprimen según Accept-Encoding (br si
+  está instalado brotli, si no gzip). Las respuestas en streaming se
+  comprimen bloque a bloque sin perder el streaming.
+
+Se aplica a una app con init_app(app) desde create_app.
+"""
+
+import io
+import os
+import zlib
+
+from fast_json import NDJSON_MIMETYPE, json_response
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+
+def _brotli_bounded():
+    """La versión instalada de brotli acepta output_buffer_limit (brotli >= 1.2)"""
+    try:
+        brotli.Decompressor().process(b'', output_buffer_limit=1)
+    except TypeError:
+        return False
+    return True
+
+
+# Sin límite de salida, un bloque br pequeño puede inflarse a cientos de MB: no se acepta en peticiones
+BROTLI_REQUESTS = brotli is not None and _brotli_bounded()
+
+# Tamaño máximo del cuerpo tal como llega (comprimido o no)
+MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_BYTES', str(16 * 1024 * 1024)))
+# Tamaño máximo del cuerpo ya descomprimido
+MAX_DECOMPRESSED_BYTES = int(os.getenv('MAX_DECOMPRESSED_BYTES', str(64 * 1024 * 1024)))
+
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'true').lower() in ('1', 'true')
+# Respuestas más pequeñas no compensan la compresión
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+
+READ_CHUNK_BYTES = 64 * 1024
+
+COMPRESSIBLE_MIMETYPES = ('application/json', NDJSON_MIMETYPE)
+
+REQUEST_ENCODINGS = ('gzip', 'deflate', 'br') if BROTLI_REQUESTS else ('gzip', 'deflate')
+RESPONSE_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class BodyTooLarge(Exception):
+    """El cuerpo de la petición supera el límite configurado"""
+
+
+class TruncatedBody(Exception):
+    """El cuerpo comprimido termina antes del final del flujo"""
+
+
+def _decoder(encoding):
+    """
+    (decodificar, terminar): bloque comprimido -> bloque descomprimido, limitado
+    a `limit` bytes de salida; terminar() lanza TruncatedBody si el flujo no se cerró
+    """
+    if encoding == 'br':
+        decompressor = brotli.Decompressor()
+
+        def decode(chunk, limit):
+            # Con el límite alcanzado queda entrada sin procesar: el cuerpo excede el tope
+            data = decompressor.process(chunk, output_buffer_limit=limit + 1)
+            if len(data) > limit:
+                raise BodyTooLarge
+            return data
+
+        def finish():
+            if not decompressor.is_finished():
+                raise TruncatedBody
+
+        return decode, finish
+
+    # gzip (cabecera gzip) o deflate (cabecera zlib)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS)
+
+    def decode(chunk, limit):
+        # max_length evita inflar de golpe un bloque muy comprimido más allá del límite
+        data = decompressor.decompress(chunk, limit + 1)
+        if decompressor.unconsumed_tail and len(data) <= limit:
+            raise BodyTooLarge
+        return data
+
+    def finish():
+        # Sin el bloque final (y el CRC en gzip) el cuerpo llegó cortado
+        if not decompressor.eof:
+            raise TruncatedBody
+
+    return decode, finish
+
+
+def content_length(environ):
+    """Content-Length como entero, None si no viene; ValueError si no es un entero >= 0"""
+    value = environ.get('CONTENT_LENGTH', '').strip()
+    if not value:
+        return None
+    # isdigit: sin signo ni separadores '_' que int() sí aceptaría
+    if not value.isdigit():
+        raise ValueError(f'Content-Length inválido: {value}')
+    return int(value)
+
+
+def _body_chunks(environ, length, max_bytes):
+    """Bloques del cuerpo de la petición (de `length` bytes, o hasta el final si es None), sin pasar de max_bytes"""
+    stream = environ['wsgi.input']
+    if length:
+        remaining = length
+        if remaining > max_bytes:
+            raise BodyTooLarge
+        while remaining > 0:
+            chunk = stream.read(min(READ_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    elif environ.get('wsgi.input_terminated'):
+        # Transfer-Encoding: chunked, sin longitud conocida
+        total = 0
+        while True:
+            chunk = stream.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_bytes:
+                raise BodyTooLarge
+            yield chunk
+
+
+def read_body(environ, length=None, encoding=None, max_bytes=MAX_REQUEST_BYTES,
+              max_decompressed=MAX_DECOMPRESSED_BYTES):
+    """Cuerpo completo (descomprimido si `encoding`) respetando ambos límites; TruncatedBody si está cortado"""
+    decode, finish = _decoder(encoding) if encoding else (None, None)
+    body = io.BytesIO()
+    for chunk in _body_chunks(environ, length, max_bytes):
+        if decode is not None:
+            chunk = decode(chunk, max_decompressed - body.tell())
+        if body.tell() + len(chunk) > max_decompressed:
+            raise BodyTooLarge
+        body.write(chunk)
+    if finish is not None:
+        finish()
+    return body.getvalue()
+
+
+class RequestLimits:
+    """
+    Middleware WSGI: aplica los límites de tamaño y descomprime el cuerpo
+    antes de que Flask lo lea, así get_data()/get_json() ven JSON plano.
+    """
+
+    def __init__(self, wsgi_app, max_bytes=MAX_REQUEST_BYTES, max_decompressed=MAX_DECOMPRESSED_BYTES):
+        self.wsgi_app = wsgi_app
+        self.max_bytes = max_bytes
+        self.max_decompressed = max_decompressed
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding in ('', 'identity'):
+            encoding = None
+        elif encoding not in REQUEST_ENCODINGS:
+            return json_response({'error': f'Content-Encoding no soportado: {encoding}'}, 415)(environ, start_response)
+
+        try:
+            length = content_length(environ)
+        except ValueError:
+            return json_response({'error': 'Content-Length inválido'}, 400)(environ, start_response)
+
+        chunked = not length and environ.get('wsgi.input_terminated')
+        # Un cuerpo plano con longitud conocida no se toca: basta con revisar su tamaño
+        if encoding is not None or chunked or (length and length > self.max_bytes):
+            try:
+                body = read_body(environ, length, encoding, self.max_bytes, self.max_decompressed)
+            except BodyTooLarge:
+                return json_response({'error': 'Cuerpo de la petición demasiado grande'}, 413)(environ, start_response)
+            except TruncatedBody:
+                return json_response({'error': 'Cuerpo comprimido truncado'}, 400)(environ, start_response)
+            except (zlib.error, OSError, EOFError) + ((brotli.error,) if brotli is not None else ()):
+                return json_response({'error': 'Cuerpo comprimido inválido'}, 400)(environ, start_response)
+
+            environ['wsgi.input'] = io.BytesIO(body)
+            environ['CONTENT_LENGTH'] = str(len(body))
+            environ.pop('HTTP_CONTENT_ENCODING', None)
+            environ.pop('HTTP_TRANSFER_ENCODING', None)
+            environ['wsgi.input_terminated'] = False
+
+        return self.wsgi_app(environ, start_response)
+
+
+def _compressor(encoding):
+    """(comprimir bloque con vaciado, cerrar) para streaming"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return lambda chunk: compressor.process(chunk) + compressor.flush(), compressor.finish
+
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _compress_stream(chunks, encoding):
+    """Comprimir cada bloque y vaciarlo: el cliente recibe cada registro NDJSON al generarse"""
+    compress, finish = _compressor(encoding)
+    try:
+        for chunk in chunks:
+            if chunk:
+                yield compress(chunk)
+        yield finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress_response(response, request):
+    """Comprimir la respuesta si el cliente lo acepta y el contenido lo merece"""
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or response.direct_passthrough):
+        return response
+
+    mimetype = response.mimetype or ''
+    if mimetype not in COMPRESSIBLE_MIMETYPES and not mimetype.startswith('text/'):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(RESPONSE_ENCODINGS)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < RESPONSE_COMPRESSION_MIN_BYTES:
+            return response
+        response.set_data(_compress(data, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    """Límites de petición, descompresión y compresión de respuestas para una app Flask"""
+    from flask import request
+
+    # Segunda barrera de Werkzeug para lecturas que no pasen por el middleware
+    app.config['MAX_CONTENT_LENGTH'] = MAX_DECOMPRESSED_BYTES
+    app.wsgi_app = RequestLimits(app.wsgi_app)
+
+    @app.errorhandler(413)
+    def _payload_too_large(error):
+        return json_response({'error': 'Cuerpo de la petición demasiado grande'}, 413)
+
+    if RESPONSE_COMPRESSION:
+        @app.after_request
+        def _compress_response(response):
+            return compress_response(response, request)
@@ -0,0 +1,121 @@
+"""
+Reinterpretación incremental de informes editados
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Cada respuesta guarda una instantánea (filas extraídas, análisis por fila y
+agregados) bajo un result_id. Cuando el cliente reenvía el informe con
+previous_result_id, solo se reanalizan las filas que cambiaron y los
+agregados se reutilizan si el conjunto de hallazgos no cambió.
+
+Las instantáneas viven en memoria del proceso: si el result_id expiró o lo
+generó otro worker, la petición se resuelve con el análisis completo.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, namedtuple
+
+SNAPSHOT_MAX_ENTRIES = int(os.getenv('SNAPSHOT_MAX_ENTRIES', '2048'))
+SNAPSHOT_TTL_SECONDS = float(os.getenv('SNAPSHOT_TTL_SECONDS', '1800'))
+
+# rows: claves de fila; results: análisis por fila alineado con rows
+# signature: hallazgos de los que dependen los agregados; aggregates: etapas agregadas
+Snapshot = namedtuple('Snapshot', ['knowledge_version', 'patient_info', 'rows', 'results', 'signature', 'aggregates'])
+
+
+def row_key(value):
+    """Identidad de una fila extraída: cualquier cambio la vuelve a analizar"""
+    return tuple(sorted(value.items()))
+
+
+def findings_signature(analyzed_values, fields):
+    """Multiconjunto de hallazgos (p. ej. nombre, estado) sin depender del orden de filas"""
+    return tuple(sorted(tuple(value.get(field) for field in fields) for value in analyzed_values))
+
+
+def reanalyze(previous, values, analyze):
+    """
+    Reutilizar el análisis de las filas sin cambios de `previous`.
+
+    analyze(valores) devuelve una lista de resultados alineada con su entrada
+    y solo se llama con las filas nuevas o modificadas. Devuelve
+    (claves de fila, resultados, número de filas reanalizadas).
+    """
+    reusable = defaultdict(list)
+    for key, result in zip(previous.rows, previous.results):
+        reusable[key].append(result)
+
+    rows = [row_key(value) for value in values]
+    results = [None] * len(values)
+    changed = []
+    for index, key in enumerate(rows):
+        bucket = reusable.get(key)
+        if bucket:
+            results[index] = bucket.pop()
+        else:
+            changed.append(index)
+
+    if changed:
+        for index, result in zip(changed, analyze([values[index] for index in changed])):
+            results[index] = result
+
+    return rows, results, len(changed)
+
+
+class SnapshotStore:
+    """LRU de instantáneas por result_id con límite de entradas y TTL"""
+
+    def __init__(self, max_entries=SNAPSHOT_MAX_ENTRIES, ttl_seconds=SNAPSHOT_TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, result_id):
+        """Instantánea vigente o None"""
+        if not self.enabled or not result_id:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is None or entry[1] <= self._clock():
+                if entry is not None:
+                    del self._entries[result_id]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(result_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, snapshot):
+        """Guardar una instantánea y devolver su result_id (None si está deshabilitado)"""
+        if not self.enabled:
+            return None
+
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries[result_id] = (snapshot, self._clock() + self.ttl_seconds)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result_id
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,147 @@
+"""
+Exportación columnar de resultados interpretados (Arrow/Parquet)
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Vuelca el historial de lab_history.py a un archivo columnar por lotes, sin
+cargar el periodo completo en memoria: una fila por valor analizado con
+código de examen, valor, unidad, estado, nivel de preocupación, urgencia del
+informe, backend de origen y datos demográficos. El formato Arrow IPC se lee
+de vuelta con mmap sin copiar; Parquet ocupa menos y se descomprime al leer.
+
+Solo contiene lo que el historial guardó: informes con patient_id recibidos
+mientras LAB_HISTORY_DB estaba configurado. Las filas de /api/medical-interpret
+(source 'medical-interpret') llevan concern_level nulo.
+
+    python lab_export.py export --from 2024-05-01 --to 2024-06-01 --output mayo.arrow
+    python lab_export.py summary mayo.arrow --by test_code status
+
+Requiere pyarrow (dependencia opcional).
+"""
+
+import argparse
+import os
+import time
+
+from lab_history import LAB_HISTORY_DB, LabHistory
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - dependencia opcional
+    pa = None
+
+EXPORT_BATCH_ROWS = int(os.getenv('EXPORT_BATCH_ROWS', '65536'))
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError('pyarrow no está instalado: pip install pyarrow')
+
+
+def export_schema():
+    """Esquema de la exportación (una fila por valor analizado)"""
+    _require_pyarrow()
+    return pa.schema([
+        ('report_id', pa.string()),
+        ('source', pa.string()),
+        ('patient_id', pa.string()),
+        ('observed_at', pa.timestamp('s')),
+        ('test_code', pa.string()),
+        ('value', pa.float64()),
+        ('unit', pa.string()),
+        ('status', pa.string()),
+        ('concern_level', pa.string()),
+        ('urgency', pa.string()),
+        ('age', pa.int16()),
+        ('gender', pa.string())
+    ])
+
+
+def _record_batch(rows, schema):
+    arrays = [
+        pa.array(column, pa.string()).cast(field.type) if field.name == 'observed_at' else pa.array(column, field.type)
+        for field, column in zip(schema, zip(*rows))
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def export_history(output, start=None, end=None, history=None, batch_rows=EXPORT_BATCH_ROWS):
+    """
+    Exportar los valores observados en [start, end) a `output` (.arrow/.feather
+    para Arrow IPC, .parquet para Parquet). Devuelve el número de filas.
+    """
+    _require_pyarrow()
+    history = history or LabHistory()
+    schema = export_schema()
+
+    if output.endswith('.parquet'):
+        # Parquet codifica por diccionario las columnas repetitivas (código, unidad, estado)
+        writer = pq.ParquetWriter(output, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(output, schema)
+
+    total = 0
+    try:
+        for rows in history.iter_values(start, end, batch_rows):
+            writer.write_batch(_record_batch(rows, schema))
+            total += len(rows)
+    finally:
+        writer.close()
+    return total
+
+
+def open_export(path):
+    """Tabla de una exportación; los archivos Arrow se mapean en memoria sin copiar"""
+    _require_pyarrow()
+    if path.endswith('.parquet'):
+        return pq.read_table(path, memory_map=True)
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def summarize(table, by=('test_code', 'status')):
+    """Conteo, media, mínimo y máximo de value agrupado por las columnas dadas"""
+    return table.group_by(list(by)).aggregate([
+        ('value', 'count'),
+        ('value', 'mean'),
+        ('value', 'min'),
+        ('value', 'max')
+    ]).sort_by([(column, 'ascending') for column in by])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exportación columnar del historial de laboratorio')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help='exportar un periodo a Arrow/Parquet')
+    export.add_argument('--db', default=LAB_HISTORY_DB)
+    export.add_argument('--from', dest='start', default=None, help='fecha ISO inicial (incluida)')
+    export.add_argument('--to', dest='end', default=None, help='fecha ISO final (excluida)')
+    export.add_argument('--output', required=True, help='archivo .arrow o .parquet')
+
+    summary = commands.add_parser('summary', help='agregar una exportación')
+    summary.add_argument('path')
+    summary.add_argument('--by', nargs='+', default=['test_code', 'status'])
+
+    args = parser.parse_args()
+    if pa is None:
+        raise SystemExit('pyarrow no está instalado: pip install pyarrow')
+
+    if args.command == 'export':
+        if not args.db:
+            raise SystemExit('Historial no configurado: usar --db o LAB_HISTORY_DB')
+        if not os.path.exists(args.db):
+            raise SystemExit(f'No existe la base de historial {args.db}')
+        started = time.perf_counter()
+        rows = export_history(args.output, args.start, args.end, LabHistory(args.db))
+        print(f'{rows} valores exportados a {args.output} en {time.perf_counter() - started:.2f}s')
+    else:
+        table = summarize(open_export(args.path), args.by)
+        print('\t'.join(table.column_names))
+        for row in table.to_pylist():
+            print('\t'.join('' if value is None else f'{value:.4g}' if isinstance(value, float) else str(value)
+                            for value in row.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Motor de extracción de valores de laboratorio
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Compartido por backend_medical_ai.py y backend_medical_api.py. El HTML se
+convierte primero en filas de tabla y líneas de texto con un parser
+incremental; los patrones, compilados una sola vez al importar el módulo,
+se aplican después sobre ese texto en una única pasada.
+"""
+
+import re
+from collections import namedtuple
+
+from lxml import etree
+
+LabValue = namedtuple('LabValue', ['name', 'value', 'unit', 'reference_range', 'raw_text', 'span'])
+
+# Unidades reconocidas junto al valor (la más larga primero para que gane la alternancia)
+UNITS = ['mcg/dl', 'μg/dl', 'mg/dl', 'g/dl', 'mUI/L', 'iu/ml', 'ng/ml', 'ng/dl', 'pg/ml', 'u/l', '/mm³', '/mm3', '%']
+
+# Palabra de un nombre de examen: empieza por letra y admite dígitos y guiones (T3, CK-MB, HbA1c)
+_WORD = r'[^\W\d_][^\W_]*(?:-[^\W_]+)*'
+
+# Una sola alternancia que cubre los formatos "NOMBRE: 95 (70-100 mg/dl)", "NOMBRE = 95",
+# "NOMBRE - 95" y "NOMBRE 95 mg/dl". Sin separador, la unidad es obligatoria.
+LAB_VALUE_PATTERN = re.compile(
+    r'''
+    (?<![^\W_])                                 # inicio de palabra
+    (?P<name>{word}(?:[ \t]+{word})*)
+    (?:[ \t]*(?P<sep>[:=-])[ \t]*|[ \t]+)
+    (?P<value>\d+(?:[.,]\d+)?)
+    (?:[ \t]*(?P<unit>{units})(?![^\W_]))?
+    (?(sep)|(?(unit)|(?!)))                     # sin separador ni unidad no es un valor
+    (?:[ \t]*\((?P<range>[^()\n]*)\))?
+    '''.format(word=_WORD, units='|'.join(re.escape(unit) for unit in UNITS)),
+    re.IGNORECASE | re.VERBOSE
+)
+
+# Celdas de tabla: "95", "14,2 g/dl", "mg/dl" y rangos como "70 - 100" o "<200"
+CELL_VALUE_PATTERN = re.compile(
+    r'(?P<value>\d+(?:[.,]\d+)?)(?:\s*(?P<unit>{units}))?'.format(units='|'.join(re.escape(unit) for unit in UNITS)),
+    re.IGNORECASE
+)
+CELL_UNIT_PATTERN = re.compile('|'.join(re.escape(unit) for unit in UNITS), re.IGNORECASE)
+CELL_RANGE_PATTERN = re.compile(r'\d.*(?:-|a|hasta)\s*\d|[<>≤≥]\s*\d', re.IGNORECASE)
+
+# Elementos cuyo texto nunca contiene resultados
+SKIP_TAGS = frozenset(['head', 'script', 'style', 'noscript', 'template', 'svg'])
+
+# Elementos que cortan una línea de texto
+BLOCK_TAGS = frozenset([
+    'address', 'article', 'blockquote', 'body', 'br', 'caption', 'dd', 'div', 'dl', 'dt',
+    'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'html', 'li', 'ol', 'p',
+    'pre', 'section', 'table', 'tbody', 'tfoot', 'thead', 'ul'
+])
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_lab_values(text):
+    """Recorrer el texto una sola vez y generar cada valor encontrado
+
+    Las coincidencias de finditer no se solapan, por lo que cada tramo del
+    documento produce como máximo un valor.
+    """
+    for match in LAB_VALUE_PATTERN.finditer(text):
+        yield LabValue(
+            name=match.group('name').strip(),
+            value=float(match.group('value').replace(',', '.')),
+            unit=match.group('unit') or '',
+            reference_range=match.group('range') or '',
+            raw_text=match.group(0),
+            span=match.span()
+        )
+
+
+class _TextCollector:
+    """Destino del parser lxml: acumula filas de tabla y líneas de texto visibles"""
+
+    def __init__(self):
+        self.pending = []
+        self._skip_depth = 0
+        self._line = []
+        self._cells = None
+        self._cell = None
+
+    def start(self, tag, attrib):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == 'tr':
+            self._flush_line()
+            self._cells = []
+        elif tag in ('td', 'th'):
+            self._cell = []
+        elif tag in BLOCK_TAGS:
+            self._flush_line()
+
+    def end(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth -= 1
+        elif tag in ('td', 'th'):
+            if self._cell is not None and self._cells is not None:
+                self._cells.append(' '.join(''.join(self._cell).split()))
+            self._cell = None
+        elif tag == 'tr':
+            if self._cells:
+                self.pending.append(('row', [cell for cell in self._cells if cell]))
+            self._cells = None
+        elif tag in BLOCK_TAGS:
+            self._flush_line()
+
+    def data(self, data):
+        if self._skip_depth:
+            return
+        if self._cell is not None:
+            self._cell.append(data)
+        else:
+            self._line.append(data)
+
+    def close(self):
+        self._flush_line()
+
+    def _flush_line(self):
+        if self._line:
+            line = ' '.join(''.join(self._line).split())
+            if line:
+                self.pending.append(('line', line))
+            self._line = []
+
+
+def _row_values(cells):
+    """Interpretar una fila de tabla como (nombre, valor, unidad, rango)"""
+    for index, cell in enumerate(cells):
+        match = CELL_VALUE_PATTERN.fullmatch(cell)
+        if not match or index == 0:
+            continue
+        
+        names = [c for c in cells[:index] if any(ch.isalpha() for ch in c)]
+        if not names:
+            continue
+        
+        unit = match.group('unit') or ''
+        rest = cells[index + 1:]
+        if not unit and rest and CELL_UNIT_PATTERN.fullmatch(rest[0]):
+            unit = rest[0]
+            rest = rest[1:]
+        reference_range = next((c for c in rest if CELL_RANGE_PATTERN.search(c)), '')
+        
+        yield LabValue(
+            name=names[0],
+            value=float(match.group('value').replace(',', '.')),
+            unit=unit,
+            reference_range=reference_range,
+            raw_text=' | '.join(cells),
+            span=None
+        )
+        return
+    
+    # Fila sin celda numérica propia: puede contener "NOMBRE: valor" en una sola celda
+    yield from iter_lab_values(' '.join(cells))
+
+
+def _drain(collector):
+    pending, collector.pending = collector.pending, []
+    for kind, payload in pending:
+        if kind == 'row':
+            yield from _row_values(payload)
+        else:
+            yield from iter_lab_values(payload)
+
+
+def iter_lab_rows(html_content, chunk_size=CHUNK_SIZE):
+    """Convertir el HTML en filas de laboratorio de forma incremental
+
+    El parser recibe el documento por bloques; estilos, scripts e imágenes
+    embebidas nunca llegan a los patrones de extracción.
+    """
+    collector = _TextCollector()
+    parser = etree.HTMLParser(target=collector, remove_comments=True)
+    
+    for start in range(0, len(html_content), chunk_size):
+        parser.feed(html_content[start:start + chunk_size])
+        yield from _drain(collector)
+    
+    try:
+        parser.close()
+    except etree.XMLSyntaxError:
+        # Documento vacío o sin contenido parseable
+        collector.close()
+    yield from _drain(collector)
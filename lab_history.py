@@ -0,0 +1,328 @@
+"""
+Historial longitudinal de valores de laboratorio por paciente
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Almacén SQLite embebido (sin servicios externos). Los valores se guardan en
+una tabla agrupada por (patient_id, test_code, observed_at), de modo que una
+serie temporal es un rango contiguo del índice. Las estadísticas por serie
+(conteo, media, desviación, mínimo, máximo, último valor) se mantienen al
+insertar y se leen con una sola búsqueda por clave.
+
+Solo se registran informes cuyo patient_info trae patient_id, y solo si
+LAB_HISTORY_DB apunta a un archivo: son datos de pacientes y el almacén no se
+crea sin configurarlo.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from result_cache import fingerprint
+
+# Vacío = historial deshabilitado
+LAB_HISTORY_DB = os.getenv('LAB_HISTORY_DB', '')
+TREND_MAX_POINTS = int(os.getenv('TREND_MAX_POINTS', '1000'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_id TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    observed_at TEXT NOT NULL,
+    age INTEGER,
+    gender TEXT,
+    urgency TEXT,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS reports_by_patient ON reports (patient_id, observed_at);
+
+CREATE TABLE IF NOT EXISTS lab_values (
+    patient_id TEXT NOT NULL,
+    test_code TEXT NOT NULL,
+    observed_at TEXT NOT NULL,
+    report_id TEXT NOT NULL,
+    value REAL NOT NULL,
+    unit TEXT,
+    status TEXT,
+    concern_level TEXT,
+    PRIMARY KEY (patient_id, test_code, observed_at, report_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS lab_values_by_time ON lab_values (observed_at);
+
+CREATE TABLE IF NOT EXISTS series_stats (
+    patient_id TEXT NOT NULL,
+    test_code TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL,
+    total_sq REAL NOT NULL,
+    min_value REAL NOT NULL,
+    max_value REAL NOT NULL,
+    first_observed_at TEXT NOT NULL,
+    last_observed_at TEXT NOT NULL,
+    last_value REAL NOT NULL,
+    PRIMARY KEY (patient_id, test_code)
+) WITHOUT ROWID;
+"""
+
+# Columnas añadidas después de la primera versión del esquema
+MIGRATIONS = (
+    ('reports', 'source', 'TEXT'),
+    ('lab_values', 'concern_level', 'TEXT')
+)
+
+_UPSERT_STATS = """
+INSERT INTO series_stats VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (patient_id, test_code) DO UPDATE SET
+    count = count + 1,
+    total = total + excluded.total,
+    total_sq = total_sq + excluded.total_sq,
+    min_value = min(min_value, excluded.min_value),
+    max_value = max(max_value, excluded.max_value),
+    first_observed_at = min(first_observed_at, excluded.first_observed_at),
+    last_value = CASE WHEN excluded.last_observed_at >= last_observed_at
+                      THEN excluded.last_value ELSE last_value END,
+    last_observed_at = max(last_observed_at, excluded.last_observed_at)
+"""
+
+# Recalcular las estadísticas de una serie desde sus valores (tras reemplazar un informe)
+_REFRESH_STATS = """
+INSERT OR REPLACE INTO series_stats
+SELECT patient_id, test_code, count(*), sum(value), sum(value * value), min(value), max(value),
+       min(observed_at), max(observed_at),
+       (SELECT value FROM lab_values AS latest
+        WHERE latest.patient_id = lab_values.patient_id AND latest.test_code = lab_values.test_code
+        ORDER BY observed_at DESC LIMIT 1)
+FROM lab_values WHERE patient_id = ? AND test_code = ?
+GROUP BY patient_id, test_code
+"""
+
+_PREVIOUS_VALUE = """
+SELECT value, observed_at, status FROM lab_values
+WHERE patient_id = ? AND test_code = ? AND observed_at < ?
+ORDER BY observed_at DESC LIMIT 1
+"""
+
+
+# Columnas de iter_values: una fila por valor con los datos de su informe
+VALUE_COLUMNS = ('report_id', 'source', 'patient_id', 'observed_at', 'test_code', 'value', 'unit', 'status',
+                 'concern_level', 'urgency', 'age', 'gender')
+
+_VALUES_IN_RANGE = """
+SELECT v.report_id, r.source, v.patient_id, v.observed_at, v.test_code, v.value, v.unit,
+       v.status, v.concern_level, r.urgency, r.age, r.gender
+FROM lab_values v JOIN reports r ON r.report_id = v.report_id
+WHERE v.observed_at >= ? AND v.observed_at < ?
+ORDER BY v.observed_at
+"""
+
+
+def normalize_timestamp(value=None):
+    """ISO 8601 a segundos ('2024-05-01T08:30:00'); comparable como texto"""
+    if not value:
+        return datetime.now().isoformat(timespec='seconds')
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None).isoformat(timespec='seconds')
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None).isoformat(timespec='seconds')
+
+
+def observed_at_error(patient_info):
+    """Mensaje de error si patient_info.observed_at no es una fecha ISO 8601, o None"""
+    observed_at = patient_info.get('observed_at') if isinstance(patient_info, dict) else None
+    try:
+        normalize_timestamp(observed_at)
+    except ValueError:
+        return f'patient_info.observed_at no es una fecha ISO 8601 válida: {observed_at}'
+    return None
+
+
+def report_key(patient_id, observed_at):
+    """
+    report_id de un informe sin identificador: el paciente y la fecha de la
+    toma. Reenviar el informe (igual o editado) desde cualquiera de los
+    backends actualiza el mismo registro en lugar de añadir otro.
+    """
+    return fingerprint([patient_id, normalize_timestamp(observed_at)])
+
+
+class LabHistory:
+    """Series temporales de valores de laboratorio por paciente y código de examen"""
+
+    def __init__(self, path=LAB_HISTORY_DB):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        if self.enabled:
+            with self._connection() as connection:
+                self._migrate(connection)
+                connection.executescript(SCHEMA)
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connection(self):
+        """Una conexión por hilo y proceso (las conexiones no sobreviven a fork)"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    @staticmethod
+    def _migrate(connection):
+        """Añadir a una base existente las columnas que le falten"""
+        for table, column, column_type in MIGRATIONS:
+            columns = {row[1] for row in connection.execute(f'PRAGMA table_info({table})')}
+            if columns and column not in columns:
+                connection.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+    def record_report(self, patient_id, observed_at, values, patient_info=None, urgency=None, report_id=None,
+                      source=None):
+        """
+        Guardar un informe; values es una lista de (test_code, valor, unidad, estado,
+        nivel de preocupación o None) y source el backend que lo interpretó.
+        Sin report_id el informe se identifica por paciente y fecha de toma.
+        Reenviar un informe ya registrado con los mismos valores no cambia nada;
+        con valores distintos (una edición) reemplaza los anteriores y recalcula
+        las estadísticas de las series afectadas. Devuelve el report_id.
+        """
+        patient_info = patient_info or {}
+        report_id = report_id or report_key(patient_id, observed_at)
+        observed_at = normalize_timestamp(observed_at)
+        age = patient_info.get('age')
+
+        # Un valor por examen e informe (el primero, si el informe lo repite)
+        rows = {}
+        for code, value, unit, status, concern_level in values:
+            rows.setdefault(code, (patient_id, code, observed_at, report_id, float(value), unit, status, concern_level))
+        rows = list(rows.values())
+
+        with self._write_lock, self._connection() as connection:
+            stale_codes = self._replace_existing(connection, report_id, rows)
+            if stale_codes is None:
+                return report_id
+
+            connection.execute(
+                'INSERT INTO reports (report_id, patient_id, observed_at, age, gender, urgency, source) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (report_id, patient_id, observed_at, int(age) if str(age).isdigit() else None,
+                 patient_info.get('gender'), urgency, source)
+            )
+            connection.executemany(
+                'INSERT INTO lab_values (patient_id, test_code, observed_at, report_id, value, unit, status, '
+                'concern_level) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            if stale_codes:
+                # Las sumas no admiten restar el informe anterior si cambió la fecha: se recalculan
+                connection.executemany('DELETE FROM series_stats WHERE patient_id = ? AND test_code = ?', stale_codes)
+                connection.executemany(_REFRESH_STATS, stale_codes | {(patient_id, row[1]) for row in rows})
+            else:
+                connection.executemany(_UPSERT_STATS, [
+                    (patient_id, code, value, value * value, value, value, observed_at, observed_at, value)
+                    for patient_id, code, observed_at, _, value, _, _, _ in rows
+                ])
+        return report_id
+
+    @staticmethod
+    def _replace_existing(connection, report_id, rows):
+        """
+        Retirar la versión anterior del informe. Devuelve None si es idéntica
+        (no hay nada que guardar) y si no las series que tenía, vacío si no existía.
+        """
+        existing = connection.execute(
+            'SELECT patient_id, test_code, observed_at, value FROM lab_values WHERE report_id = ?', (report_id,)
+        ).fetchall()
+        if not existing and connection.execute('SELECT 1 FROM reports WHERE report_id = ?', (report_id,)).fetchone() is None:
+            return set()
+        if sorted(existing) == sorted(row[:3] + row[4:5] for row in rows):
+            return None
+
+        connection.execute('DELETE FROM lab_values WHERE report_id = ?', (report_id,))
+        connection.execute('DELETE FROM reports WHERE report_id = ?', (report_id,))
+        return {(patient_id, code) for patient_id, code, _, _ in existing}
+
+    def previous_values(self, patient_id, test_codes, before=None):
+        """{código: (valor, observed_at, estado)} del último resultado anterior a `before`"""
+        before = normalize_timestamp(before)
+        connection = self._connection()
+        previous = {}
+        for code in set(test_codes):
+            row = connection.execute(_PREVIOUS_VALUE, (patient_id, code, before)).fetchone()
+            if row is not None:
+                previous[code] = row
+        return previous
+
+    def series(self, patient_id, test_code, start=None, end=None, limit=TREND_MAX_POINTS):
+        """Puntos de la serie en [start, end], del más antiguo al más reciente"""
+        query = 'SELECT observed_at, value, unit, status, report_id FROM lab_values WHERE patient_id = ? AND test_code = ?'
+        params = [patient_id, test_code]
+        if start:
+            query += ' AND observed_at >= ?'
+            params.append(normalize_timestamp(start))
+        if end:
+            query += ' AND observed_at <= ?'
+            params.append(normalize_timestamp(end))
+        # Los más recientes primero para que el límite conserve el final de la serie
+        query += ' ORDER BY observed_at DESC LIMIT ?'
+        params.append(limit)
+
+        rows = self._connection().execute(query, params).fetchall()
+        return [
+            {'observed_at': observed_at, 'value': value, 'unit': unit, 'status': status, 'report_id': report_id}
+            for observed_at, value, unit, status, report_id in reversed(rows)
+        ]
+
+    def iter_values(self, start=None, end=None, batch_rows=1000):
+        """
+        Valores observados en [start, end), en lotes de hasta batch_rows filas
+        con las columnas de VALUE_COLUMNS, del más antiguo al más reciente
+        """
+        start = normalize_timestamp(start) if start else ''
+        end = normalize_timestamp(end) if end else '9999'
+        cursor = self._connection().execute(_VALUES_IN_RANGE, (start, end))
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                return
+            yield rows
+
+    def stats(self, patient_id, test_code):
+        """Estadísticas precalculadas de toda la serie, o None si no hay datos"""
+        row = self._connection().execute(
+            'SELECT count, total, total_sq, min_value, max_value, first_observed_at, last_observed_at, last_value '
+            'FROM series_stats WHERE patient_id = ? AND test_code = ?',
+            (patient_id, test_code)
+        ).fetchone()
+        if row is None:
+            return None
+
+        count, total, total_sq, min_value, max_value, first_observed_at, last_observed_at, last_value = row
+        mean = total / count
+        variance = max(0.0, total_sq / count - mean * mean)
+        return {
+            'count': count,
+            'mean': round(mean, 4),
+            'stddev': round(math.sqrt(variance), 4),
+            'min': min_value,
+            'max': max_value,
+            'first_observed_at': first_observed_at,
+            'last_observed_at': last_observed_at,
+            'last_value': last_value
+        }
+
+    def status(self):
+        """Tamaño del almacén para los endpoints de salud"""
+        if not self.enabled:
+            return {'enabled': False}
+        connection = self._connection()
+        return {
+            'enabled': True,
+            'path': self.path,
+            'reports': connection.execute('SELECT count(*) FROM reports').fetchone()[0],
+            'series': connection.execute('SELECT count(*) FROM series_stats').fetchone()[0]
+        }
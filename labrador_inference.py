@@ -0,0 +1,249 @@
+"""
+Puntuación de paneles con el modelo Labrador en micro-lotes (CPU)
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Las peticiones concurrentes no hacen un forward cada una: encolan su panel y
+un único hilo de inferencia junta hasta LABRADOR_MAX_BATCH paneles (o los que
+lleguen en LABRADOR_MAX_WAIT_MS), ejecuta un solo forward con padding y
+reparte los embeddings a cada llamador.
+
+La puntuación de anomalía es la distancia coseno entre el embedding del panel
+y el del mismo panel con cada valor en el punto medio de su rango de
+referencia. Cada llamador espera como mucho LABRADOR_LATENCY_BUDGET_MS desde
+que encoló; si el resultado no llega a tiempo, el análisis sigue sin él.
+
+Con un EmbeddingCache solo se encolan los textos cuyo panel canónico no está
+en caché; un panel ya visto se responde sin pasar por el modelo.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from embedding_cache import panel_key
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Desactivada por defecto: activarla inicia la carga del modelo con la primera petición
+# y cada petición espera hasta LABRADOR_LATENCY_BUDGET_MS por su puntuación
+LABRADOR_SCORING = os.getenv('LABRADOR_SCORING', 'false').lower() in ('1', 'true')
+LABRADOR_MAX_BATCH = int(os.getenv('LABRADOR_MAX_BATCH', '32'))
+LABRADOR_MAX_WAIT_MS = float(os.getenv('LABRADOR_MAX_WAIT_MS', '4'))
+LABRADOR_LATENCY_BUDGET_MS = float(os.getenv('LABRADOR_LATENCY_BUDGET_MS', '150'))
+# Paneles en cola como máximo; con la cola llena se responde sin puntuación
+LABRADOR_MAX_QUEUE = int(os.getenv('LABRADOR_MAX_QUEUE', '256'))
+
+# Latencias de lote recientes para los percentiles de /health
+LATENCY_WINDOW = 1024
+
+
+def panel_text(codes, values, units):
+    """Texto de un panel tal como lo recibe el tokenizer: 'GLUCOSA 95 mg/dl; ...'"""
+    return '; '.join(f'{code} {value:g} {unit}'.strip() for code, value, unit in zip(codes, values, units))
+
+
+def reference_values(codes, values, reference_ranges):
+    """Cada valor conocido en el punto medio de su rango de referencia"""
+    midpoints = []
+    for code, value in zip(codes, values):
+        reference = reference_ranges.get(code)
+        midpoints.append((reference['min'] + reference['max']) / 2 if reference else value)
+    return midpoints
+
+
+class PanelRequest:
+    """
+    Panel y su panel de referencia. `embeddings` trae los que ya estaban en
+    caché; `texts`/`keys` son los que faltan y `future` recibe
+    (embeddings de esos textos, tamaño del lote).
+    """
+
+    __slots__ = ('embeddings', 'texts', 'keys', 'future', 'submitted_at')
+
+    def __init__(self, embeddings, texts, keys):
+        self.embeddings = embeddings
+        self.texts = texts
+        self.keys = keys
+        self.future = Future()
+        self.submitted_at = time.monotonic()
+
+
+class LabradorBatcher:
+    """Cola de paneles y un hilo de inferencia que los ejecuta en lotes"""
+
+    def __init__(self, model, enabled=LABRADOR_SCORING, max_batch=LABRADOR_MAX_BATCH,
+                 max_wait_ms=LABRADOR_MAX_WAIT_MS, latency_budget_ms=LABRADOR_LATENCY_BUDGET_MS,
+                 max_queue=LABRADOR_MAX_QUEUE, cache=None):
+        self.model = model
+        self.cache = cache
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.latency_budget = latency_budget_ms / 1000
+        self.max_queue = max_queue
+        self.stats = {
+            'requests': 0, 'scored': 0, 'not_ready': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0,
+            'batches': 0, 'batched_panels': 0
+        }
+        self._stats_lock = threading.Lock()
+        self._batch_ms = deque(maxlen=LATENCY_WINDOW)
+        self._start_lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def _ensure_started(self):
+        """Crear la cola y el hilo de inferencia (una vez por proceso: los hilos no sobreviven a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.max_queue)
+            threading.Thread(target=self._run, args=(self._queue,), name='labrador-batcher', daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, codes, values, units, reference_ranges):
+        """
+        Encolar un panel sin esperar. Devuelve un PanelRequest para collect(), o
+        None si la puntuación está desactivada, el modelo no está listo o la
+        cola está llena.
+        """
+        if not self.enabled or not codes:
+            return None
+        self._count('requests')
+        if not self.model.ready:
+            # Esta petición sigue sin puntuación; las siguientes la tendrán cuando el modelo esté listo
+            self.model.ensure_loading()
+            self._count('not_ready')
+            return None
+
+        # Orden canónico: el texto embebido corresponde a la clave de caché
+        codes, values, units = zip(*sorted(zip(codes, values, units), key=lambda row: row[0]))
+        references = reference_values(codes, values, reference_ranges)
+        embeddings, texts, keys = [], [], []
+        for panel_values in (values, references):
+            key = panel_key(codes, panel_values, reference_ranges)
+            embedding = self.cache.get(key) if self.cache is not None else None
+            embeddings.append(embedding)
+            if embedding is None:
+                texts.append(panel_text(codes, panel_values, units))
+                keys.append(key)
+
+        request = PanelRequest(embeddings, texts, keys)
+        if not texts:
+            request.future.set_result(([], 0))
+            return request
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            self._count('rejected')
+            return None
+        return request
+
+    def collect(self, request):
+        """Resultado de un panel encolado, o None si no llega dentro del presupuesto"""
+        if request is None:
+            return None
+
+        remaining = request.submitted_at + self.latency_budget - time.monotonic()
+        try:
+            computed, batch_size = request.future.result(timeout=max(0.0, remaining))
+            computed = iter(computed)
+            embedding, reference = (cached if cached is not None else next(computed) for cached in request.embeddings)
+            # Un embedding de caché con otra forma falla aquí y la respuesta sigue sin puntuación
+            cosine = float(np.dot(embedding, reference) /
+                           max(float(np.linalg.norm(embedding) * np.linalg.norm(reference)), 1e-12))
+        except FutureTimeoutError:
+            # Si aún no entró en un lote, se descarta sin ejecutarlo
+            request.future.cancel()
+            self._count('timeouts')
+            return None
+        except Exception as e:
+            self._count('errors')
+            logger.warning('labrador_inference_failed', error=str(e))
+            return None
+
+        self._count('scored')
+        return {
+            'anomaly_score': round(min(1.0, max(0.0, 1.0 - cosine)), 4),
+            'model': self.model.model_name,
+            'batch_size': batch_size,
+            'cached': not request.texts,
+            'latency_ms': round((time.monotonic() - request.submitted_at) * 1000, 1)
+        }
+
+    def score(self, codes, values, units, reference_ranges):
+        """submit() + collect() para quien no tiene trabajo que solapar con la inferencia"""
+        return self.collect(self.submit(codes, values, units, reference_ranges))
+
+    def _next_batch(self, pending):
+        """Esperar un panel y juntar los que lleguen hasta llenar el lote o agotar max_wait"""
+        batch = [pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Los paneles cuyo llamador ya se rindió no se ejecutan
+        return [request for request in batch if request.future.set_running_or_notify_cancel()]
+
+    def _run(self, pending):
+        while True:
+            batch = self._next_batch(pending)
+            if not batch:
+                continue
+
+            # Los paneles de referencia se repiten entre peticiones: un forward por texto distinto
+            texts = list(dict.fromkeys(text for request in batch for text in request.texts))
+            started = time.perf_counter()
+            try:
+                embeddings = self.model.embed(texts)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            rows = {text: embeddings[position] for position, text in enumerate(texts)}
+            for request in batch:
+                request.future.set_result(([rows[text] for text in request.texts], len(batch)))
+                if self.cache is not None:
+                    for key, text in zip(request.keys, request.texts):
+                        self.cache.put(key, rows[text])
+
+            with self._stats_lock:
+                self.stats['batches'] += 1
+                self.stats['batched_panels'] += len(batch)
+                self._batch_ms.append(elapsed_ms)
+
+    def status(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+            batch_ms = np.array(self._batch_ms)
+        return {
+            'enabled': self.enabled,
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'latency_budget_ms': self.latency_budget * 1000,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'mean_batch_size': round(stats['batched_panels'] / stats['batches'], 2) if stats['batches'] else None,
+            'batch_ms_p50': round(float(np.percentile(batch_ms, 50)), 2) if batch_ms.size else None,
+            'batch_ms_p99': round(float(np.percentile(batch_ms, 99)), 2) if batch_ms.size else None,
+            **stats
+        }
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
@@ -0,0 +1,310 @@
+"""
+Carga diferida del modelo Labrador
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+El modelo se carga en un hilo de fondo (o bajo demanda) para que el servidor
+pueda atender peticiones que no lo necesitan desde el primer milisegundo.
+
+LABRADOR_RUNTIME elige cómo se ejecuta:
+    float  pesos completos en torch (referencia)
+    int8   cuantización dinámica de las capas lineales (menos memoria, más rápido en CPU)
+    onnx   grafo exportado ejecutado con onnxruntime, sin cargar torch
+
+    python labrador_model.py convert --output labrador.onnx   # una vez, para onnx
+    python labrador_model.py parity --runtime int8            # comparar con float
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+MODEL_NAME = os.getenv('LABRADOR_MODEL_NAME', 'Drbellamy/labrador')
+
+# background: cargar al iniciar en un hilo aparte
+# lazy: empezar a cargar (en segundo plano) con la primera petición que lo necesite
+# disabled: no cargar nunca (solo análisis basado en reglas)
+LOAD_MODE = os.getenv('LABRADOR_LOAD_MODE', 'background').lower()
+
+# Hilos de torch para la inferencia (acotados: varios workers comparten el nodo)
+TORCH_THREADS = int(os.getenv('LABRADOR_TORCH_THREADS', '2'))
+# Longitud máxima en tokens de un panel
+MAX_TOKENS = int(os.getenv('LABRADOR_MAX_TOKENS', '256'))
+
+RUNTIMES = ('float', 'int8', 'onnx')
+RUNTIME = os.getenv('LABRADOR_RUNTIME', 'float').lower()
+# Grafo exportado con `python labrador_model.py convert`
+ONNX_PATH = os.getenv('LABRADOR_ONNX_PATH', 'labrador.onnx')
+
+# Similitud coseno mínima frente al modelo float para aprobar la comprobación de paridad
+PARITY_MIN_COSINE = {'int8': 0.99, 'onnx': 0.9999}
+
+
+class ModelNotReady(Exception):
+    """El modelo todavía no está disponible para inferencia"""
+
+
+class LabradorModel:
+    """Contenedor del tokenizer y modelo Labrador con estado de disponibilidad"""
+
+    NOT_LOADED = 'not_loaded'
+    LOADING = 'loading'
+    READY = 'ready'
+    FAILED = 'failed'
+    DISABLED = 'disabled'
+
+    def __init__(self, model_name=MODEL_NAME, load_mode=LOAD_MODE, runtime=RUNTIME, onnx_path=ONNX_PATH):
+        if runtime not in RUNTIMES:
+            raise ValueError(f'LABRADOR_RUNTIME inválido: {runtime} (opciones: {", ".join(RUNTIMES)})')
+        self.model_name = model_name
+        self.load_mode = load_mode
+        self.runtime = runtime
+        self.onnx_path = onnx_path
+        self.tokenizer = None
+        self.model = None
+        self.error = None
+        self.load_seconds = None
+        self.state = self.DISABLED if load_mode == 'disabled' else self.NOT_LOADED
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.state == self.READY
+
+    def start_background_load(self):
+        """Iniciar la carga en un hilo de fondo (solo en modo background)"""
+        if self.load_mode == 'background':
+            self._start_loader()
+
+    def ensure_loading(self):
+        """
+        Sin esperar: si nadie ha iniciado la carga (modo lazy, o un servidor que
+        no llamó a start_background_load), iniciarla en un hilo de fondo
+        """
+        if self.state == self.NOT_LOADED:
+            self._start_loader()
+
+    def _start_loader(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.load, name='labrador-loader', daemon=True)
+            self._thread.start()
+
+    def load(self):
+        """Cargar tokenizer y modelo de forma síncrona; es idempotente"""
+        with self._lock:
+            if self.state in (self.READY, self.DISABLED):
+                return
+            self.state = self.LOADING
+            started = time.perf_counter()
+            logger.info('labrador_loading', model=self.model_name, runtime=self.runtime)
+
+            try:
+                # Importación diferida: transformers tarda segundos en importarse
+                from transformers import AutoTokenizer
+
+                self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self.model = self._load_onnx() if self.runtime == 'onnx' else self._load_torch()
+            except Exception as e:
+                self.state = self.FAILED
+                self.error = str(e)
+                logger.error('labrador_load_failed', model=self.model_name, runtime=self.runtime, error=str(e))
+            else:
+                self.state = self.READY
+                self.error = None
+                logger.info('labrador_ready', model=self.model_name, runtime=self.runtime,
+                            load_seconds=round(time.perf_counter() - started, 3))
+            finally:
+                self.load_seconds = round(time.perf_counter() - started, 3)
+                self._loaded.set()
+
+    def _load_torch(self):
+        import torch
+        from transformers import AutoModel
+
+        torch.set_num_threads(TORCH_THREADS)
+        model = AutoModel.from_pretrained(self.model_name)
+        model.eval()
+        if self.runtime == 'int8':
+            # Pesos de las capas lineales a int8; las activaciones se cuantizan al vuelo
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def _load_onnx(self):
+        import onnxruntime
+
+        if not os.path.exists(self.onnx_path):
+            raise FileNotFoundError(f'No existe {self.onnx_path}: ejecutar `python labrador_model.py convert`')
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = TORCH_THREADS
+        options.inter_op_num_threads = 1
+        return onnxruntime.InferenceSession(self.onnx_path, options, providers=['CPUExecutionProvider'])
+
+    def get(self, timeout=None):
+        """Obtener (tokenizer, model), esperando hasta `timeout` segundos si está cargando"""
+        if self.state == self.DISABLED:
+            raise ModelNotReady('Modelo deshabilitado (LABRADOR_LOAD_MODE=disabled)')
+
+        if self.state == self.NOT_LOADED:
+            if self.load_mode == 'lazy':
+                self.load()
+            else:
+                self.start_background_load()
+
+        if not self.ready and not self._loaded.wait(timeout):
+            raise ModelNotReady('Modelo en carga')
+
+        if not self.ready:
+            raise ModelNotReady(self.error or 'Modelo no disponible')
+
+        return self.tokenizer, self.model
+
+    def embed(self, texts):
+        """
+        Embeddings de un lote de textos (mean pooling de la última capa) como
+        ndarray float32 de forma (n, dim). Un solo forward con padding.
+        """
+        tokenizer, model = self.get(timeout=0)
+
+        if self.runtime == 'onnx':
+            inputs = tokenizer(list(texts), padding=True, truncation=True, max_length=MAX_TOKENS, return_tensors='np')
+            feed = {entry.name: inputs[entry.name].astype(np.int64) for entry in model.get_inputs()}
+            hidden = model.run(['last_hidden_state'], feed)[0]
+            mask = inputs['attention_mask'][..., None].astype(hidden.dtype)
+            return ((hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1)).astype(np.float32)
+
+        import torch
+
+        inputs = tokenizer(list(texts), padding=True, truncation=True, max_length=MAX_TOKENS, return_tensors='pt')
+        with torch.inference_mode():
+            hidden = model(**inputs).last_hidden_state
+            mask = inputs['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return pooled.float().numpy()
+
+    def status(self):
+        """Estado del modelo para los endpoints de salud"""
+        return {
+            'name': self.model_name,
+            'load_mode': self.load_mode,
+            'runtime': self.runtime,
+            'state': self.state,
+            'ready': self.ready,
+            'load_seconds': self.load_seconds,
+            'error': self.error
+        }
+
+
+def export_onnx(output, model_name=MODEL_NAME, opset=17):
+    """Exportar el modelo float a un grafo ONNX con lote y longitud dinámicos"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+    model.config.return_dict = False
+
+    inputs = dict(tokenizer(parity_panels()[:2], padding=True, return_tensors='pt'))
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in inputs}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+    temporary = f'{output}.tmp'
+    with torch.inference_mode():
+        torch.onnx.export(
+            model, (inputs,), temporary,
+            input_names=list(inputs), output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes, opset_version=opset
+        )
+    os.replace(temporary, output)
+
+
+def parity_panels():
+    """Muestra fija de paneles: cada examen por debajo, en el centro y por encima de su rango"""
+    from labrador_inference import panel_text
+    from medical_knowledge import MEDICAL_KNOWLEDGE
+
+    ranges = MEDICAL_KNOWLEDGE['reference_ranges']
+    codes = sorted(ranges)
+    panels = []
+    for factor in (0.5, 1.0, 1.5):
+        for start in range(0, len(codes), 4):
+            group = codes[start:start + 4]
+            values = [(ranges[code]['min'] + ranges[code]['max']) / 2 * factor for code in group]
+            panels.append(panel_text(group, values, [ranges[code]['unit'] for code in group]))
+    return panels
+
+
+def parity_check(runtime, onnx_path=ONNX_PATH, model_name=MODEL_NAME, batch_size=8):
+    """
+    Comparar `runtime` con el modelo float sobre parity_panels(). Devuelve la
+    similitud coseno mínima y media de los embeddings y la latencia media por lote.
+    """
+    panels = parity_panels()
+    results = {}
+    for name in ('float', runtime):
+        model = LabradorModel(model_name, load_mode='lazy', runtime=name, onnx_path=onnx_path)
+        model.load()
+        if not model.ready:
+            raise RuntimeError(f'No se pudo cargar el runtime {name}: {model.error}')
+
+        model.embed(panels[:batch_size])  # calentamiento
+        started = time.perf_counter()
+        embeddings = [model.embed(panels[start:start + batch_size]) for start in range(0, len(panels), batch_size)]
+        batches = len(embeddings)
+        results[name] = (np.concatenate(embeddings), (time.perf_counter() - started) / batches * 1000)
+
+    reference, reference_ms = results['float']
+    candidate, candidate_ms = results[runtime]
+    cosine = (reference * candidate).sum(axis=1) / np.maximum(
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1), 1e-12
+    )
+    return {
+        'runtime': runtime,
+        'panels': len(panels),
+        'min_cosine': float(cosine.min()),
+        'mean_cosine': float(cosine.mean()),
+        'float_batch_ms': round(reference_ms, 2),
+        'runtime_batch_ms': round(candidate_ms, 2),
+        'passed': bool(cosine.min() >= PARITY_MIN_COSINE.get(runtime, 1.0))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Conversión y paridad de los runtimes del modelo Labrador')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert = commands.add_parser('convert', help='exportar el modelo a ONNX')
+    convert.add_argument('--output', default=ONNX_PATH)
+    convert.add_argument('--opset', type=int, default=17)
+
+    parity = commands.add_parser('parity', help='comparar un runtime con el modelo float')
+    parity.add_argument('--runtime', choices=[runtime for runtime in RUNTIMES if runtime != 'float'], required=True)
+    parity.add_argument('--onnx-path', default=ONNX_PATH)
+
+    args = parser.parse_args()
+    if args.command == 'convert':
+        started = time.perf_counter()
+        export_onnx(args.output, opset=args.opset)
+        print(f'Modelo exportado a {args.output} en {time.perf_counter() - started:.1f}s')
+        report = parity_check('onnx', args.output)
+    else:
+        report = parity_check(args.runtime, args.onnx_path)
+
+    print(report)
+    if not report['passed']:
+        raise SystemExit(f'Paridad insuficiente: similitud mínima {report["min_cosine"]:.5f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+"""
+Base de conocimiento médico compilada
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Los rangos de referencia, normalizaciones, unidades, explicaciones y nombres de
+enfermedades se leen de un archivo JSON versionado (medical_knowledge.json) y
+se compilan en tablas inmutables. Las búsquedas por valor son O(1) y no crean
+objetos nuevos; los límites numéricos se mapean desde un archivo .npy que
+comparten todos los workers.
+
+KnowledgeStore guarda la versión vigente y la sustituye de forma atómica al
+recargar (endpoint o cambio del archivo). Cada petición fija la versión con
+la que empezó, así que una recarga no altera las peticiones en curso.
+"""
+
+import hmac
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from types import MappingProxyType
+
+import numpy as np
+
+from range_classifier import RangeTable
+from result_cache import fingerprint
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Archivo de la base de conocimiento
+KNOWLEDGE_FILE = os.getenv('KNOWLEDGE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                          'medical_knowledge.json'))
+# Cada cuántos segundos se revisa si el archivo cambió (0 = sin vigilancia)
+KNOWLEDGE_RELOAD_INTERVAL_S = float(os.getenv('KNOWLEDGE_RELOAD_INTERVAL_S', '5'))
+# Directorio de los límites numéricos mapeados en memoria (vacío = en memoria del proceso)
+KNOWLEDGE_SIDECAR_DIR = os.getenv('KNOWLEDGE_SIDECAR_DIR', tempfile.gettempdir())
+# Token del endpoint de recarga (vacío = endpoint deshabilitado)
+KNOWLEDGE_RELOAD_TOKEN = os.getenv('KNOWLEDGE_RELOAD_TOKEN', '')
+
+# Máximo de textos de rango distintos cuya unidad se memoriza
+UNIT_MEMO_SIZE = 4096
+
+# Secciones obligatorias del archivo
+KNOWLEDGE_SECTIONS = (
+    'reference_ranges', 'disease_patterns', 'normalizations', 'unit_patterns',
+    'explanations', 'disease_names', 'interpreter_ranges'
+)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_text_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _check_range(section, code, reference, critical_required=False):
+    """Rango con min <= max numéricos, unidad y límites críticos low <= high (si los trae o se exigen)"""
+    if not isinstance(reference, dict):
+        raise ValueError(f'Rango inválido para {code} en {section}: se esperaba un objeto')
+    if not _is_number(reference.get('min')) or not _is_number(reference.get('max')):
+        raise ValueError(f'Rango inválido para {code} en {section}: min y max deben ser números')
+    if reference['min'] > reference['max']:
+        raise ValueError(f'Rango inválido para {code} en {section}: min > max')
+    if not isinstance(reference.get('unit'), str):
+        raise ValueError(f'Rango inválido para {code} en {section}: falta unit')
+    critical = reference.get('critical')
+    if critical is None and critical_required:
+        raise ValueError(f'Faltan los límites críticos de {code} en {section}')
+    if critical is not None:
+        if not isinstance(critical, dict) or not _is_number(critical.get('low')) or not _is_number(critical.get('high')):
+            raise ValueError(f'Límites críticos inválidos para {code} en {section}: low y high deben ser números')
+        if critical['low'] > critical['high']:
+            raise ValueError(f'Límites críticos inválidos para {code} en {section}: low > high')
+
+
+def validate_knowledge(document, path=KNOWLEDGE_FILE):
+    """Comprobar el esquema completo del documento; ValueError con el primer problema encontrado"""
+    if not isinstance(document, dict):
+        raise ValueError(f'{path} debe contener un objeto JSON')
+    missing = [section for section in KNOWLEDGE_SECTIONS if section not in document]
+    if missing:
+        raise ValueError(f'Faltan secciones en {path}: {", ".join(missing)}')
+    invalid = [section for section in KNOWLEDGE_SECTIONS if not isinstance(document[section], dict)]
+    if invalid:
+        raise ValueError(f'Secciones que no son objetos en {path}: {", ".join(invalid)}')
+    if 'version' in document and not isinstance(document['version'], str):
+        raise ValueError('version debe ser un texto')
+
+    # MedicalAI lee los límites críticos de todos los rangos de referencia
+    for code, reference in document['reference_ranges'].items():
+        _check_range('reference_ranges', code, reference, critical_required=True)
+    for code, reference in document['interpreter_ranges'].items():
+        _check_range('interpreter_ranges', code, reference)
+
+    for name, pattern in document['disease_patterns'].items():
+        if (not isinstance(pattern, dict) or not _is_text_list(pattern.get('indicators'))
+                or not isinstance(pattern.get('thresholds'), dict)
+                or not all(_is_number(value) for value in pattern['thresholds'].values())
+                or not _is_text_list(pattern.get('symptoms', [])) or not _is_text_list(pattern.get('risk_factors', []))):
+            raise ValueError(f'Patrón inválido para {name} en disease_patterns')
+
+    for section in ('normalizations', 'disease_names'):
+        for key, value in document[section].items():
+            if not isinstance(value, str):
+                raise ValueError(f'Valor inválido para {key} en {section}: se esperaba un texto')
+    for unit, variants in document['unit_patterns'].items():
+        if not _is_text_list(variants):
+            raise ValueError(f'Variantes inválidas para {unit} en unit_patterns')
+    for code, explanation in document['explanations'].items():
+        if not isinstance(explanation, dict) or not all(isinstance(text, str) for text in explanation.values()):
+            raise ValueError(f'Explicación inválida para {code} en explanations')
+
+
+def read_knowledge_file(path=KNOWLEDGE_FILE):
+    """Leer y validar el archivo de la base de conocimiento (ValueError si no es válido)"""
+    with open(path, encoding='utf-8') as source:
+        document = json.load(source)
+    validate_knowledge(document, path)
+    return document
+
+
+# Tablas del archivo tal como se cargaron al importar (benchmarks y datos sintéticos)
+_DOCUMENT = read_knowledge_file()
+MEDICAL_KNOWLEDGE = {
+    'reference_ranges': _DOCUMENT['reference_ranges'],
+    'disease_patterns': _DOCUMENT['disease_patterns']
+}
+NORMALIZATIONS = _DOCUMENT['normalizations']
+UNIT_PATTERNS = _DOCUMENT['unit_patterns']
+EXPLANATIONS = _DOCUMENT['explanations']
+DISEASE_NAMES = _DOCUMENT['disease_names']
+INTERPRETER_RANGES = _DOCUMENT['interpreter_ranges']
+
+
+def _freeze(data):
+    """Copia inmutable recursiva: dict -> MappingProxyType, list -> tuple"""
+    if isinstance(data, dict):
+        return MappingProxyType({key: _freeze(value) for key, value in data.items()})
+    if isinstance(data, (list, tuple)):
+        return tuple(_freeze(value) for value in data)
+    return data
+
+
+class KnowledgeBase:
+    """Tablas de consulta inmutables construidas una sola vez"""
+
+    __slots__ = (
+        'version', 'label', 'medical_knowledge', 'reference_ranges', 'disease_patterns',
+        'normalizations', 'unit_pattern', 'unit_variants', 'explanations',
+        'default_explanations', 'disease_names', 'range_table',
+        'interpreter_ranges', 'interpreter_range_table', '_unit_memo'
+    )
+
+    def __init__(self, medical_knowledge=MEDICAL_KNOWLEDGE, normalizations=NORMALIZATIONS,
+                 unit_patterns=UNIT_PATTERNS, explanations=EXPLANATIONS, disease_names=DISEASE_NAMES,
+                 interpreter_ranges=INTERPRETER_RANGES, label=None, sidecar_dir=None):
+        set_attr = object.__setattr__
+        # Versión = etiqueta del archivo + huella del contenido (entra en las claves de caché)
+        content_fingerprint = fingerprint({
+            'medical_knowledge': medical_knowledge,
+            'normalizations': normalizations,
+            'unit_patterns': unit_patterns,
+            'explanations': explanations,
+            'disease_names': disease_names,
+            'interpreter_ranges': interpreter_ranges
+        })
+        set_attr(self, 'label', label)
+        set_attr(self, 'version', f'{label}+{content_fingerprint}' if label else content_fingerprint)
+
+        def sidecar(name):
+            if sidecar_dir:
+                return os.path.join(sidecar_dir, f'knowledge-{content_fingerprint}-{name}.npy')
+            return None
+
+        set_attr(self, 'medical_knowledge', _freeze(medical_knowledge))
+        set_attr(self, 'reference_ranges', self.medical_knowledge['reference_ranges'])
+        set_attr(self, 'disease_patterns', self.medical_knowledge['disease_patterns'])
+        set_attr(self, 'range_table', RangeTable(self.reference_ranges, sidecar('reference')))
+        set_attr(self, 'interpreter_ranges', _freeze(interpreter_ranges))
+        set_attr(self, 'interpreter_range_table', RangeTable(self.interpreter_ranges, sidecar('interpreter')))
+        set_attr(self, 'normalizations', _freeze(normalizations))
+        set_attr(self, 'disease_names', _freeze(disease_names))
+
+        # Unidades: una sola búsqueda con alternancia; a igual posición gana la variante más larga
+        variants = {variant: unit for unit, patterns in unit_patterns.items() for variant in patterns}
+        set_attr(self, 'unit_variants', MappingProxyType(variants))
+        set_attr(self, 'unit_pattern', re.compile(
+            '|'.join(re.escape(variant) for variant in sorted(variants, key=len, reverse=True))
+        ))
+        # Los textos de rango se repiten de un informe a otro: se memoriza la unidad de cada uno
+        set_attr(self, '_unit_memo', {})
+
+        # Explicaciones indexadas por (examen, estado) y textos por defecto precalculados
+        set_attr(self, 'explanations', MappingProxyType({
+            (test_name, status): text
+            for test_name, by_status in explanations.items()
+            for status, text in by_status.items()
+        }))
+        set_attr(self, 'default_explanations', MappingProxyType({
+            status: f'Valor {status} fuera del rango normal. Requiere evaluación médica especializada.'
+            for status in ('bajo', 'elevado')
+        }))
+
+    @classmethod
+    def from_document(cls, document, sidecar_dir=KNOWLEDGE_SIDECAR_DIR):
+        """Compilar un documento leído con read_knowledge_file()"""
+        return cls(
+            medical_knowledge={
+                'reference_ranges': document['reference_ranges'],
+                'disease_patterns': document['disease_patterns']
+            },
+            normalizations=document['normalizations'],
+            unit_patterns=document['unit_patterns'],
+            explanations=document['explanations'],
+            disease_names=document['disease_names'],
+            interpreter_ranges=document['interpreter_ranges'],
+            label=document.get('version'),
+            sidecar_dir=sidecar_dir
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError('KnowledgeBase es inmutable')
+
+    def normalize_test_name(self, name):
+        return self.normalizations.get(name, name)
+
+    def extract_unit(self, text):
+        unit = self._unit_memo.get(text)
+        if unit is None:
+            match = self.unit_pattern.search(text)
+            unit = self.unit_variants[match.group(0)] if match else ''
+            if len(self._unit_memo) < UNIT_MEMO_SIZE:
+                self._unit_memo[text] = unit
+        return unit
+
+    def significance(self, test_name, status):
+        explanation = self.explanations.get((test_name, status))
+        if explanation is None:
+            explanation = self.default_explanations.get(status) or \
+                f'Valor {status} fuera del rango normal. Requiere evaluación médica especializada.'
+        return explanation
+
+    def disease_name(self, disease):
+        return self.disease_names.get(disease, disease)
+
+
+# Versión fijada por la petición en curso (ver KnowledgeStore.pin)
+_pinned = ContextVar('knowledge_pinned', default=None)
+
+
+class KnowledgeStore:
+    """Versión vigente de la base de conocimiento, recargable desde su archivo"""
+
+    def __init__(self, path=KNOWLEDGE_FILE, reload_interval=KNOWLEDGE_RELOAD_INTERVAL_S,
+                 sidecar_dir=KNOWLEDGE_SIDECAR_DIR, document=None):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.sidecar_dir = sidecar_dir
+        self._lock = threading.Lock()
+        self._mtime = self._stat()
+        self._next_check = time.monotonic() + reload_interval
+        self._current = KnowledgeBase.from_document(document or read_knowledge_file(path), sidecar_dir)
+        self.loaded_at = datetime.now().isoformat()
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error = None
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def current(self):
+        """Versión fijada por la petición en curso o, fuera de una petición, la vigente"""
+        pinned = _pinned.get()
+        if pinned is not None:
+            return pinned
+        self.maybe_reload()
+        return self._current
+
+    @contextmanager
+    def pin(self, knowledge_base=None):
+        """Usar una misma versión (la vigente o `knowledge_base`) durante todo el bloque aunque se recargue a mitad"""
+        token = _pinned.set(knowledge_base or self.current())
+        try:
+            yield
+        finally:
+            _pinned.reset(token)
+
+    def maybe_reload(self):
+        """Recargar si el archivo cambió (se comprueba como mucho cada reload_interval)"""
+        if self.reload_interval <= 0 or time.monotonic() < self._next_check:
+            return
+        with self._lock:
+            if time.monotonic() < self._next_check:
+                return
+            self._next_check = time.monotonic() + self.reload_interval
+            mtime = self._stat()
+            if mtime is None or mtime == self._mtime:
+                return
+            # Un archivo inválido no se reintenta hasta que vuelva a cambiar
+            self._mtime = mtime
+            try:
+                self._swap(read_knowledge_file(self.path))
+            except (OSError, ValueError) as e:
+                self._failed(e)
+
+    def reload(self):
+        """Recargar el archivo ahora. Devuelve la versión vigente; ValueError/OSError si no es válido"""
+        with self._lock:
+            self._mtime = self._stat()
+            try:
+                self._swap(read_knowledge_file(self.path))
+            except (OSError, ValueError) as e:
+                self._failed(e)
+                raise
+            return self._current.version
+
+    def _swap(self, document):
+        try:
+            knowledge_base = KnowledgeBase.from_document(document, self.sidecar_dir)
+        except (KeyError, TypeError) as e:
+            # Lo que validate_knowledge no detecte tampoco debe tumbar la recarga
+            raise ValueError(f'No se pudo compilar la base de conocimiento: {e!r}') from e
+        previous = self._current.version
+        # Una sola asignación: las peticiones en curso conservan la versión que fijaron
+        self._current = knowledge_base
+        self.loaded_at = datetime.now().isoformat()
+        self.reloads += 1
+        self.last_error = None
+        logger.info('knowledge_reloaded', previous_version=previous, knowledge_version=knowledge_base.version)
+
+    def _failed(self, error):
+        self.failed_reloads += 1
+        self.last_error = str(error)
+        logger.warning('knowledge_reload_failed', path=self.path, error=str(error))
+
+    @property
+    def reload_enabled(self):
+        """El endpoint de recarga solo existe con KNOWLEDGE_RELOAD_TOKEN configurado"""
+        return bool(KNOWLEDGE_RELOAD_TOKEN)
+
+    def authorized(self, token):
+        """Comprobar el token del endpoint de recarga (sin token configurado, nada se permite)"""
+        # En bytes: compare_digest no admite textos con caracteres no ASCII
+        return self.reload_enabled and hmac.compare_digest((token or '').encode('utf-8'),
+                                                           KNOWLEDGE_RELOAD_TOKEN.encode('utf-8'))
+
+    def status(self):
+        knowledge_base = self._current
+        return {
+            'version': knowledge_base.version,
+            'label': knowledge_base.label,
+            'path': self.path,
+            'loaded_at': self.loaded_at,
+            'reload_interval_s': self.reload_interval,
+            'shared_ranges': isinstance(knowledge_base.range_table.min, np.memmap),
+            'reloads': self.reloads,
+            'failed_reloads': self.failed_reloads,
+            'last_error': self.last_error
+        }
+
+    def init_app(self, app):
+        """Fijar en cada petición Flask la versión vigente al empezar"""
+        @app.before_request
+        def _pin_knowledge():
+            _pinned.set(self.current())
+
+        @app.teardown_request
+        def _unpin_knowledge(exc):
+            _pinned.set(None)
+
+
+# Instancia compartida, construida al importar a partir del mismo documento
+knowledge_store = KnowledgeStore(document=_DOCUMENT)
+
+# Versión cargada al importar (benchmarks); los backends usan knowledge_store
+KNOWLEDGE_BASE = knowledge_store.current()
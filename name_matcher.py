@@ -0,0 +1,110 @@
+"""
+Resolución de nombres de examen a códigos canónicos
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Un autómata Aho–Corasick precompilado encuentra en una sola pasada todas las
+palabras clave presentes en el nombre; después gana la primera regla (por
+prioridad) cuyas palabras clave aparecen todas.
+"""
+
+from collections import deque
+from functools import lru_cache
+
+# Reglas en orden de prioridad: (código canónico, palabras clave requeridas)
+# Los más específicos van primero: "COLESTEROL HDL" es HDL, no colesterol total.
+TEST_CODE_RULES = (
+    ('CK_MB', ('CK-MB',)),
+    ('CK_MB', ('CK_MB',)),
+    ('CK_MB', ('CKMB',)),
+    ('TROPONINA', ('TROPONINA',)),
+    ('CPK', ('CPK',)),
+    ('HDL', ('HDL',)),
+    ('LDL', ('LDL',)),
+    ('COLESTEROL_TOTAL', ('COLESTEROL',)),
+    ('TRIGLICERIDOS', ('TRIGLICERIDOS',)),
+    ('TRIGLICERIDOS', ('TRIGLICÉRIDOS',)),
+    ('GLUCOSA', ('GLUCOSA',)),
+    ('HEMOGLOBINA', ('HEMOGLOBINA',)),
+    ('HEMATOCRITO', ('HEMATOCRITO',)),
+    ('LEUCOCITOS', ('LEUCOCITOS',)),
+    ('CREATININA', ('CREATININA',)),
+    ('UREA', ('UREA',)),
+    ('BILIRRUBINA', ('BILIRRUBINA',)),
+    ('TSH', ('TSH',)),
+    ('T3', ('T3',)),
+    ('T4', ('T4',))
+)
+
+
+class AhoCorasick:
+    """Autómata de búsqueda simultánea de múltiples patrones"""
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] += (pattern,)
+
+        # Enlaces de fallo por recorrido en anchura
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def find_all(self, text):
+        """Conjunto de patrones presentes en el texto (una sola pasada)"""
+        found = set()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class LabNameMatcher:
+    """Resolver un nombre crudo de examen a su código canónico"""
+
+    def __init__(self, rules=TEST_CODE_RULES):
+        self.rules = rules
+        self.automaton = AhoCorasick({keyword for _, keywords in rules for keyword in keywords})
+
+    def resolve(self, name):
+        """Código canónico del examen, o None si no se reconoce"""
+        found = self.automaton.find_all(name.upper())
+        if not found:
+            return None
+        for code, keywords in self.rules:
+            if all(keyword in found for keyword in keywords):
+                return code
+        return None
+
+
+TEST_NAME_MATCHER = LabNameMatcher()
+
+
+@lru_cache(maxsize=4096)
+def resolve_test_code(name):
+    """Código canónico con memoria: los nombres se repiten entre informes"""
+    return TEST_NAME_MATCHER.resolve(name)
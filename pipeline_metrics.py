@@ -0,0 +1,140 @@
+"""
+Métricas de latencia por etapa de los pipelines de interpretación
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Histogramas en memoria por (endpoint, etapa), expuestos en formato de texto
+de Prometheus. Las métricas son por proceso: con varios workers, Prometheus
+debe recoger cada uno o agregarlas aguas abajo.
+
+Con el muestreo desactivado, cada temporizador es un objeto no-op compartido
+y no llama al reloj.
+"""
+
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', '1.0'))
+
+# Límites superiores de los buckets, en segundos
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Histograma de latencias con buckets fijos"""
+
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class _NoopTimer:
+    """Temporizador vacío para peticiones no muestreadas"""
+
+    __slots__ = ()
+
+    def stage(self, name):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_TIMER = _NoopTimer()
+
+
+class _StageTimer:
+    __slots__ = ('_request', '_stage', '_started')
+
+    def __init__(self, request_timer, stage):
+        self._request = request_timer
+        self._stage = stage
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._request.metrics.observe(self._request.endpoint, self._stage, time.perf_counter() - self._started)
+        return False
+
+
+class RequestTimer:
+    """Temporizador de una petición muestreada; `with timer.stage('x'):` mide una etapa"""
+
+    __slots__ = ('metrics', 'endpoint')
+
+    def __init__(self, metrics, endpoint):
+        self.metrics = metrics
+        self.endpoint = endpoint
+
+    def stage(self, name):
+        return _StageTimer(self, name)
+
+
+class PipelineMetrics:
+    """Registro de histogramas por endpoint y etapa"""
+
+    def __init__(self, namespace, sample_rate=METRICS_SAMPLE_RATE):
+        self.namespace = namespace
+        self.sample_rate = sample_rate
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def request(self, endpoint):
+        """Temporizador para una petición, o NOOP_TIMER si no se muestrea"""
+        if self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return NOOP_TIMER
+        return RequestTimer(self, endpoint)
+
+    def observe(self, endpoint, stage, seconds):
+        key = (endpoint, stage)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def render_prometheus(self):
+        """Exposición en formato de texto de Prometheus"""
+        name = f'{self.namespace}_stage_seconds'
+        lines = [
+            f'# HELP {name} Latencia por etapa del pipeline de interpretación',
+            f'# TYPE {name} histogram'
+        ]
+
+        with self._lock:
+            snapshot = [
+                (endpoint, stage, list(histogram.counts), histogram.total, histogram.count)
+                for (endpoint, stage), histogram in sorted(self._histograms.items())
+            ]
+
+        for endpoint, stage, counts, total, count in snapshot:
+            labels = f'endpoint="{endpoint}",stage="{stage}"'
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{{labels}}} {total}')
+            lines.append(f'{name}_count{{{labels}}} {count}')
+
+        lines.append(f'# HELP {self.namespace}_metrics_sample_rate Fracción de peticiones medidas')
+        lines.append(f'# TYPE {self.namespace}_metrics_sample_rate gauge')
+        lines.append(f'{self.namespace}_metrics_sample_rate {self.sample_rate}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,108 @@
+"""
+Clasificación vectorizada de valores de laboratorio
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Clasifica arreglos paralelos de códigos de examen y valores numéricos contra
+los rangos de referencia en una sola pasada de NumPy. Sirve igual para un
+informe, un lote de informes o millones de valores históricos.
+
+Con `sidecar`, los límites numéricos se escriben una vez en un archivo .npy y
+se mapean en memoria de solo lectura: todos los workers que cargan la misma
+versión comparten las mismas páginas.
+"""
+
+import os
+
+import numpy as np
+
+# Estados
+STATUS_UNKNOWN = -1
+STATUS_NORMAL = 0
+STATUS_LOW = 1
+STATUS_HIGH = 2
+
+# Niveles de preocupación
+CONCERN_LOW = 0
+CONCERN_MEDIUM = 1
+CONCERN_HIGH = 2
+
+# Etiquetas usadas por MedicalAI (indexadas por código; -1 apunta a la última)
+STATUS_LABELS = ('normal', 'bajo', 'elevado', 'unknown')
+CONCERN_LABELS = ('BAJA', 'MEDIA', 'ALTA')
+
+
+def map_bounds(bounds, path):
+    """
+    Mapear `bounds` desde el archivo `path` en solo lectura, escribiéndolo antes
+    si no existe (o no coincide). La escritura es atómica: un worker nunca lee
+    un archivo a medio escribir.
+    """
+    if os.path.exists(path):
+        mapped = np.load(path, mmap_mode='r')
+        if mapped.shape == bounds.shape and np.array_equal(mapped, bounds, equal_nan=True):
+            return mapped
+
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as output:
+        np.save(output, bounds)
+    os.replace(temporary, path)
+    return np.load(path, mmap_mode='r')
+
+
+class RangeTable:
+    """Rangos de referencia precompilados en arreglos indexados por código de examen"""
+
+    def __init__(self, reference_ranges, sidecar=None):
+        self.codes = tuple(reference_ranges)
+        self.index = {code: position for position, code in enumerate(self.codes)}
+
+        # Una fila centinela al final (NaN) recibe los códigos desconocidos (índice -1)
+        rows = len(self.codes) + 1
+        bounds = np.empty((4, rows))
+        bounds[0] = np.nan
+        bounds[1] = np.nan
+        bounds[2] = -np.inf
+        bounds[3] = np.inf
+
+        for position, code in enumerate(self.codes):
+            reference = reference_ranges[code]
+            bounds[0, position] = reference['min']
+            bounds[1, position] = reference['max']
+            critical = reference.get('critical')
+            if critical:
+                bounds[2, position] = critical['low']
+                bounds[3, position] = critical['high']
+
+        if sidecar:
+            bounds = map_bounds(bounds, sidecar)
+        bounds.setflags(write=False)
+        self.min, self.max, self.critical_low, self.critical_high = bounds
+
+    def lookup(self, codes):
+        """Convertir códigos de examen en índices de fila (-1 si no existe)"""
+        get = self.index.get
+        return np.fromiter((get(code, -1) for code in codes), dtype=np.intp, count=len(codes))
+
+    def classify(self, codes, values):
+        """Calcular estado y nivel de preocupación para todos los valores a la vez
+
+        `codes` puede ser una secuencia de códigos o un arreglo de índices ya
+        resuelto con lookup(). Devuelve dos arreglos int8 (estado, preocupación).
+        """
+        indices = codes if isinstance(codes, np.ndarray) else self.lookup(codes)
+        values = np.asarray(values, dtype=np.float64)
+
+        low = values < self.min[indices]
+        high = values > self.max[indices]
+        unknown = indices < 0
+
+        status = np.full(values.shape, STATUS_NORMAL, dtype=np.int8)
+        status[low] = STATUS_LOW
+        status[high] = STATUS_HIGH
+        status[unknown] = STATUS_UNKNOWN
+
+        critical = (low & (values < self.critical_low[indices])) | (high & (values > self.critical_high[indices]))
+        concern = np.where(low | high | unknown, CONCERN_MEDIUM, CONCERN_LOW).astype(np.int8)
+        concern[critical] = CONCERN_HIGH
+
+        return status, concern
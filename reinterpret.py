@@ -0,0 +1,240 @@
+"""
+Reinterpretación masiva de informes históricos
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Cuando cambian los rangos de medical_knowledge.json hay que volver a pasar
+todos los informes guardados por MedicalAI. Esta herramienta lee los informes
+de un directorio o de un archivo .zip/.tar(.gz), los analiza en un pool de
+procesos por bloques y escribe una línea JSON por informe.
+
+Tras cada bloque se guarda un checkpoint (informes procesados y bytes
+escritos); si el proceso se interrumpe, la siguiente ejecución descarta lo
+escrito después del último checkpoint y continúa desde ahí. La memoria no
+depende del número de informes: solo hay un bloque en vuelo.
+
+    python reinterpret.py informes/ --output reinterpretados.jsonl --workers 8
+    python reinterpret.py informes_2023.tar.gz --output 2023.jsonl --chunk-size 2000
+
+Cada informe es un .html/.htm o un .json con html_content y patient_info.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from datetime import datetime
+
+from fast_json import dumps
+
+REPORT_EXTENSIONS = ('.html', '.htm', '.json')
+
+# Informes por bloque (uno por checkpoint) y por tarea enviada a cada proceso
+CHUNK_SIZE = int(os.getenv('REINTERPRET_CHUNK_SIZE', '1000'))
+TASK_SIZE = int(os.getenv('REINTERPRET_TASK_SIZE', '16'))
+
+
+def _is_report(name):
+    return name.lower().endswith(REPORT_EXTENSIONS)
+
+
+def iter_reports(source):
+    """
+    (nombre, lector) por informe, en un orden estable entre ejecuciones. El
+    contenido se lee al llamar al lector, así que saltar informes ya
+    procesados no cuesta una lectura.
+    """
+    if os.path.isdir(source):
+        for root, directories, files in os.walk(source):
+            directories.sort()
+            for name in sorted(files):
+                if _is_report(name):
+                    path = os.path.join(root, name)
+                    yield os.path.relpath(path, source), lambda path=path: _read_file(path)
+
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for member in archive.infolist():
+                if not member.is_dir() and _is_report(member.filename):
+                    yield member.filename, lambda member=member: archive.read(member)
+
+    elif tarfile.is_tarfile(source):
+        # Modo secuencial: el .tar.gz se descomprime una sola vez, sin buscar hacia atrás
+        with tarfile.open(source, 'r|*') as archive:
+            for member in archive:
+                if member.isfile() and _is_report(member.name):
+                    yield member.name, lambda member=member: archive.extractfile(member).read()
+
+    else:
+        raise ValueError(f'{source} no es un directorio ni un archivo .zip/.tar')
+
+
+def _read_file(path):
+    with open(path, 'rb') as report:
+        return report.read()
+
+
+def reinterpret_report(task):
+    """Analizar un informe (se ejecuta en un proceso del pool). Devuelve (éxito, línea JSON en bytes)."""
+    from backend_medical_ai import analyze_document
+
+    name, content = task
+    try:
+        if name.lower().endswith('.json'):
+            document = json.loads(content)
+            html_content = document['html_content']
+            patient_info = document.get('patient_info') or {}
+        else:
+            html_content = content.decode('utf-8', errors='replace')
+            patient_info = {}
+        # Sin historial: los informes ya están registrados y no se deben duplicar
+        response = analyze_document(html_content, patient_info, history=None)
+    except Exception as e:
+        response = {'success': False, 'error': f'Error interno en el análisis: {e}'}
+
+    if response is None:
+        response = {'success': False, 'error': 'No se pudieron extraer valores de laboratorio del contenido HTML'}
+    return bool(response.get('success')), dumps({'source': name, **response})
+
+
+def _chunks(reports, size, skip):
+    """Bloques de (nombre, contenido) de `size` informes, saltando los `skip` primeros"""
+    chunk = []
+    for position, (name, read) in enumerate(reports):
+        if position < skip:
+            continue
+        chunk.append((name, read()))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Checkpoint:
+    """Progreso de una ejecución, guardado de forma atómica junto a la salida"""
+
+    def __init__(self, output):
+        self.path = f'{output}.checkpoint.json'
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding='utf-8') as source:
+            return json.load(source)
+
+    def save(self, state):
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as target:
+            json.dump(state, target)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def reinterpret(source, output, workers=None, chunk_size=CHUNK_SIZE, task_size=TASK_SIZE, restart=False,
+                progress=print):
+    """Reinterpretar todos los informes de `source` en `output` (JSONL). Devuelve el resumen."""
+    # El pipeline se importa antes del fork: los procesos del pool lo heredan ya cargado
+    import backend_medical_ai  # noqa: F401
+    from medical_knowledge import knowledge_store
+
+    # Una sola versión de la base de conocimiento para toda la ejecución
+    knowledge_store.reload_interval = 0
+    knowledge_version = knowledge_store.current().version
+
+    checkpoint = Checkpoint(output)
+    state = None if restart else checkpoint.load()
+    if state is not None:
+        if state['source'] != os.path.abspath(source):
+            raise ValueError(f'El checkpoint es de {state["source"]}; usar --restart para empezar de nuevo')
+        if state['knowledge_version'] != knowledge_version:
+            raise ValueError(
+                f'La base de conocimiento cambió ({state["knowledge_version"]} -> {knowledge_version}); '
+                'usar --restart para reinterpretar desde el principio'
+            )
+        # truncate() rellenaría con ceros una salida borrada o recortada
+        written = os.path.getsize(output) if os.path.exists(output) else 0
+        if written < state['output_bytes']:
+            raise ValueError(
+                f'{output} tiene {written} bytes y el checkpoint registra {state["output_bytes"]}; '
+                'usar --restart para reinterpretar desde el principio'
+            )
+        progress(f'Reanudando tras {state["processed"]} informes')
+    else:
+        if not restart and os.path.exists(output) and os.path.getsize(output) > 0:
+            raise ValueError(f'{output} ya tiene resultados y no hay checkpoint; usar --restart para sobrescribirlo')
+        state = {
+            'source': os.path.abspath(source),
+            'knowledge_version': knowledge_version,
+            'processed': 0,
+            'failed': 0,
+            'output_bytes': 0,
+            'started_at': datetime.now().isoformat(timespec='seconds')
+        }
+
+    started = time.perf_counter()
+    processed_now = 0
+    with open(output, 'ab') as target:
+        # Descartar lo escrito después del último checkpoint
+        target.truncate(state['output_bytes'])
+        target.seek(state['output_bytes'])
+
+        with multiprocessing.Pool(workers) as pool:
+            for chunk in _chunks(iter_reports(source), chunk_size, state['processed']):
+                for success, line in pool.map(reinterpret_report, chunk, chunksize=task_size):
+                    target.write(line)
+                    target.write(b'\n')
+                    state['failed'] += not success
+                target.flush()
+                os.fsync(target.fileno())
+
+                state['processed'] += len(chunk)
+                state['output_bytes'] = target.tell()
+                checkpoint.save(state)
+
+                processed_now += len(chunk)
+                elapsed = time.perf_counter() - started
+                progress(f'{state["processed"]} informes ({processed_now / elapsed:.1f} docs/s)')
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        'processed': state['processed'],
+        'failed': state['failed'],
+        'processed_this_run': processed_now,
+        'seconds': round(elapsed, 2),
+        'docs_per_second': round(processed_now / elapsed, 1) if elapsed else None,
+        'knowledge_version': knowledge_version,
+        'output': output
+    }
+    checkpoint.clear()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reinterpretación masiva de informes con MedicalAI')
+    parser.add_argument('source', help='directorio o archivo .zip/.tar(.gz) con informes')
+    parser.add_argument('--output', required=True, help='archivo JSONL de resultados')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='informes por checkpoint')
+    parser.add_argument('--task-size', type=int, default=TASK_SIZE, help='informes por tarea del pool')
+    parser.add_argument('--restart', action='store_true', help='ignorar el checkpoint y sobrescribir la salida')
+    args = parser.parse_args()
+
+    try:
+        summary = reinterpret(args.source, args.output, args.workers, args.chunk_size, args.task_size,
+                              restart=args.restart, progress=lambda message: print(message, file=sys.stderr))
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(json.dumps(summary, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Caché de resultados de interpretación direccionada por contenido
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+La clave es un hash del HTML normalizado, los datos del paciente y la versión
+de la base de conocimiento. Se guarda la respuesta ya serializada para que un
+acierto no vuelva a pasar por el pipeline ni por el codificador JSON.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+TTL_SECONDS = float(os.getenv('RESULT_CACHE_TTL_SECONDS', '3600'))
+
+
+def fingerprint(data):
+    """Huella estable de una estructura JSON (p. ej. la base de conocimiento)"""
+    canonical = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:12]
+
+
+def make_key(html_content, patient_info, knowledge_version):
+    """Clave de caché: el espaciado del HTML no cambia el resultado"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(knowledge_version.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(json.dumps(patient_info, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(' '.join(html_content.split()).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """LRU con presupuesto en bytes y expiración por TTL"""
+
+    def __init__(self, max_bytes=MAX_BYTES, ttl_seconds=TTL_SECONDS, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key):
+        """Devolver el cuerpo serializado o None"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            body, expires_at = entry
+            if expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        """Guardar un cuerpo serializado (bytes), desalojando los menos usados"""
+        if not self.enabled or len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (body, self._clock() + self.ttl_seconds)
+            self._bytes += len(body)
+
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Contadores para los endpoints de salud"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def _remove(self, key):
+        body, _ = self._entries.pop(key)
+        self._bytes -= len(body)
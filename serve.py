@@ -0,0 +1,113 @@
+"""
+Lanzador de producción para los backends médicos
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Arranca N workers preforkeados con gunicorn. El estado de solo lectura (base
+de conocimiento y, si se pide, el modelo Labrador) se carga una vez en el
+proceso maestro antes del fork y los workers lo comparten copy-on-write.
+
+    python serve.py medical-ai --workers 4 --threads 2
+    python serve.py medical-interpret --bind 0.0.0.0:5000
+"""
+
+import argparse
+import gc
+import importlib
+import os
+
+from structured_logging import configure_logging, get_logger
+
+logger = get_logger(__name__)
+
+# Servicio -> (módulo, puerto por defecto)
+SERVICES = {
+    'medical-ai': ('backend_medical_ai', 5001),
+    'medical-interpret': ('backend_medical_api', 5000)
+}
+
+# preload: cargar en el maestro antes del fork (memoria compartida)
+# per-worker: cada worker lo carga en segundo plano tras el fork
+# disabled: no cargar el modelo
+MODEL_LOAD_CHOICES = ('preload', 'per-worker', 'disabled')
+
+
+def load_service(service, model_load):
+    """Importar el backend y cargar su estado de solo lectura antes del fork"""
+    module = importlib.import_module(SERVICES[service][0])
+    labrador = getattr(module, 'labrador', None)
+
+    if labrador is not None and model_load == 'preload':
+        labrador.load()
+
+    # El módulo ya construye su app al importarse (gunicorn backend_medical_ai:app);
+    # una segunda create_app() duplicaría hooks, middleware y el log de arranque
+    app = module.app
+
+    # Congelar los objetos ya creados: el recolector no los toca y sus páginas
+    # no se copian en los workers por cambios en los contadores del GC
+    gc.collect()
+    gc.freeze()
+    return module, app
+
+
+def build_options(args):
+    return {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread' if args.threads > 1 else 'sync',
+        'preload_app': True,
+        'timeout': args.timeout,
+        'graceful_timeout': args.timeout,
+        'keepalive': 5,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10 if args.max_requests else 0,
+        'accesslog': '-' if args.access_log else None,
+        'errorlog': '-'
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor de producción para los backends médicos')
+    parser.add_argument('service', choices=sorted(SERVICES))
+    parser.add_argument('--bind', default=None, help='host:puerto (por defecto 0.0.0.0:<puerto del servicio>)')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SERVE_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--threads', type=int, default=int(os.getenv('SERVE_THREADS', '2')))
+    parser.add_argument('--timeout', type=int, default=int(os.getenv('SERVE_TIMEOUT', '60')))
+    parser.add_argument('--max-requests', type=int, default=int(os.getenv('SERVE_MAX_REQUESTS', '0')))
+    parser.add_argument('--model-load', choices=MODEL_LOAD_CHOICES, default=os.getenv('SERVE_MODEL_LOAD', 'preload'))
+    parser.add_argument('--access-log', action='store_true')
+    args = parser.parse_args()
+
+    if args.bind is None:
+        args.bind = f'0.0.0.0:{SERVICES[args.service][1]}'
+
+    if args.model_load == 'disabled':
+        os.environ['LABRADOR_LOAD_MODE'] = 'disabled'
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit('gunicorn no está instalado: pip install -r requirements_medical.txt')
+
+    configure_logging()
+    module, app = load_service(args.service, args.model_load)
+    labrador = getattr(module, 'labrador', None)
+
+    class MedicalServer(BaseApplication):
+        def load_config(self):
+            for key, value in build_options(args).items():
+                if value is not None:
+                    self.cfg.set(key, value)
+            if labrador is not None and args.model_load == 'per-worker':
+                self.cfg.set('post_fork', lambda server, worker: labrador.start_background_load())
+
+        def load(self):
+            return app
+
+    logger.info('server_starting', service=args.service, bind=args.bind, workers=args.workers, threads=args.threads)
+    MedicalServer().run()
+
+
+if __name__ == '__main__':
+    main()
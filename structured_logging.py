@@ -0,0 +1,178 @@
+"""
+Logging estructurado (JSON) con muestreo por endpoint y escritura asíncrona
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+Los eventos se crean en el hilo de la petición y se encolan sin formatear; un
+hilo aparte (QueueListener) los renderiza como JSON y los escribe. Cada
+petición recibe un request_id (o reutiliza X-Request-ID) que se adjunta a
+todas sus líneas. La decisión de muestreo se toma una vez por petición, así
+que una petición queda registrada completa o no se registra; advertencias y
+errores nunca se descartan.
+
+    LOG_SAMPLE_RATES="/api/medical-ai/analyze=0.1,/api/medical-interpret=0.1,default=1"
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+
+import structlog
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', '')
+
+_sampled = ContextVar('log_sampled', default=True)
+_listener = None
+
+
+def parse_sample_rates(spec):
+    """'ruta=tasa,...' -> {ruta: tasa}; la clave 'default' aplica al resto"""
+    rates = {}
+    for item in spec.split(','):
+        if '=' in item:
+            path, rate = item.rsplit('=', 1)
+            rates[path.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+SAMPLE_RATES = parse_sample_rates(LOG_SAMPLE_RATES)
+
+
+class _SamplingFilter(logging.Filter):
+    """Descartar INFO/DEBUG de peticiones no muestreadas (también de loggers stdlib)"""
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+class _EnqueueHandler(logging.handlers.QueueHandler):
+    """Encolar el registro tal cual: el formateo ocurre en el hilo del listener"""
+
+    def prepare(self, record):
+        return record
+
+
+def _drop_unsampled(logger, method_name, event_dict):
+    if method_name in ('debug', 'info') and not _sampled.get():
+        raise structlog.DropEvent
+    return event_dict
+
+
+def _add_record_time(logger, method_name, event_dict):
+    """Marca de tiempo del momento del evento, no del momento de escritura"""
+    record = event_dict.get('_record')
+    if record is not None:
+        event_dict['timestamp'] = _TIME_FORMATTER.formatTime(record)
+    return event_dict
+
+
+class _IsoTimeFormatter(logging.Formatter):
+    default_time_format = '%Y-%m-%dT%H:%M:%S'
+    default_msec_format = '%s.%03d'
+
+
+_TIME_FORMATTER = _IsoTimeFormatter()
+
+
+def configure_logging(level=LOG_LEVEL, stream=None):
+    """Configurar structlog y el handler con cola; es idempotente"""
+    global _listener
+    if _listener is not None:
+        return
+
+    shared = [structlog.stdlib.add_log_level, structlog.stdlib.add_logger_name]
+    formatter = structlog.stdlib.ProcessorFormatter(
+        foreign_pre_chain=shared,
+        processors=[
+            _add_record_time,
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.format_exc_info,
+            structlog.processors.JSONRenderer(ensure_ascii=False)
+        ]
+    )
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    enqueue = _EnqueueHandler(log_queue)
+    enqueue.addFilter(_SamplingFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [enqueue]
+    root.setLevel(level)
+
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            _drop_unsampled,
+            structlog.contextvars.merge_contextvars,
+            *shared,
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True
+    )
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    # El hilo de escritura no sobrevive a fork (workers de gunicorn con preload, pool de lotes)
+    os.register_at_fork(after_in_child=_restart_listener)
+
+
+def _restart_listener():
+    global _listener
+    if _listener is not None:
+        _listener = logging.handlers.QueueListener(_listener.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown_logging():
+    """Vaciar la cola y detener el hilo de escritura"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name):
+    return structlog.get_logger(name)
+
+
+def bind_request(path, request_id=None):
+    """Iniciar el contexto de log de una petición; devuelve su request_id"""
+    request_id = request_id or uuid.uuid4().hex
+    rate = SAMPLE_RATES.get(path, SAMPLE_RATES.get('default', 1.0))
+    _sampled.set(rate >= 1.0 or random.random() < rate)
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(request_id=request_id, path=path)
+    return request_id
+
+
+def init_app(app):
+    """Registrar en la app Flask el request_id y el muestreo por petición"""
+    from flask import g, request
+
+    @app.before_request
+    def _bind_request_logging():
+        g.request_id = bind_request(request.path, request.headers.get('X-Request-ID'))
+
+    @app.after_request
+    def _expose_request_id(response):
+        request_id = getattr(g, 'request_id', None)
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        return response
+
+    @app.teardown_request
+    def _unbind_request_logging(exc):
+        structlog.contextvars.clear_contextvars()
+        _sampled.set(True)
@@ -0,0 +1,123 @@
+"""
+Pruebas de ai_providers.py contra el servidor stub local (ai_stub_server.py)
+"""
+
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from ai_providers import AIProviderClient, GeminiProvider, OpenAIProvider
+from ai_stub_server import STUB_INTERPRETATION, StubAIServer
+
+SLOW_DELAY_S = 1.0
+
+
+@pytest.fixture
+def stub():
+    with StubAIServer(slow_delay_s=SLOW_DELAY_S) as server:
+        yield server
+
+
+def make_client(stub, *modes, latency_budget_ms=2000, max_concurrency=8):
+    providers = [
+        OpenAIProvider('stub-key', base_url=stub.base_url(mode), max_concurrency=max_concurrency)
+        for mode in modes
+    ]
+    return AIProviderClient(providers, latency_budget_ms=latency_budget_ms)
+
+
+def test_fast_provider_answers(stub):
+    client = make_client(stub, 'fast')
+    try:
+        assert client.interpret('prompt') == STUB_INTERPRETATION
+        assert client.status()['answered'] == 1
+    finally:
+        client.close()
+
+
+def test_failing_provider_falls_back_to_next(stub):
+    client = make_client(stub, 'fail', 'fast')
+    try:
+        assert client.interpret('prompt') == STUB_INTERPRETATION
+        assert stub.requests['fail'] == 1
+        assert stub.requests['fast'] == 1
+    finally:
+        client.close()
+
+
+def test_all_providers_failing_returns_none(stub):
+    client = make_client(stub, 'fail', 'fail')
+    try:
+        assert client.interpret('prompt') is None
+        assert client.status()['errors'] == 1
+    finally:
+        client.close()
+
+
+def test_slow_provider_falls_back_within_budget(stub):
+    budget_ms = 200
+    client = make_client(stub, 'slow', latency_budget_ms=budget_ms)
+    try:
+        started = time.perf_counter()
+        assert client.interpret('prompt') is None
+        elapsed = time.perf_counter() - started
+
+        assert elapsed < budget_ms / 1000 + 0.3
+        assert elapsed < SLOW_DELAY_S
+        assert client.status()['hedged'] == 1
+    finally:
+        client.close()
+
+
+def test_per_provider_concurrency_limit(stub):
+    stub.slow_delay_s = 0.2
+    client = make_client(stub, 'slow', latency_budget_ms=10000, max_concurrency=2)
+    results = []
+    try:
+        threads = [threading.Thread(target=lambda: results.append(client.interpret('prompt'))) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == [STUB_INTERPRETATION] * 6
+        assert stub.requests['slow'] == 6
+        assert stub.max_in_flight['slow'] == 2
+    finally:
+        client.close()
+
+
+def test_gemini_sends_key_in_header():
+    seen = {}
+
+    def handler(request):
+        seen['url'] = str(request.url)
+        seen['key'] = request.headers.get('x-goog-api-key')
+        return httpx.Response(200, json={'candidates': [{'content': {'parts': [{'text': 'ok'}]}}]})
+
+    async def complete():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await GeminiProvider('secret-key', base_url='http://gemini.test').complete(client, 'prompt')
+
+    assert asyncio.run(complete()) == 'ok'
+    assert seen['key'] == 'secret-key'
+    assert 'secret-key' not in seen['url']
+
+
+def test_provider_failure_log_has_no_url(stub, capsys, caplog):
+    client = make_client(stub, 'fail')
+    try:
+        assert client.interpret('prompt') is None
+    finally:
+        client.close()
+
+    output = capsys.readouterr()
+    # Consola de structlog, o logging estándar si otra prueba ya configuró el JSON
+    log = output.out + output.err + caplog.text
+    # Solo los eventos propios (httpx registra la URL por su cuenta)
+    events = [line for line in log.splitlines() if 'ai_provider' in line]
+    assert any('HTTPStatusError' in line and '500' in line for line in events)
+    assert not any('127.0.0.1' in line for line in events)
@@ -0,0 +1,89 @@
+"""
+Pruebas del endpoint de lotes /api/medical-ai/analyze-batch
+"""
+
+import json
+
+import pytest
+
+import backend_medical_ai
+from lab_history import LabHistory
+
+URL = '/api/medical-ai/analyze-batch'
+REPORT = '<table><tr><td>Glucosa</td><td>{}</td><td>mg/dl</td></tr></table>'
+
+
+@pytest.fixture(scope='module')
+def client():
+    return backend_medical_ai.create_app().test_client()
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    history = LabHistory(str(tmp_path / 'history.sqlite3'))
+    monkeypatch.setattr(backend_medical_ai, 'lab_history', history)
+    return history
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Forzar el pool de procesos (2 workers) y cerrarlo al terminar"""
+    monkeypatch.setattr(backend_medical_ai, 'BATCH_POOL_THRESHOLD', 1)
+    monkeypatch.setattr(backend_medical_ai, 'BATCH_WORKERS', 2)
+    yield
+    if backend_medical_ai._batch_pool is not None:
+        backend_medical_ai._batch_pool.shutdown()
+        backend_medical_ai._batch_pool = None
+
+
+def documents(count, patient_id=None):
+    return [
+        {
+            'html_content': REPORT.format(90 + 10 * number),
+            'patient_info': {'patient_id': patient_id, 'observed_at': f'2024-05-0{number + 1}T08:00:00'}
+            if patient_id else {}
+        }
+        for number in range(count)
+    ]
+
+
+def test_invalid_documents_are_reported_per_index(client):
+    batch = documents(2)
+    batch.insert(1, {'patient_info': {}})
+    batch.append({'html_content': REPORT.format(95), 'patient_info': {'observed_at': 'ayer'}})
+
+    body = client.post(URL, json={'documents': batch}).get_json()
+    assert (body['total'], body['succeeded'], body['failed']) == (4, 2, 2)
+    assert [error['index'] for error in body['errors']] == [1, 3]
+    assert [result['success'] for result in body['results']] == [True, False, True, False]
+
+
+@pytest.mark.parametrize('payload', [{}, {'documents': []}, {'documents': 'x'}])
+def test_documents_required(client, payload):
+    assert client.post(URL, json=payload).status_code == 400
+
+
+def test_batch_size_limit(client, monkeypatch):
+    monkeypatch.setattr(backend_medical_ai, 'BATCH_MAX_DOCUMENTS', 2)
+    assert client.post(URL, json={'documents': documents(3)}).status_code == 413
+
+
+def test_pool_results_keep_order_and_history_is_recorded_once(client, history, pool):
+    body = client.post(URL, json={'documents': documents(6, patient_id='P-1')}).get_json()
+
+    assert body['succeeded'] == 6
+    data = [result['data'] for result in body['results']]
+    values = [(item['normal_values'] + item['abnormal_values'])[0]['value'] for item in data]
+    assert values == [f'{90 + 10 * number}.0 mg/dl' for number in range(6)]
+    assert backend_medical_ai._batch_pool is not None
+    assert history.status()['reports'] == 6
+    assert history.stats('P-1', 'GLUCOSA')['count'] == 6
+
+
+def test_stream_mode(client, pool):
+    response = client.post(f'{URL}?stream=1', json={'documents': documents(3) + [{}]})
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert [record['type'] for record in records] == ['document'] * 4 + ['batch_summary']
+    assert [record['index'] for record in records[:4]] == [0, 1, 2, 3]
+    assert records[-1]['failed'] == 1
@@ -0,0 +1,71 @@
+"""
+Pruebas de la caché de embeddings (embedding_cache.py): claves canónicas, LRU
+y nivel en disco compartido
+"""
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache, panel_key
+
+REFERENCE_RANGES = {'GLUCOSA': {'min': 70, 'max': 100}}
+
+
+def vector(seed, dim=8):
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def test_close_values_share_key():
+    assert panel_key(['GLUCOSA'], [90.1], REFERENCE_RANGES) == panel_key(['GLUCOSA'], [90.4], REFERENCE_RANGES)
+    assert panel_key(['GLUCOSA'], [90], REFERENCE_RANGES) != panel_key(['GLUCOSA'], [99], REFERENCE_RANGES)
+
+
+def test_key_is_order_independent():
+    ranges = {**REFERENCE_RANGES, 'UREA': {'min': 7, 'max': 20}}
+    assert panel_key(['UREA', 'GLUCOSA'], [10, 90], ranges) == panel_key(['GLUCOSA', 'UREA'], [90, 10], ranges)
+
+
+def test_memory_lru():
+    cache = EmbeddingCache('modelo', max_entries=2, directory='')
+    for seed in range(3):
+        cache.put(('panel', seed), vector(seed))
+
+    assert cache.get(('panel', 0)) is None
+    np.testing.assert_array_equal(cache.get(('panel', 2)), vector(2))
+    stats = cache.stats()
+    assert (stats['entries'], stats['hits'], stats['misses']) == (2, 1, 1)
+
+
+def test_disk_level_is_shared(tmp_path):
+    writer = EmbeddingCache('modelo', directory=str(tmp_path), disk_slots=64)
+    writer.put(('panel', 1), vector(1))
+
+    reader = EmbeddingCache('modelo', directory=str(tmp_path), disk_slots=64)
+    np.testing.assert_array_equal(reader.get(('panel', 1)), vector(1))
+    assert reader.stats()['disk_hits'] == 1
+    assert EmbeddingCache('otro-modelo', directory=str(tmp_path)).get(('panel', 1)) is None
+
+
+def test_other_dimension_is_a_miss(tmp_path):
+    old = EmbeddingCache('modelo', directory=str(tmp_path), disk_slots=64)
+    old.put(('panel', 1), vector(1, dim=8))
+
+    cache = EmbeddingCache('modelo', directory=str(tmp_path), disk_slots=64)
+    cache.put(('panel', 2), vector(2, dim=16))
+    # Ya hay dos archivos: se usa el de la dimensión vigente
+    assert cache.get(('panel', 1)) is None
+    assert cache.get(('panel', 2)).shape == (16,)
+    assert cache.stats()['disk'].endswith('-16.npy')
+
+    fresh = EmbeddingCache('modelo', directory=str(tmp_path), disk_slots=64)
+    # Con archivos de dos dimensiones no se adivina cuál usar hasta el primer put
+    assert fresh.get(('panel', 2)) is None
+    fresh.put(('panel', 3), vector(3, dim=16))
+    assert fresh.get(('panel', 2)).shape == (16,)
+
+
+def test_memory_entries_of_previous_dimension_are_dropped():
+    cache = EmbeddingCache('modelo', directory='')
+    cache.put(('panel', 1), vector(1, dim=8))
+    cache.put(('panel', 2), vector(2, dim=16))
+    assert cache.get(('panel', 1)) is None
+    assert cache.stats()['entries'] == 1
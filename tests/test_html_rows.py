@@ -0,0 +1,49 @@
+"""
+Pruebas de la etapa HTML -> filas de lab_extraction.iter_lab_rows
+"""
+
+import pytest
+
+from lab_extraction import iter_lab_rows
+
+REPORT = '''<html><head><style>.x{color:red} GLUCOSA: 999</style><script>var GLUCOSA = 1</script></head><body>
+<table><tr><th>Examen</th><th>Resultado</th><th>Unidad</th><th>Referencia</th></tr>
+<tr><td>Glucosa</td><td>95</td><td>mg/dl</td><td>70 - 100</td></tr>
+<tr><td>Hemoglobina</td><td>14,2 g/dl</td><td>12-16</td></tr>
+<tr><td>Creatinina: 1.1 mg/dl</td></tr></table>
+<p>Urea&nbsp;=&nbsp;15</p><!-- Colesterol: 500 --><img src="data:image/png;base64,AAAA"></body></html>'''
+
+EXPECTED = [
+    ('Glucosa', 95.0, 'mg/dl', '70 - 100'),
+    ('Hemoglobina', 14.2, 'g/dl', '12-16'),
+    ('Creatinina', 1.1, 'mg/dl', ''),
+    ('Urea', 15.0, '', '')
+]
+
+
+def rows(html, **kwargs):
+    return [(value.name, value.value, value.unit, value.reference_range) for value in iter_lab_rows(html, **kwargs)]
+
+
+def test_tables_and_text_lines():
+    # Estilos, scripts, comentarios e imágenes no llegan a los patrones
+    assert rows(REPORT) == EXPECTED
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64])
+def test_result_does_not_depend_on_chunking(chunk_size):
+    assert rows(REPORT, chunk_size=chunk_size) == EXPECTED
+
+
+def test_block_elements_split_lines():
+    assert rows('<div>Glucosa: 95</div><div>Urea: 15</div>') == [('Glucosa', 95.0, '', ''), ('Urea', 15.0, '', '')]
+    assert rows('Glucosa: 95<br>Urea: 15') == [('Glucosa', 95.0, '', ''), ('Urea', 15.0, '', '')]
+
+
+def test_soft_wraps_are_whitespace():
+    assert rows('<p>Colesterol\n   total: 210 mg/dl</p>') == [('Colesterol total', 210.0, 'mg/dl', '')]
+
+
+@pytest.mark.parametrize('html', ['', '   ', '<p></p>', '<table><tr><td>Examen</td></tr></table>'])
+def test_documents_without_values(html):
+    assert rows(html) == []
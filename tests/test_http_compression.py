@@ -0,0 +1,117 @@
+"""
+Pruebas de límites de petición y compresión HTTP (http_compression.py)
+"""
+
+import gzip
+import json
+import zlib
+
+import pytest
+from flask import Flask, request
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+import http_compression
+from fast_json import ndjson_response
+from http_compression import RequestLimits
+
+MAX_BYTES = 1024
+MAX_DECOMPRESSED = 4096
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return {'size': len(request.get_data()), 'json': request.get_json(silent=True)}
+
+    @app.route('/big')
+    def big():
+        return {'values': list(range(2000))}
+
+    @app.route('/stream')
+    def stream():
+        return ndjson_response({'type': 'value', 'n': n} for n in range(3))
+
+    http_compression.init_app(app)
+    app.wsgi_app = RequestLimits(app.wsgi_app.wsgi_app, MAX_BYTES, MAX_DECOMPRESSED)
+    return app
+
+
+@pytest.fixture
+def app():
+    return make_app()
+
+
+def post(app, body, headers=None, content_length=None):
+    """Llamar a la app WSGI directamente: el cliente de pruebas recalcula Content-Length"""
+    environ = EnvironBuilder(path='/echo', method='POST', data=body, headers=headers or {},
+                             content_type='application/json').get_environ()
+    if content_length is not None:
+        environ['CONTENT_LENGTH'] = content_length
+    chunks, status, _ = run_wsgi_app(app.wsgi_app, environ, buffered=True)
+    return int(status.split()[0]), json.loads(b''.join(chunks))
+
+
+PAYLOAD = json.dumps({'valores': [1, 2, 3]}).encode('utf-8')
+
+
+def test_plain_body_passes_through(app):
+    assert post(app, PAYLOAD) == (200, {'size': len(PAYLOAD), 'json': {'valores': [1, 2, 3]}})
+
+
+@pytest.mark.parametrize('encoding, compress', [('gzip', gzip.compress), ('deflate', zlib.compress)])
+def test_compressed_body_is_decoded(app, encoding, compress):
+    status, body = post(app, compress(PAYLOAD), {'Content-Encoding': encoding})
+    assert status == 200
+    assert body['json'] == {'valores': [1, 2, 3]}
+
+
+@pytest.mark.parametrize('encoding, compress', [('gzip', gzip.compress), ('deflate', zlib.compress)])
+def test_truncated_compressed_body_is_rejected(app, encoding, compress):
+    truncated = compress(PAYLOAD)[:-6]
+    assert post(app, truncated, {'Content-Encoding': encoding}) == (400, {'error': 'Cuerpo comprimido truncado'})
+
+
+def test_corrupt_compressed_body_is_rejected(app):
+    status, body = post(app, b'no es gzip', {'Content-Encoding': 'gzip'})
+    assert status == 400
+    assert body == {'error': 'Cuerpo comprimido inválido'}
+
+
+def test_body_over_limit(app):
+    assert post(app, b'x' * (MAX_BYTES + 1))[0] == 413
+
+
+def test_compression_bomb(app):
+    bomb = gzip.compress(b'0' * (MAX_DECOMPRESSED * 10))
+    assert len(bomb) < MAX_BYTES
+    assert post(app, bomb, {'Content-Encoding': 'gzip'})[0] == 413
+
+
+def test_unsupported_encoding(app):
+    assert post(app, PAYLOAD, {'Content-Encoding': 'compress'})[0] == 415
+
+
+@pytest.mark.parametrize('content_length', ['-1', '1_0', 'abc', '+5'])
+def test_malformed_content_length(app, content_length):
+    assert post(app, PAYLOAD, content_length=content_length) == (400, {'error': 'Content-Length inválido'})
+
+
+def test_response_is_gzipped(app):
+    response = app.test_client().get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.get_data()))['values'][-1] == 1999
+
+
+def test_small_response_is_not_compressed(app):
+    response = app.test_client().post('/echo', data=PAYLOAD, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_stream_is_compressed_per_record(app):
+    response = app.test_client().get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.get_data()).decode('utf-8').splitlines()
+    assert [json.loads(line)['n'] for line in lines] == [0, 1, 2]
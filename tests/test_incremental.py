@@ -0,0 +1,130 @@
+"""
+Pruebas de la reinterpretación incremental (incremental.py) y de previous_result_id
+"""
+
+import pytest
+
+import backend_medical_ai
+import backend_medical_api
+from incremental import Snapshot, SnapshotStore, findings_signature, reanalyze, row_key
+from result_cache import ResultCache
+
+ROW = '<tr><td>{}</td><td>{}</td><td>mg/dl</td></tr>'
+
+
+def report(**values):
+    return '<table>' + ''.join(ROW.format(name, value) for name, value in values.items()) + '</table>'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def snapshot(label):
+    return Snapshot('v1', {}, [], [], (), label)
+
+
+def test_store_expires_entries():
+    clock = Clock()
+    store = SnapshotStore(max_entries=4, ttl_seconds=10, clock=clock)
+    result_id = store.put(snapshot('a'))
+
+    assert store.get(result_id).aggregates == 'a'
+    clock.now = 10
+    assert store.get(result_id) is None
+    assert (store.stats()['hits'], store.stats()['misses'], store.stats()['entries']) == (1, 1, 0)
+
+
+def test_store_evicts_least_recently_used():
+    store = SnapshotStore(max_entries=2, ttl_seconds=60)
+    first, second = store.put(snapshot('a')), store.put(snapshot('b'))
+    store.get(first)
+    third = store.put(snapshot('c'))
+
+    assert store.get(second) is None
+    assert store.get(first) is not None and store.get(third) is not None
+
+
+def test_disabled_store():
+    store = SnapshotStore(max_entries=0)
+    assert store.put(snapshot('a')) is None
+    assert store.get('cualquiera') is None
+
+
+def test_reanalyze_only_changed_rows():
+    values = [{'name': 'Glucosa', 'value': 95.0}, {'name': 'Urea', 'value': 15.0}, {'name': 'Urea', 'value': 15.0}]
+    previous = Snapshot('v1', {}, [row_key(value) for value in values], ['g', 'u1', 'u2'], (), None)
+    calls = []
+
+    def analyze(changed):
+        calls.append(changed)
+        return [f"nuevo-{value['name']}" for value in changed]
+
+    edited = [values[1], {'name': 'Glucosa', 'value': 180.0}, values[2]]
+    rows, results, reanalyzed = reanalyze(previous, edited, analyze)
+
+    assert reanalyzed == 1
+    assert calls == [[{'name': 'Glucosa', 'value': 180.0}]]
+    # Las filas duplicadas reutilizan cada resultado una sola vez
+    assert sorted([results[0], results[2]]) == ['u1', 'u2']
+    assert results[1] == 'nuevo-Glucosa'
+    assert rows == [row_key(value) for value in edited]
+
+
+def test_findings_signature_ignores_order():
+    values = [{'name': 'Urea', 'status': 'normal'}, {'name': 'Glucosa', 'status': 'alto'}]
+    assert findings_signature(values, ('name', 'status')) == findings_signature(values[::-1], ('name', 'status'))
+
+
+@pytest.fixture
+def counted_rows(monkeypatch):
+    """Contar las filas que llegan al análisis por fila de backend_medical_ai"""
+    counted = []
+    analyze_values = backend_medical_ai.medical_ai.analyze_values
+
+    def counting(values, patient_info):
+        counted.append(len(values))
+        return analyze_values(values, patient_info)
+
+    monkeypatch.setattr(backend_medical_ai.medical_ai, 'analyze_values', counting)
+    monkeypatch.setattr(backend_medical_ai, 'snapshots', SnapshotStore(max_entries=8))
+    return counted
+
+
+def test_medical_ai_edit_reanalyzes_changed_rows(counted_rows):
+    client = backend_medical_ai.create_app().test_client()
+    url = '/api/medical-ai/analyze'
+
+    first = client.post(url, json={'html_content': report(Glucosa=95, Urea=15, Creatinina=1)}).get_json()
+    assert first['result_id']
+
+    edited = client.post(url, json={'html_content': report(Glucosa=180, Urea=15, Creatinina=1),
+                                    'previous_result_id': first['result_id']}).get_json()
+    assert counted_rows == [3, 1]
+    assert [value['value'] for value in edited['data']['abnormal_values']] == ['180.0 mg/dl']
+
+    fresh = client.post(url, json={'html_content': report(Glucosa=180, Urea=15, Creatinina=1, Colesterol=150),
+                                   'previous_result_id': 'caducado'}).get_json()
+    assert fresh['success'] is True
+    assert counted_rows[-1] == 4
+
+
+def test_medical_interpret_edit_matches_full_analysis(monkeypatch):
+    monkeypatch.setattr(backend_medical_api, 'snapshots', SnapshotStore(max_entries=8))
+    monkeypatch.setattr(backend_medical_api, 'result_cache', ResultCache(max_bytes=0))
+    client = backend_medical_api.create_app().test_client()
+    url = '/api/medical-interpret'
+
+    first = client.post(url, json={'html_content': report(Glucosa=95, Urea=15)}).get_json()
+    edited_html = report(Glucosa=95, Urea=40)
+    edited = client.post(url, json={'html_content': edited_html, 'previous_result_id': first['result_id']}).get_json()
+    full = client.post(url, json={'html_content': edited_html}).get_json()
+
+    assert edited['result_id'] != first['result_id']
+    for field in ('summary', 'normal_values', 'abnormal_values', 'urgency'):
+        assert edited['data'][field] == full['data'][field]
+    assert backend_medical_api.snapshots.stats()['hits'] == 1
@@ -0,0 +1,55 @@
+"""
+Pruebas de la exportación columnar (lab_export.py); requieren pyarrow
+"""
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from lab_export import export_history, export_schema, open_export, summarize
+from lab_history import VALUE_COLUMNS, LabHistory
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = LabHistory(str(tmp_path / 'history.sqlite3'))
+    history.record_report('P-1', '2024-05-01T08:00:00', [
+        ('GLUCOSA', 150, 'mg/dl', 'alto', 'moderate'),
+        ('UREA', 15, 'mg/dl', 'normal', None)
+    ], {'age': '40', 'gender': 'F'}, urgency='Media', source='medical-ai')
+    history.record_report('P-2', '2024-05-20T08:00:00', [
+        ('GLUCOSA', 90, 'mg/dl', 'normal', None)
+    ], source='medical-interpret')
+    history.record_report('P-1', '2024-06-02T08:00:00', [
+        ('GLUCOSA', 100, 'mg/dl', 'normal', None)
+    ], source='medical-ai')
+    return history
+
+
+def test_schema_matches_history_columns():
+    assert tuple(export_schema().names) == VALUE_COLUMNS
+
+
+def test_iter_values_in_batches(history):
+    batches = list(history.iter_values('2024-05-01', '2024-06-01', batch_rows=2))
+    assert [len(rows) for rows in batches] == [2, 1]
+    assert [row[VALUE_COLUMNS.index('observed_at')] for rows in batches for row in rows] == [
+        '2024-05-01T08:00:00', '2024-05-01T08:00:00', '2024-05-20T08:00:00'
+    ]
+
+
+@pytest.mark.parametrize('suffix', ['.arrow', '.parquet'])
+def test_export_roundtrip(history, tmp_path, suffix):
+    output = str(tmp_path / f'mayo{suffix}')
+    assert export_history(output, '2024-05-01', '2024-06-01', history, batch_rows=2) == 3
+
+    table = open_export(output)
+    assert table.num_rows == 3
+    rows = table.to_pylist()
+    concern = {(row['patient_id'], row['test_code']): row['concern_level'] for row in rows}
+    assert concern == {('P-1', 'GLUCOSA'): 'moderate', ('P-1', 'UREA'): None, ('P-2', 'GLUCOSA'): None}
+    assert {row['source'] for row in rows} == {'medical-ai', 'medical-interpret'}
+    assert [row['age'] for row in rows if row['patient_id'] == 'P-1'] == [40, 40]
+
+    summary = summarize(table, ['test_code']).to_pylist()
+    assert [(row['test_code'], row['value_count']) for row in summary] == [('GLUCOSA', 2), ('UREA', 1)]
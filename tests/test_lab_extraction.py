@@ -0,0 +1,45 @@
+"""
+Pruebas del motor de extracción de valores (lab_extraction.py)
+"""
+
+import pytest
+
+import backend_medical_ai
+import backend_medical_api
+from lab_extraction import iter_lab_values
+
+
+def extracted(text):
+    return [(value.name, value.value, value.unit, value.reference_range) for value in iter_lab_values(text)]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('GLUCOSA: 95 (70-100 mg/dl)', [('GLUCOSA', 95.0, '', '70-100 mg/dl')]),
+    ('Glucosa = 95', [('Glucosa', 95.0, '', '')]),
+    ('Hemoglobina - 14,2', [('Hemoglobina', 14.2, '', '')]),
+    ('Glucosa 95 mg/dl', [('Glucosa', 95.0, 'mg/dl', '')]),
+    ('CK-MB: 30 ng/ml', [('CK-MB', 30.0, 'ng/ml', '')]),
+    ('HbA1c: 6.1 %', [('HbA1c', 6.1, '%', '')])
+])
+def test_formats(text, expected):
+    assert extracted(text) == expected
+
+
+def test_number_without_separator_or_unit_is_not_a_value():
+    assert extracted('Paciente 45 años') == []
+
+
+def test_each_span_yields_one_value():
+    text = 'Glucosa: 95 Colesterol total: 210 mg/dl'
+    assert extracted(text) == [('Glucosa', 95.0, '', ''), ('Colesterol total', 210.0, 'mg/dl', '')]
+    spans = [value.span for value in iter_lab_values(text)]
+    assert all(end <= start for (_, end), (start, _) in zip(spans, spans[1:]))
+
+
+def test_both_backends_find_the_same_values():
+    html = '<p>GLUCOSA: 95 (70-100 mg/dl)</p><p>Hemoglobina = 14,2 g/dl</p><p>Paciente 45 años</p>'
+    medical_ai = backend_medical_ai.medical_ai.extract_lab_values(html)
+    interpreter = backend_medical_api.interpreter.extract_lab_values(html)
+
+    assert [(value['name'].upper(), value['value']) for value in medical_ai] == [('GLUCOSA', 95.0), ('HEMOGLOBINA', 14.2)]
+    assert [(value['name'].upper(), value['value']) for value in interpreter] == [('GLUCOSA', 95.0), ('HEMOGLOBINA', 14.2)]
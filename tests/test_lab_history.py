@@ -0,0 +1,91 @@
+"""
+Pruebas del historial longitudinal (lab_history.py): deduplicación, ediciones
+y estadísticas por serie
+"""
+
+import pytest
+
+import backend_medical_api
+from lab_history import LabHistory
+
+PATIENT = 'P-001'
+OBSERVED_AT = '2024-05-01T08:30:00'
+
+
+def report(*values):
+    return [(code, value, 'mg/dl', 'normal', None) for code, value in values]
+
+
+@pytest.fixture
+def history(tmp_path):
+    return LabHistory(str(tmp_path / 'history.sqlite3'))
+
+
+def test_disabled_without_path():
+    history = LabHistory('')
+    assert not history.enabled
+    assert history.status() == {'enabled': False}
+
+
+def test_resubmitted_report_is_not_counted_twice(history):
+    first = history.record_report(PATIENT, OBSERVED_AT, report(('GLUCOSA', 90)))
+    second = history.record_report(PATIENT, '2024-05-01T08:30:00Z', report(('GLUCOSA', 90)))
+
+    assert first == second
+    assert history.stats(PATIENT, 'GLUCOSA')['count'] == 1
+    assert history.status()['reports'] == 1
+
+
+def test_edited_report_replaces_previous_values(history):
+    history.record_report(PATIENT, '2024-04-01T08:00:00', report(('GLUCOSA', 80)))
+    history.record_report(PATIENT, OBSERVED_AT, report(('GLUCOSA', 90), ('UREA', 15)))
+    history.record_report(PATIENT, OBSERVED_AT, report(('GLUCOSA', 130)))
+
+    stats = history.stats(PATIENT, 'GLUCOSA')
+    assert stats['count'] == 2
+    assert stats['mean'] == 105
+    assert stats['max'] == 130
+    assert stats['last_value'] == 130
+    assert [point['value'] for point in history.series(PATIENT, 'GLUCOSA')] == [80, 130]
+    # La edición quitó la urea: su serie desaparece
+    assert history.stats(PATIENT, 'UREA') is None
+    assert history.status()['reports'] == 2
+
+
+def test_explicit_report_id_is_upserted(history):
+    history.record_report(PATIENT, OBSERVED_AT, report(('GLUCOSA', 90)), report_id='R-1')
+    history.record_report(PATIENT, '2024-05-02T08:30:00', report(('GLUCOSA', 95)), report_id='R-1')
+
+    assert history.series(PATIENT, 'GLUCOSA') == [{
+        'observed_at': '2024-05-02T08:30:00', 'value': 95, 'unit': 'mg/dl', 'status': 'normal', 'report_id': 'R-1'
+    }]
+    assert history.stats(PATIENT, 'GLUCOSA')['first_observed_at'] == '2024-05-02T08:30:00'
+
+
+def test_previous_values(history):
+    history.record_report(PATIENT, '2024-04-01T08:00:00', report(('GLUCOSA', 80)))
+    history.record_report(PATIENT, OBSERVED_AT, report(('GLUCOSA', 90)))
+
+    previous = history.previous_values(PATIENT, ['GLUCOSA', 'UREA'], before=OBSERVED_AT)
+    assert previous == {'GLUCOSA': (80, '2024-04-01T08:00:00', 'normal')}
+
+
+def test_edit_through_interpret_endpoint(history, monkeypatch):
+    monkeypatch.setattr(backend_medical_api, 'lab_history', history)
+    client = backend_medical_api.create_app().test_client()
+    patient_info = {'patient_id': PATIENT, 'observed_at': OBSERVED_AT}
+
+    history.record_report(PATIENT, '2024-04-01T08:00:00', report(('GLUCOSA', 80)))
+    first = client.post('/api/medical-interpret', json={
+        'html_content': '<table><tr><td>Glucosa</td><td>150</td><td>mg/dl</td></tr></table>',
+        'patient_info': patient_info
+    }).get_json()
+    client.post('/api/medical-interpret', json={
+        'html_content': '<table><tr><td>Glucosa</td><td>160</td><td>mg/dl</td></tr></table>',
+        'patient_info': patient_info,
+        'previous_result_id': first['result_id']
+    })
+
+    stats = history.stats(PATIENT, 'GLUCOSA')
+    assert stats['count'] == 2
+    assert stats['last_value'] == 160
@@ -0,0 +1,109 @@
+"""
+Pruebas de la puntuación en micro-lotes (labrador_inference.py) con un modelo falso
+"""
+
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import labrador_inference
+from labrador_inference import LabradorBatcher
+
+REFERENCE_RANGES = {'GLUCOSA': {'min': 70, 'max': 100}, 'UREA': {'min': 7, 'max': 20}}
+PANEL = (['UREA', 'GLUCOSA'], [15.0, 95.0], ['mg/dl', 'mg/dl'])
+
+
+class FakeModel:
+    """Embeddings deterministas por texto; cuenta forwards y peticiones de carga"""
+
+    model_name = 'fake-labrador'
+
+    def __init__(self, ready=True, dimension=8):
+        self.ready = ready
+        self.dimension = dimension
+        self.load_requests = 0
+        self.forwards = []
+
+    def ensure_loading(self):
+        self.load_requests += 1
+
+    def embed(self, texts):
+        self.forwards.append(list(texts))
+        return np.stack([
+            np.random.default_rng(sum(map(ord, text))).standard_normal(self.dimension).astype(np.float32)
+            for text in texts
+        ])
+
+
+@pytest.mark.skipif('LABRADOR_SCORING' in os.environ, reason='LABRADOR_SCORING definido en el entorno')
+def test_scoring_is_off_by_default():
+    assert labrador_inference.LABRADOR_SCORING is False
+    assert LabradorBatcher(FakeModel()).enabled is False
+
+
+def test_disabled_scoring_never_starts_the_model():
+    model = FakeModel(ready=False)
+    batcher = LabradorBatcher(model, enabled=False)
+
+    assert batcher.score(*PANEL, REFERENCE_RANGES) is None
+    assert model.load_requests == 0
+    assert batcher.status()['requests'] == 0
+
+
+def test_enabled_scoring_starts_loading_when_not_ready():
+    model = FakeModel(ready=False)
+    batcher = LabradorBatcher(model, enabled=True)
+
+    assert batcher.score(*PANEL, REFERENCE_RANGES) is None
+    assert model.load_requests == 1
+    assert batcher.status()['not_ready'] == 1
+
+
+def test_panel_score():
+    model = FakeModel()
+    batcher = LabradorBatcher(model, enabled=True, latency_budget_ms=2000)
+
+    result = batcher.score(*PANEL, REFERENCE_RANGES)
+    assert 0.0 <= result['anomaly_score'] <= 1.0
+    assert result['model'] == 'fake-labrador'
+    assert result['cached'] is False
+    # Orden canónico por código
+    assert model.forwards[0][0].startswith('GLUCOSA 95 mg/dl; UREA 15 mg/dl')
+
+
+def test_concurrent_panels_share_batches():
+    model = FakeModel()
+    batcher = LabradorBatcher(model, enabled=True, max_batch=16, max_wait_ms=50, latency_budget_ms=5000)
+    results = []
+    threads = [
+        threading.Thread(target=lambda value=value: results.append(
+            batcher.score(['GLUCOSA'], [float(value)], ['mg/dl'], REFERENCE_RANGES)))
+        for value in range(100, 108)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 8 and all(result is not None for result in results)
+    assert len(model.forwards) < 8
+    # El panel de referencia es el mismo para todos: un solo texto por lote
+    assert all(sum(text.startswith('GLUCOSA 85') for text in texts) == 1 for texts in model.forwards)
+
+
+def test_cached_embedding_of_wrong_shape_is_an_error_not_a_crash():
+    class StaleCache:
+        def get(self, key):
+            return np.ones(4, dtype=np.float32)
+
+        def put(self, key, vector):
+            pass
+
+    batcher = LabradorBatcher(FakeModel(dimension=8), enabled=True, cache=StaleCache())
+    request = batcher.submit(*PANEL, REFERENCE_RANGES)
+    request.embeddings[1] = np.ones(8, dtype=np.float32)
+
+    assert batcher.collect(request) is None
+    assert batcher.status()['errors'] == 1
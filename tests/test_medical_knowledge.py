@@ -0,0 +1,114 @@
+"""
+Pruebas de la base de conocimiento (medical_knowledge.py): validación del
+esquema, recarga y endpoint de recarga
+"""
+
+import copy
+import json
+
+import pytest
+
+import backend_medical_api
+import medical_knowledge
+from medical_knowledge import KnowledgeStore, read_knowledge_file, validate_knowledge
+
+RELOAD_URL = '/api/medical-interpret/knowledge/reload'
+
+
+@pytest.fixture(scope='module')
+def document():
+    return read_knowledge_file()
+
+
+@pytest.fixture
+def client():
+    return backend_medical_api.create_app().test_client()
+
+
+def write_document(path, document):
+    path.write_text(json.dumps(document), encoding='utf-8')
+    return str(path)
+
+
+def test_shipped_file_is_valid(document):
+    validate_knowledge(document)
+
+
+@pytest.mark.parametrize('mutate, message', [
+    (lambda d: d.pop('explanations'), 'Faltan secciones'),
+    (lambda d: d.update(normalizations=[]), 'no son objetos'),
+    (lambda d: d['reference_ranges']['GLUCOSA'].update(min=200), 'min > max'),
+    (lambda d: d['reference_ranges']['GLUCOSA'].pop('unit'), 'falta unit'),
+    (lambda d: d['reference_ranges']['GLUCOSA'].pop('critical'), 'Faltan los límites críticos'),
+    (lambda d: d['reference_ranges']['GLUCOSA']['critical'].update(low='40'), 'low y high deben ser números'),
+    (lambda d: d['unit_patterns'].update({'mg/dl': 'mg/dl'}), 'Variantes inválidas')
+])
+def test_invalid_documents_are_rejected(document, mutate, message):
+    broken = copy.deepcopy(document)
+    mutate(broken)
+    with pytest.raises(ValueError, match=message):
+        validate_knowledge(broken)
+
+
+def test_interpreter_ranges_may_omit_critical(document):
+    relaxed = copy.deepcopy(document)
+    for reference in relaxed['interpreter_ranges'].values():
+        reference.pop('critical', None)
+    validate_knowledge(relaxed)
+
+
+def test_reload_swaps_version_and_keeps_pinned(tmp_path, document):
+    path = write_document(tmp_path / 'knowledge.json', document)
+    store = KnowledgeStore(path, reload_interval=0, sidecar_dir='')
+    before = store.current()
+
+    edited = copy.deepcopy(document)
+    edited['version'] = 'prueba-2'
+    write_document(tmp_path / 'knowledge.json', edited)
+
+    with store.pin():
+        store.reload()
+        assert store.current() is before
+    assert store.current().version != before.version
+    assert store.reloads == 1
+
+
+def test_invalid_reload_keeps_current_version(tmp_path, document):
+    path = write_document(tmp_path / 'knowledge.json', document)
+    store = KnowledgeStore(path, reload_interval=0, sidecar_dir='')
+    version = store.current().version
+
+    (tmp_path / 'knowledge.json').write_text('{"version": 1}', encoding='utf-8')
+    with pytest.raises(ValueError):
+        store.reload()
+    assert store.current().version == version
+    assert store.failed_reloads == 1
+
+
+def test_reload_endpoint_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(medical_knowledge, 'KNOWLEDGE_RELOAD_TOKEN', '')
+    assert client.post(RELOAD_URL).status_code == 404
+    assert client.post(RELOAD_URL, headers={'X-Reload-Token': ''}).status_code == 404
+
+
+def test_reload_endpoint_checks_token(client, monkeypatch):
+    monkeypatch.setattr(medical_knowledge, 'KNOWLEDGE_RELOAD_TOKEN', 'clave')
+    assert client.post(RELOAD_URL).status_code == 403
+    assert client.post(RELOAD_URL, headers={'X-Reload-Token': 'otra'}).status_code == 403
+    # Un token no ASCII no rompe la comparación
+    assert client.post(RELOAD_URL, headers={'X-Reload-Token': 'cláve'}).status_code == 403
+
+    response = client.post(RELOAD_URL, headers={'X-Reload-Token': 'clave'})
+    assert response.status_code == 200
+    assert response.get_json()['success'] is True
+
+
+def test_reload_endpoint_rejects_invalid_file(client, monkeypatch, tmp_path, document):
+    broken = copy.deepcopy(document)
+    broken['reference_ranges']['GLUCOSA'].pop('critical')
+    monkeypatch.setattr(medical_knowledge, 'KNOWLEDGE_RELOAD_TOKEN', 'clave')
+    monkeypatch.setattr(medical_knowledge.knowledge_store, 'path', write_document(tmp_path / 'k.json', broken))
+
+    response = client.post(RELOAD_URL, headers={'X-Reload-Token': 'clave'})
+    assert response.status_code == 422
+    assert 'GLUCOSA' in response.get_json()['error']
@@ -0,0 +1,66 @@
+"""
+Pruebas de name_matcher.py y de los textos por código de backend_medical_api.py
+"""
+
+import pytest
+
+from backend_medical_api import MedicalInterpreter
+from name_matcher import AhoCorasick, LabNameMatcher, resolve_test_code
+
+DEFAULT_RANGE = "Consultar valores de referencia del laboratorio"
+GENERIC_SIGNIFICANCE = "Valor high fuera del rango normal. Requiere evaluación médica especializada."
+
+
+@pytest.fixture(scope='module')
+def interpreter():
+    return MedicalInterpreter()
+
+
+def test_automaton_finds_overlapping_patterns():
+    automaton = AhoCorasick(['CK', 'CK-MB', 'MB'])
+    assert automaton.find_all('CK-MB') == {'CK', 'CK-MB', 'MB'}
+    assert automaton.find_all('GLUCOSA') == set()
+
+
+@pytest.mark.parametrize('name, code', [
+    ('Glucosa', 'GLUCOSA'),
+    ('COLESTEROL TOTAL', 'COLESTEROL_TOTAL'),
+    ('Colesterol HDL', 'HDL'),
+    ('colesterol ldl', 'LDL'),
+    ('CK-MB', 'CK_MB'),
+    ('CKMB masa', 'CK_MB'),
+    ('Triglicéridos', 'TRIGLICERIDOS'),
+    ('Examen desconocido', None)
+])
+def test_resolve_test_code(name, code):
+    assert resolve_test_code(name) == code
+
+
+def test_rules_follow_priority_order():
+    matcher = LabNameMatcher(rules=(('A', ('X',)), ('B', ('X', 'Y'))))
+    assert matcher.resolve('x y') == 'A'
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('Colesterol Total', "<200 mg/dl"),
+    ('Colesterol', DEFAULT_RANGE),
+    ('HDL', ">40 mg/dl"),
+    ('Colesterol LDL', "<100 mg/dl"),
+    ('Glucosa', "70-100 mg/dl")
+])
+def test_reference_range_text(interpreter, name, expected):
+    assert interpreter._get_reference_range(name) == expected
+
+
+@pytest.mark.parametrize('name', ['Colesterol', 'Colesterol HDL', 'Colesterol LDL'])
+def test_cholesterol_texts_apply_to_cholesterol_names(interpreter, name):
+    value = {'name': name, 'status': 'high'}
+    assert 'colesterol' in interpreter._get_significance_explanation(value)
+    assert 'Hipercolesterolemia familiar' in interpreter._generate_possible_causes([value])
+
+
+@pytest.mark.parametrize('name', ['HDL', 'LDL'])
+def test_bare_hdl_ldl_keep_generic_texts(interpreter, name):
+    value = {'name': name, 'status': 'high'}
+    assert interpreter._get_significance_explanation(value) == GENERIC_SIGNIFICANCE
+    assert interpreter._generate_possible_causes([value]) == []
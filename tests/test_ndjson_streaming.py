@@ -0,0 +1,95 @@
+"""
+Pruebas del modo streaming NDJSON (?stream=1) de ambos backends
+"""
+
+import json
+
+import pytest
+
+import backend_medical_ai
+import backend_medical_api
+
+HTML = (
+    '<table>'
+    '<tr><td>Glucosa</td><td>150</td><td>mg/dl</td></tr>'
+    '<tr><td>Hemoglobina</td><td>14</td><td>g/dl</td></tr>'
+    '<tr><td>Creatinina</td><td>1.0</td><td>mg/dl</td></tr>'
+    '</table>'
+)
+
+
+def records(response):
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+@pytest.fixture(scope='module')
+def interpret_client():
+    return backend_medical_api.create_app().test_client()
+
+
+@pytest.fixture(scope='module')
+def analyze_client():
+    return backend_medical_ai.create_app().test_client()
+
+
+def test_interpret_stream_records(interpret_client):
+    stream = records(interpret_client.post('/api/medical-interpret?stream=1', json={'html_content': HTML}))
+
+    types = [record['type'] for record in stream]
+    assert types[0] == 'start'
+    assert types.count('value') == 3
+    assert types[-4:] == ['interpretation', 'urgency', 'recommendations', 'summary']
+    assert stream[-1]['total_values'] == 3
+    assert stream[-1]['abnormal_count'] == 1
+
+
+def test_interpret_stream_accept_header(interpret_client):
+    response = interpret_client.post('/api/medical-interpret', json={'html_content': HTML},
+                                     headers={'Accept': 'application/x-ndjson'})
+    assert records(response)[0]['type'] == 'start'
+
+
+def test_interpret_stream_without_values(interpret_client):
+    stream = records(interpret_client.post('/api/medical-interpret?stream=1', json={'html_content': '<p>nada</p>'}))
+    assert stream[-1]['type'] == 'error'
+
+
+def test_interpretation_gets_same_values_in_both_modes(interpret_client, monkeypatch):
+    received = []
+    original = backend_medical_api.interpreter.generate_ai_interpretation
+
+    def capture(html_content, patient_info, lab_values):
+        received.append([(value['name'], value['status']) for value in lab_values])
+        return original(html_content, patient_info, lab_values)
+
+    monkeypatch.setattr(backend_medical_api.interpreter, 'generate_ai_interpretation', capture)
+    # patient_info distinto en cada petición: sin acierto de caché
+    interpret_client.post('/api/medical-interpret', json={'html_content': HTML, 'patient_info': {'age': 30}})
+    records(interpret_client.post('/api/medical-interpret?stream=1', json={'html_content': HTML}))
+
+    assert len(received) == 2
+    assert received[0] == received[1]
+    assert len(received[0]) == 3
+
+
+def test_stream_failure_ends_with_error_record(interpret_client, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('fallo simulado')
+
+    monkeypatch.setattr(backend_medical_api.interpreter, 'generate_ai_interpretation', fail)
+    stream = records(interpret_client.post('/api/medical-interpret?stream=1', json={'html_content': HTML}))
+    assert stream[-1] == {'type': 'error', 'error': 'Error interno del servidor'}
+
+
+def test_analyze_stream_records(analyze_client):
+    stream = records(analyze_client.post('/api/medical-ai/analyze?stream=1', json={'html_content': HTML}))
+
+    types = [record['type'] for record in stream]
+    assert types[0] == 'start'
+    assert types.count('value') == 3
+    assert types[-1] == 'summary'
+    assert stream[-1]['total_values'] == 3
+    assert all(record['knowledge_version'] == stream[0]['knowledge_version']
+               for record in stream if 'knowledge_version' in record)
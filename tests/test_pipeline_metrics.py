@@ -0,0 +1,69 @@
+"""
+Pruebas de las métricas de latencia por etapa (pipeline_metrics.py)
+"""
+
+import re
+
+import pytest
+
+import backend_medical_api
+from pipeline_metrics import BUCKETS, NOOP_TIMER, PipelineMetrics
+
+REPORT = '<table><tr><td>Glucosa</td><td>95</td><td>mg/dl</td></tr></table>'
+
+
+def sample(text, name):
+    """Valor de una línea de exposición por nombre completo con etiquetas"""
+    for line in text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    raise AssertionError(f'{name} no aparece en la exposición')
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = PipelineMetrics('prueba', sample_rate=1.0)
+    for seconds in (0.0002, 0.003, 0.003, 20.0):
+        metrics.observe('interpret', 'extraction', seconds)
+
+    text = metrics.render_prometheus()
+    labels = 'endpoint="interpret",stage="extraction"'
+    assert sample(text, f'prueba_stage_seconds_bucket{{{labels},le="0.00025"}}') == 1
+    assert sample(text, f'prueba_stage_seconds_bucket{{{labels},le="0.005"}}') == 3
+    assert sample(text, f'prueba_stage_seconds_bucket{{{labels},le="{BUCKETS[-1]}"}}') == 3
+    assert sample(text, f'prueba_stage_seconds_bucket{{{labels},le="+Inf"}}') == 4
+    assert sample(text, f'prueba_stage_seconds_count{{{labels}}}') == 4
+    assert sample(text, f'prueba_stage_seconds_sum{{{labels}}}') == pytest.approx(20.0062)
+    assert sample(text, 'prueba_metrics_sample_rate') == 1.0
+
+
+def test_stage_timer_records_even_on_error():
+    metrics = PipelineMetrics('prueba', sample_rate=1.0)
+    timer = metrics.request('analyze')
+    with timer.stage('analysis'):
+        pass
+    with pytest.raises(ValueError):
+        with timer.stage('analysis'):
+            raise ValueError('fallo')
+
+    assert sample(metrics.render_prometheus(),
+                  'prueba_stage_seconds_count{endpoint="analyze",stage="analysis"}') == 2
+
+
+def test_sampling_disabled_uses_noop_timer():
+    metrics = PipelineMetrics('prueba', sample_rate=0)
+    timer = metrics.request('analyze')
+    assert timer is NOOP_TIMER
+    with timer.stage('analysis'):
+        pass
+    assert '_stage_seconds_count' not in metrics.render_prometheus()
+
+
+def test_metrics_endpoint(monkeypatch):
+    monkeypatch.setattr(backend_medical_api, 'metrics', PipelineMetrics('medical_interpret', sample_rate=1.0))
+    client = backend_medical_api.create_app().test_client()
+    assert client.post('/api/medical-interpret', json={'html_content': REPORT}).status_code == 200
+
+    response = client.get('/metrics')
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    stages = set(re.findall(r'endpoint="interpret",stage="(\w+)"', response.get_data(as_text=True)))
+    assert {'total', 'extraction', 'analysis'} <= stages
@@ -0,0 +1,90 @@
+"""
+Pruebas de la clasificación vectorizada (range_classifier.py)
+"""
+
+import numpy as np
+import pytest
+
+from range_classifier import (
+    CONCERN_HIGH, CONCERN_LOW, CONCERN_MEDIUM, STATUS_HIGH, STATUS_LOW, STATUS_NORMAL, STATUS_UNKNOWN,
+    RangeTable, map_bounds
+)
+
+RANGES = {
+    'GLUCOSA': {'min': 70, 'max': 100, 'critical': {'low': 40, 'high': 400}},
+    'UREA': {'min': 7, 'max': 20}
+}
+
+
+@pytest.fixture
+def table():
+    return RangeTable(RANGES)
+
+
+@pytest.mark.parametrize('code, value, status, concern', [
+    ('GLUCOSA', 85, STATUS_NORMAL, CONCERN_LOW),
+    ('GLUCOSA', 70, STATUS_NORMAL, CONCERN_LOW),
+    ('GLUCOSA', 100, STATUS_NORMAL, CONCERN_LOW),
+    ('GLUCOSA', 60, STATUS_LOW, CONCERN_MEDIUM),
+    ('GLUCOSA', 30, STATUS_LOW, CONCERN_HIGH),
+    ('GLUCOSA', 150, STATUS_HIGH, CONCERN_MEDIUM),
+    ('GLUCOSA', 450, STATUS_HIGH, CONCERN_HIGH),
+    # Sin límites críticos nunca llega a ALTA
+    ('UREA', 1000, STATUS_HIGH, CONCERN_MEDIUM),
+    ('DESCONOCIDO', 5, STATUS_UNKNOWN, CONCERN_MEDIUM)
+])
+def test_single_value(table, code, value, status, concern):
+    statuses, concerns = table.classify([code], [value])
+    assert (statuses[0], concerns[0]) == (status, concern)
+
+
+def test_matches_scalar_classification_on_many_values(table):
+    rng = np.random.default_rng(7)
+    codes = rng.choice(['GLUCOSA', 'UREA', 'OTRO'], size=10000)
+    values = rng.uniform(0, 500, size=10000)
+
+    statuses, _ = table.classify(list(codes), values)
+    for code, value, status in zip(codes[:500], values[:500], statuses[:500]):
+        reference = RANGES.get(code)
+        if reference is None:
+            expected = STATUS_UNKNOWN
+        elif value < reference['min']:
+            expected = STATUS_LOW
+        elif value > reference['max']:
+            expected = STATUS_HIGH
+        else:
+            expected = STATUS_NORMAL
+        assert status == expected
+
+
+def test_precomputed_indices(table):
+    indices = table.lookup(['UREA', 'X', 'GLUCOSA'])
+    assert indices.tolist() == [1, -1, 0]
+    statuses, _ = table.classify(indices, [25, 1, 85])
+    assert statuses.tolist() == [STATUS_HIGH, STATUS_UNKNOWN, STATUS_NORMAL]
+
+
+def test_bounds_are_read_only(table):
+    with pytest.raises(ValueError):
+        table.min[0] = 0
+
+
+def test_sidecar_is_shared_and_rewritten_on_change(tmp_path):
+    path = str(tmp_path / 'bounds.npy')
+    first = RangeTable(RANGES, sidecar=path)
+    second = RangeTable(RANGES, sidecar=path)
+    assert isinstance(first.min, np.memmap) and isinstance(second.min, np.memmap)
+
+    changed = {**RANGES, 'UREA': {'min': 10, 'max': 50}}
+    third = RangeTable(changed, sidecar=path)
+    assert third.max[third.index['UREA']] == 50
+    assert [entry.name for entry in tmp_path.iterdir()] == ['bounds.npy']
+
+
+def test_map_bounds_reuses_identical_file(tmp_path):
+    path = str(tmp_path / 'bounds.npy')
+    bounds = np.array([[1.0, np.nan], [2.0, np.inf]])
+    map_bounds(bounds, path)
+    mtime = (tmp_path / 'bounds.npy').stat().st_mtime_ns
+    assert np.array_equal(map_bounds(bounds, path), bounds, equal_nan=True)
+    assert (tmp_path / 'bounds.npy').stat().st_mtime_ns == mtime
@@ -0,0 +1,112 @@
+"""
+Pruebas de la reinterpretación masiva (reinterpret.py): checkpoints y reanudación
+"""
+
+import json
+import os
+
+import pytest
+
+from medical_knowledge import knowledge_store
+from reinterpret import Checkpoint, iter_reports, reinterpret
+
+REPORT = '<table><tr><td>Glucosa</td><td>{}</td><td>mg/dl</td></tr></table>'
+NAMES = [f'informe_{number}.html' for number in range(5)]
+
+
+@pytest.fixture
+def reports(tmp_path):
+    source = tmp_path / 'informes'
+    source.mkdir()
+    for number, name in enumerate(NAMES):
+        (source / name).write_text(REPORT.format(90 + number), encoding='utf-8')
+    (source / 'notas.txt').write_text('no es un informe', encoding='utf-8')
+    return str(source)
+
+
+@pytest.fixture
+def output(tmp_path):
+    return str(tmp_path / 'salida.jsonl')
+
+
+def run(source, output, **kwargs):
+    return reinterpret(source, output, workers=1, chunk_size=2, task_size=1, progress=lambda message: None, **kwargs)
+
+
+def sources(output):
+    with open(output, encoding='utf-8') as results:
+        return [json.loads(line)['source'] for line in results]
+
+
+def interrupt(source, output, processed):
+    """Dejar la salida y el checkpoint como tras una ejecución cortada después de `processed` informes"""
+    run(source, output)
+    with open(output, 'rb') as results:
+        kept = b''.join(results.readlines()[:processed])
+    with open(output, 'wb') as results:
+        # Una línea a medio escribir después del checkpoint
+        results.write(kept + b'{"source": "informe_')
+    Checkpoint(output).save({
+        'source': os.path.abspath(source),
+        'knowledge_version': knowledge_store.current().version,
+        'processed': processed,
+        'failed': 0,
+        'output_bytes': len(kept),
+        'started_at': '2024-05-01T08:00:00'
+    })
+    return len(kept)
+
+
+def test_iter_reports_is_sorted_and_filtered(reports):
+    assert [name for name, _ in iter_reports(reports)] == NAMES
+
+
+def test_full_run(reports, output):
+    summary = run(reports, output)
+
+    assert summary['processed'] == 5 and summary['failed'] == 0
+    assert sources(output) == NAMES
+    assert Checkpoint(output).load() is None
+
+
+def test_resume_after_interruption(reports, output):
+    interrupt(reports, output, processed=2)
+
+    summary = run(reports, output)
+    assert summary['processed_this_run'] == 3
+    assert sources(output) == NAMES
+
+
+def test_refuses_to_overwrite_without_checkpoint(reports, output):
+    run(reports, output)
+    with pytest.raises(ValueError, match='--restart'):
+        run(reports, output)
+
+    assert run(reports, output, restart=True)['processed'] == 5
+    assert sources(output) == NAMES
+
+
+@pytest.mark.parametrize('damage', ['delete', 'shorten'])
+def test_refuses_to_resume_over_missing_output(reports, output, damage):
+    written = interrupt(reports, output, processed=4)
+    if damage == 'delete':
+        os.remove(output)
+    else:
+        with open(output, 'r+b') as results:
+            results.truncate(written // 2)
+
+    with pytest.raises(ValueError, match='--restart'):
+        run(reports, output)
+    # Nada se rellenó con ceros
+    assert not os.path.exists(output) or b'\x00' not in open(output, 'rb').read()
+
+    assert run(reports, output, restart=True)['processed'] == 5
+    assert sources(output) == NAMES
+
+
+def test_refuses_checkpoint_of_other_source(reports, output, tmp_path):
+    interrupt(reports, output, processed=2)
+    other = tmp_path / 'otros'
+    other.mkdir()
+    with pytest.raises(ValueError, match='checkpoint es de'):
+        run(str(other), output)
@@ -0,0 +1,89 @@
+"""
+Pruebas de la caché de resultados (result_cache.py): claves, TTL y LRU por bytes
+"""
+
+import backend_medical_api
+from result_cache import ResultCache, fingerprint, make_key
+
+HTML = '<table><tr><td>Glucosa</td><td>95</td><td>mg/dl</td></tr></table>'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_ignores_html_whitespace_and_key_order():
+    html = '<p>Glucosa: 95 mg/dl</p> <p>Urea: 15</p>'
+    key = make_key(html, {'age': 40, 'gender': 'F'}, 'v1')
+    assert make_key('\n  <p>Glucosa:  95\tmg/dl</p>\n<p>Urea: 15</p>\n', {'gender': 'F', 'age': 40}, 'v1') == key
+
+
+def test_key_depends_on_content_patient_and_knowledge():
+    key = make_key(HTML, {'age': 40}, 'v1')
+    assert make_key(HTML.replace('95', '96'), {'age': 40}, 'v1') != key
+    assert make_key(HTML, {'age': 41}, 'v1') != key
+    assert make_key(HTML, {'age': 40}, 'v2') != key
+
+
+def test_fingerprint_is_stable():
+    assert fingerprint({'b': 1, 'a': [1, 2]}) == fingerprint({'a': [1, 2], 'b': 1})
+    assert len(fingerprint({})) == 12
+
+
+def test_ttl_expiration():
+    clock = Clock()
+    cache = ResultCache(max_bytes=1024, ttl_seconds=10, clock=clock)
+    cache.put('a', b'cuerpo')
+
+    clock.now = 9.9
+    assert cache.get('a') == b'cuerpo'
+    clock.now = 10
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations'], stats['bytes']) == (1, 1, 1, 0)
+
+
+def test_lru_eviction_by_bytes():
+    cache = ResultCache(max_bytes=10, ttl_seconds=60)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    cache.get('a')
+    cache.put('c', b'1234')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1234' and cache.get('c') == b'1234'
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] == 8
+
+
+def test_replacing_a_key_keeps_byte_count():
+    cache = ResultCache(max_bytes=100, ttl_seconds=60)
+    cache.put('a', b'12345')
+    cache.put('a', b'12')
+    assert cache.stats()['bytes'] == 2
+
+
+def test_oversized_and_disabled():
+    cache = ResultCache(max_bytes=4, ttl_seconds=60)
+    cache.put('a', b'12345')
+    assert cache.get('a') is None
+
+    disabled = ResultCache(max_bytes=0)
+    disabled.put('a', b'1')
+    assert not disabled.enabled and disabled.get('a') is None
+
+
+def test_interpret_endpoint_hit(monkeypatch):
+    monkeypatch.setattr(backend_medical_api, 'result_cache', ResultCache(max_bytes=1024 * 1024, ttl_seconds=60))
+    client = backend_medical_api.create_app().test_client()
+    payload = {'html_content': HTML, 'patient_info': {'age': 33}}
+
+    first = client.post('/api/medical-interpret', json=payload)
+    second = client.post('/api/medical-interpret', json=payload)
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_data() == first.get_data()
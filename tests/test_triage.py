@@ -0,0 +1,97 @@
+"""
+Pruebas del triage de resultados críticos (triage.py)
+"""
+
+import threading
+import time
+
+import pytest
+
+import backend_medical_api
+from range_classifier import RangeTable
+from triage import PRIORITY_CRITICAL, PRIORITY_ROUTINE, GateTimeout, PriorityGate, prescreen
+
+RANGES = {
+    'GLUCOSA': {'min': 70, 'max': 100, 'critical': {'low': 40, 'high': 400}},
+    'UREA': {'min': 7, 'max': 20}
+}
+CRITICAL_REPORT = '<table><tr><td>Glucosa</td><td>500</td><td>mg/dl</td></tr></table>'
+
+
+@pytest.fixture
+def table():
+    return RangeTable(RANGES)
+
+
+def test_prescreen_without_critical_values(table):
+    assert prescreen(table, ['GLUCOSA', 'UREA', 'OTRO'], [150, 1000, 1e9]) is None
+    assert prescreen(table, [], []) is None
+
+
+def test_prescreen_findings(table):
+    alert = prescreen(table, ['UREA', 'GLUCOSA', 'GLUCOSA'], [15, 30, 500],
+                      names=['Urea', 'Glucosa', 'Glucosa 2h'], units=['mg/dl'] * 3)
+
+    assert alert['level'] == 'Crítica'
+    assert [(finding['test_name'], finding['direction']) for finding in alert['findings']] == [
+        ('Glucosa', 'bajo'), ('Glucosa 2h', 'elevado')
+    ]
+    assert alert['findings'][0]['critical_low'] == 40
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_gate_disabled_admits_everything():
+    gate = PriorityGate(slots=0)
+    with gate.admit(), gate.admit():
+        pass
+    assert gate.status()['enabled'] is False
+
+
+def test_critical_requests_are_admitted_first():
+    gate = PriorityGate(slots=1, timeout=5)
+    order = []
+
+    def request(name, priority):
+        with gate.admit(priority):
+            order.append(name)
+
+    with gate.admit():
+        threads = []
+        for waiting, (name, priority) in enumerate([('rutina-1', PRIORITY_ROUTINE), ('rutina-2', PRIORITY_ROUTINE),
+                                                    ('critica', PRIORITY_CRITICAL)], start=1):
+            thread = threading.Thread(target=request, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            wait_for(lambda waiting=waiting: gate.status()['waiting'] == waiting)
+
+    for thread in threads:
+        thread.join()
+    assert order == ['critica', 'rutina-1', 'rutina-2']
+    assert gate.status()['admitted'] == {'critical': 1, 'routine': 3}
+
+
+def test_gate_timeout_leaves_queue_clean():
+    gate = PriorityGate(slots=1, timeout=0.05)
+    with gate.admit():
+        with pytest.raises(GateTimeout):
+            with gate.admit():
+                pass
+    status = gate.status()
+    assert (status['timeouts'], status['waiting'], status['active']) == (1, 0, 0)
+
+
+def test_critical_fast_path_endpoint():
+    client = backend_medical_api.create_app().test_client()
+    body = client.post('/api/medical-interpret?critical_fast_path=1', json={'html_content': CRITICAL_REPORT}).get_json()
+
+    assert body['critical_fast_path'] is True
+    assert body['critical_alert']['findings'][0]['test_code'] == 'GLUCOSA'
+
+    full = client.post('/api/medical-interpret', json={'html_content': CRITICAL_REPORT}).get_json()
+    assert full['data']['critical_alert']['level'] == 'Crítica'
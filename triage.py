@@ -0,0 +1,150 @@
+"""
+Triage de resultados críticos
+Laboratorio Esperanza - Sistema de Gestión de Laboratorio
+
+prescreen() revisa los valores recién extraídos contra los umbrales críticos
+de la base de conocimiento antes de ejecutar el resto del pipeline, así una
+troponina o una glucosa crítica se detecta al inicio y no al final.
+
+PriorityGate limita cuántas peticiones ejecutan el pipeline a la vez; cuando
+está saturado, las que esperan se admiten por prioridad (críticas primero) y
+después por orden de llegada.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+PRIORITY_GATE_SLOTS = int(os.getenv('PRIORITY_GATE_SLOTS', '0'))
+PRIORITY_GATE_TIMEOUT_S = float(os.getenv('PRIORITY_GATE_TIMEOUT_S', '30'))
+
+# Menor número = mayor prioridad
+PRIORITY_CRITICAL = 0
+PRIORITY_ROUTINE = 1
+PRIORITY_NAMES = {PRIORITY_CRITICAL: 'critical', PRIORITY_ROUTINE: 'routine'}
+
+CRITICAL_MESSAGE = 'Valores críticos detectados: requieren atención médica inmediata.'
+
+
+def prescreen(range_table, codes, values, names=None, units=None):
+    """
+    Alerta con los valores fuera de los umbrales críticos, o None.
+
+    codes y values son secuencias paralelas (códigos de examen de range_table);
+    names y units, si se dan, se copian en cada hallazgo.
+    """
+    if not codes:
+        return None
+
+    indices = range_table.lookup(codes)
+    values = np.asarray(values, dtype=np.float64)
+    low = values < range_table.critical_low[indices]
+    high = values > range_table.critical_high[indices]
+    critical = np.flatnonzero((low | high) & (indices >= 0))
+    if not critical.size:
+        return None
+
+    findings = []
+    for position in critical.tolist():
+        index = indices[position]
+        findings.append({
+            'test_name': names[position] if names is not None else codes[position],
+            'test_code': codes[position],
+            'value': float(values[position]),
+            'unit': units[position] if units is not None else None,
+            'direction': 'bajo' if low[position] else 'elevado',
+            'critical_low': float(range_table.critical_low[index]),
+            'critical_high': float(range_table.critical_high[index])
+        })
+
+    return {'level': 'Crítica', 'message': CRITICAL_MESSAGE, 'findings': findings}
+
+
+class GateTimeout(Exception):
+    """La petición esperó más que el tiempo máximo de admisión"""
+
+
+class PriorityGate:
+    """Control de admisión con cola de prioridad (heapq + Condition)"""
+
+    def __init__(self, slots=PRIORITY_GATE_SLOTS, timeout=PRIORITY_GATE_TIMEOUT_S):
+        self.slots = slots
+        self.timeout = timeout
+        self._active = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self.admitted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.queued = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.timeouts = 0
+        self.max_queue = 0
+
+    @property
+    def enabled(self):
+        return self.slots > 0
+
+    @contextmanager
+    def admit(self, priority=PRIORITY_ROUTINE):
+        """`with gate.admit(prioridad):` ejecuta el bloque cuando hay un hueco libre"""
+        if not self.enabled:
+            yield
+            return
+
+        self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _acquire(self, priority):
+        name = PRIORITY_NAMES.get(priority, 'routine')
+        with self._condition:
+            if self._active < self.slots and not self._waiting:
+                self._active += 1
+                self.admitted[name] += 1
+                return
+
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            self.queued[name] += 1
+            self.max_queue = max(self.max_queue, len(self._waiting))
+
+            deadline = time.monotonic() + self.timeout
+            while not (self._active < self.slots and self._waiting[0] is entry):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self.timeouts += 1
+                    # El siguiente en la cola puede ser ahora el primero
+                    self._condition.notify_all()
+                    raise GateTimeout(f'Sin capacidad tras {self.timeout:.0f}s en cola')
+                self._condition.wait(remaining)
+
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self.admitted[name] += 1
+            self._condition.notify_all()
+
+    def _release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def status(self):
+        with self._condition:
+            return {
+                'enabled': self.enabled,
+                'slots': self.slots,
+                'active': self._active,
+                'waiting': len(self._waiting),
+                'max_queue': self.max_queue,
+                'admitted': dict(self.admitted),
+                'queued': dict(self.queued),
+                'timeouts': self.timeouts
+            }